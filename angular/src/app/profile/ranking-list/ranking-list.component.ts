@@ -19,16 +19,34 @@ import 'rxjs/Rx' ;
  * A component to display a ranking of all users
  */
 export class RankingListComponent implements OnInit {
-  profiles: {};
+  profiles = [];
+  own: any;
+  next: string;
   loading = true
+  pageSize = 50
 
   constructor(private user: UserService, private server: ServerService) {
   }
 
   ngOnInit() {
-    this.server.get('ranking', true, false)
+    this.loadPage()
+    this.server.get('ranking/me', true, false)
       .then(data => {
-        this.profiles = data;
+        this.own = data;
+      })
+      .catch(err => {})
+  }
+
+  // loads the next page of the ranking, starting after the last loaded user
+  loadPage() {
+    let url = 'ranking?limit=' + this.pageSize
+    if (this.next) {
+      url += '&after=' + this.next
+    }
+    this.server.get(url, true, false)
+      .then((data: any) => {
+        this.profiles = this.profiles.concat(data.results);
+        this.next = data.next;
         this.loading = false;
       })
       .catch(err => {
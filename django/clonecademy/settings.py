@@ -88,12 +88,41 @@ DATABASES = {
     }
 }
 
+# Caches
+# The course content cache holds the serialized content of the courses. The
+# LRUCache is local to each process, to share the content between all uWSGI
+# workers use a shared backend like the FileBasedCache or memcached instead.
+# The roles cache holds the group names of the users for the permission
+# checks. Its short timeout bounds how long other processes see old roles.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'course_content': {
+        'BACKEND': 'learning_base.cache.LRUCache',
+        'LOCATION': 'course_content',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200,
+        },
+    },
+    'roles': {
+        'BACKEND': 'learning_base.cache.LRUCache',
+        'LOCATION': 'roles',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'learning_base.tokens.ClaimsAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
@@ -101,9 +130,14 @@ REST_FRAMEWORK = {
 }
 
 JWT_AUTH = {
-    'JWT_EXPIRATION_DELTA': datetime.timedelta(days=7)
+    'JWT_EXPIRATION_DELTA': datetime.timedelta(days=7),
+    'JWT_PAYLOAD_HANDLER': 'learning_base.tokens.jwt_payload_handler',
 }
 
+# path of the journal the tries are appended to instead of inserting them
+# right away, flushed by the flush_tries command (see learning_base.try_journal)
+TRY_JOURNAL = None
+
 FRONT_END_HOSTNAME = 'localhost:3000/'
 BACK_END_HOSTNAME = 'localhost:3000/'
 PROFILE_PATH = 'user/'
@@ -17,7 +17,6 @@ from django.conf.urls import include, url
 from django.contrib import admin
 
 from rest_framework import routers
-from rest_framework.authtoken import views as auth_views
 
 from learning_base import views
 
@@ -30,7 +29,7 @@ router = routers.DefaultRouter()
 urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^admin/', admin.site.urls),
-    url(r'^api-auth', auth_views.obtain_auth_token),
+    url(r'^api-auth', views.ObtainTokenView.as_view()),
 
     url(r'^courses/$', views.MultiCourseView.as_view()),
     url(r'^courses/(?P<course_id>[0-9]+)/?$', views.CourseView.as_view()),
@@ -38,6 +37,17 @@ urlpatterns = [
         views.ToggleCourseVisibilityView.as_view()),
     url(r'^courses/(?P<course_id>[0-9]+)?/edit$',
         views.CourseEditView.as_view()),
+    url(r'^courses/(?P<course_id>[0-9]+)/edit/modules/(?P<object_id>[0-9]+)$',
+        views.ModuleEditView.as_view()),
+    url(r'^courses/(?P<course_id>[0-9]+)/edit/questions/'
+        r'(?P<object_id>[0-9]+)$',
+        views.QuestionEditView.as_view()),
+    url(r'^courses/(?P<course_id>[0-9]+)/edit/answers/(?P<object_id>[0-9]+)$',
+        views.AnswerEditView.as_view()),
+    url(r'^courses/(?P<course_id>[0-9]+)/edit/order$',
+        views.CourseOrderView.as_view()),
+    url(r'^courses/(?P<course_id>[0-9]+)/submissions/?$',
+        views.SubmissionView.as_view()),
     url(r'^courses/(?P<course_id>[0-9]+)/(?P<module_id>[0-9]+)/?$',
         views.ModuleView.as_view()),
     url(
@@ -62,8 +72,21 @@ urlpatterns = [
     url(r'^statistics$', views.StatisticsView.as_view()),
     url(r'^user/mod_request$', views.RequestView.as_view()),
     url(r'^user/current$', views.UserView.as_view()),
+    url(r'^avatars/(?P<digest>[0-9a-f]{64})$', views.AvatarView.as_view(),
+        name='avatar'),
+    url(r'^assets/(?P<digest>[0-9a-f]{64})$', views.AssetView.as_view(),
+        name='asset'),
+    url(r'^avatars/(?P<digest>[0-9a-f]{64})/thumbnail$',
+        views.AvatarView.as_view(thumbnail=True), name='avatar-thumbnail'),
+    url(r'^assets/(?P<digest>[0-9a-f]{64})/thumbnail$',
+        views.AssetView.as_view(thumbnail=True), name='asset-thumbnail'),
 
     url(r'^ranking$', views.RankingView.as_view()),
+    url(r'^ranking/me$', views.OwnRankingView.as_view()),
+    url(r'^ranking/course/(?P<course_id>[0-9]+)/?$',
+        views.CourseRankingView.as_view()),
+    url(r'^ranking/category/(?P<category_id>[0-9]+)/?$',
+        views.CategoryRankingView.as_view()),
     url(r'^pw_reset/?$', views.PwResetView.as_view()),
 
     url(r'^register/$', views.UserRegisterView.as_view())
@@ -0,0 +1,93 @@
+"""
+module deciding which questions of a course a user may access. A question
+may only be opened if all questions before it are solved. The position of the
+first unsolved question (the frontier) is stored in the CourseProgress of the
+user, so the check needs a single lookup of the progress. The frontier is
+recalculated lazily whenever the course changed since it was calculated.
+"""
+from . import content_cache
+from .models import CourseProgress
+
+
+def get_structure(course):
+    """
+    :param course: the course
+    :return: the question ids and titles of the course from the content cache
+    """
+    return content_cache.get_course_content(course)['structure']
+
+
+def get_progress(user, course):
+    """
+    Returns the progress of a user in a course with an up to date frontier
+    :param user: the user
+    :param course: the course
+    :return: the CourseProgress object
+    """
+    progress = CourseProgress.get_for(user, course)
+    # without solved questions the frontier is always the first question
+    if progress.solved and progress.course_version != course.version:
+        progress.update_frontier(get_structure(course), course.version)
+        # the solved questions are not written, a concurrent request may
+        # have changed them
+        progress.save(update_fields=[
+            'frontier_module', 'frontier_question', 'course_version'])
+    return progress
+
+
+def change_progress(user, course, change):
+    """
+    Changes the progress of a user in a course. The progress is only written
+    if no other request changed the solved questions since it was read,
+    otherwise it is read again and the change is repeated. So concurrent
+    submissions neither lose solved questions nor count a question twice.
+    :param user: the user
+    :param course: the course
+    :param change: a function changing the progress passed to it
+    :return: a tuple of the saved progress and the result of the change
+    """
+    while True:
+        progress = get_progress(user, course)
+        solved, solved_quiz = progress.solved, progress.solved_quiz
+        result = change(progress)
+        if ((progress.solved, progress.solved_quiz) == (solved, solved_quiz)
+                or progress.save_if_unchanged(solved, solved_quiz)):
+            return progress, result
+
+
+def add_solved_question(progress, course, question):
+    """
+    Marks a question as solved and advances the frontier without saving the
+    progress (see change_progress)
+    :param progress: the progress of the user in the course
+    :param course: the course
+    :param question: the solved question
+    :return: True iff the question was not solved before
+    """
+    if not progress.add_question(question, save=False):
+        return False
+    progress.update_frontier(get_structure(course), course.version)
+    return True
+
+
+def can_access_question(user, course, module_index, question_index):
+    """
+    Checks whether a user may open a question
+    :param user: the user
+    :param course: the course
+    :param module_index: the position of the module in the course
+    :param question_index: the position of the question in the module
+    :return: True iff all questions before the given one are solved
+    """
+    return get_progress(user, course).can_access(module_index, question_index)
+
+
+def has_completed(progress, course):
+    """
+    Checks whether a user solved all questions of a course
+    :param progress: the progress of the user in the course
+    :param course: the course
+    :return: True iff all questions of the course are solved
+    """
+    return (progress.solved != ''
+            and progress.frontier_module >= len(get_structure(course)))
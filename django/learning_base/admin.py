@@ -9,6 +9,10 @@ from .info.models import *
 admin.site.register(Profile)
 admin.site.register(LearningGroup)
 admin.site.register(Try)
+admin.site.register(CourseProgress)
+admin.site.register(CourseScore)
+admin.site.register(CategoryScore)
+admin.site.register(DailyTryCount)
 admin.site.register(Module)
 admin.site.register(CourseCategory)
 admin.site.register(Course)
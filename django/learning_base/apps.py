@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class LearningBaseConfig(AppConfig):
     name = 'learning_base'
+
+    def ready(self):
+        # registers the signal receivers of the caches
+        from . import content_cache, roles  # noqa: F401
@@ -0,0 +1,93 @@
+"""
+A process local cache backend for the django cache framework. In contrast to
+the LocMemCache it evicts the least recently used entries once the size
+limit (the MAX_ENTRIES option) is reached.
+"""
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# the caches are shared between all threads of a process
+_caches = {}
+_locks = {}
+
+
+class LRUCache(BaseCache):
+    """
+    A size capped in-process cache with least recently used eviction
+    """
+
+    def __init__(self, name, params):
+        super(LRUCache, self).__init__(params)
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._lock = _locks.setdefault(name, Lock())
+
+    def _get_entry(self, key):
+        """
+        returns the pickled value of a key and marks it as recently used
+        (needs to be called while holding the lock)
+        :return: the pickled value or None if the key is missing or expired
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expiry, pickled = entry
+        if expiry is not None and expiry <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return pickled
+
+    def _set_entry(self, key, value, timeout):
+        """
+        stores a value and evicts the least recently used entries if the
+        cache is full (needs to be called while holding the lock)
+        """
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._cache[key] = (self.get_backend_timeout(timeout), pickled)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get_entry(key) is not None:
+                return False
+            self._set_entry(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            pickled = self._get_entry(key)
+        if pickled is None:
+            return default
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set_entry(key, value, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get_entry(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
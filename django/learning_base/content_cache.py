@@ -0,0 +1,203 @@
+"""
+module caching the content of courses. The user independent serialization of
+a course (modules, learning texts, questions and answers) is stored under the
+version of the course, which is increased whenever the course is changed. The
+progress of the user is added to the cached content for every response.
+
+The answer keys of the multiple choice questions (the ids of the correct
+answers) are cached the same way, so grading an answer doesn't read the
+database.
+
+Every save and delete of a course, its category, modules, questions, answers
+and quiz questions that doesn't go through the course save (e.g. in the
+admin) increases the version of the course as well.
+
+The backend is configured as the 'course_content' cache in the settings.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .course_tree import get_progress
+from .models import Course, CourseCategory, Module, Question, QuizQuestion, \
+    bump_course_version
+from .multiple_choice.models import MultipleChoiceAnswer
+
+CACHE_NAME = 'course_content'
+
+# whether a course is saved as a whole by the current thread
+_saving = threading.local()
+
+
+def get_key(course):
+    """
+    :param course: the course
+    :return: the cache key for the current version of the course
+    """
+    return 'course:{}:{}'.format(course.id, course.version)
+
+
+def get_course_content(course):
+    """
+    Returns the user independent content of a course. The content is a
+    dictionary containing the serialized course ('course'), the question ids
+    and titles per module ('structure'), the serialized answers of every
+    question ('answers') and whether the course has a quiz ('quiz').
+    :param course: the course
+    :return: the content of the course
+    """
+    cache = caches[CACHE_NAME]
+    key = get_key(course)
+    content = cache.get(key)
+    if content is None:
+        from .serializers import CourseSerializer
+        content = CourseSerializer().get_content(course)
+        cache.set(key, content)
+    return content
+
+
+def get_answer_keys_key(course):
+    """
+    :param course: the course
+    :return: the cache key for the answer keys of the current version of the
+             course
+    """
+    return 'answer_keys:{}:{}'.format(course.id, course.version)
+
+
+def get_answer_keys(course):
+    """
+    Returns the answer keys of all multiple choice questions of a course,
+    loaded with a single query
+    :param course: the course
+    :return: a dictionary mapping the question ids to the frozenset of the ids
+             of their correct answers, questions without correct answers are
+             missing
+    """
+    cache = caches[CACHE_NAME]
+    key = get_answer_keys_key(course)
+    answer_keys = cache.get(key)
+    if answer_keys is None:
+        correct = {}
+        for question_id, answer_id in MultipleChoiceAnswer.objects.filter(
+                question__module__course=course,
+                is_correct=True).values_list('question_id', 'id'):
+            correct.setdefault(question_id, set()).add(answer_id)
+        answer_keys = {question_id: frozenset(answer_ids)
+                       for question_id, answer_ids in correct.items()}
+        cache.set(key, answer_keys)
+    return answer_keys
+
+
+def get_answer_key(course, question_id):
+    """
+    :param course: the course
+    :param question_id: the id of a multiple choice question of the course
+    :return: the frozenset of the ids of the correct answers of the question
+    """
+    return get_answer_keys(course).get(question_id, frozenset())
+
+
+def discard(course):
+    """
+    Removes the cached content of the current version of a course
+    :param course: the course
+    """
+    caches[CACHE_NAME].delete_many(
+        [get_key(course), get_answer_keys_key(course)])
+
+
+def add_progress(content, solved):
+    """
+    Completes the cached content of a course with the progress of a user
+    :param content: the content as returned by get_course_content
+    :param solved: the set of ids of the questions solved by the user
+    :return: the serialized course
+    """
+    value = content['course']
+    progress = get_progress(content['structure'], solved)
+    num_answered = 0
+    count_question = 0
+    count_module = 0
+    for module, structure in zip(value['modules'], content['structure']):
+        count_module += 1
+        for question, (question_id, _) in zip(module['questions'],
+                                              structure):
+            count_question += 1
+            question['progress'] = progress
+            question['solved'] = question_id in solved
+            if question['solved']:
+                num_answered += 1
+            else:
+                value['next_question'] = count_question
+                value['current_module'] = count_module
+    value['num_answered'] = num_answered
+    return value
+
+
+def get_question(content, module_index, question_index, solved):
+    """
+    Returns a single question of the cached content completed with the
+    progress of a user
+    :param content: the content as returned by get_course_content
+    :param module_index: the position of the module in the course
+    :param question_index: the position of the question in the module
+    :param solved: the set of ids of the questions solved by the user
+    :return: the serialized question
+    """
+    question = content['course']['modules'][module_index]['questions'][
+        question_index]
+    question_id = content['structure'][module_index][question_index][0]
+    question['progress'] = get_progress(content['structure'], solved)
+    question['solved'] = question_id in solved
+    return question
+
+
+def get_answers(content, module_index, question_index):
+    """
+    :param content: the content as returned by get_course_content
+    :param module_index: the position of the module in the course
+    :param question_index: the position of the question in the module
+    :return: the serialized answers of a question or None if the question
+             type has no answers
+    """
+    return content['answers'][module_index][question_index]
+
+
+@contextmanager
+def saving_course():
+    """
+    Suppresses the version increases of the single changes while a course is
+    saved as a whole, the save increases the version once
+    """
+    _saving.depth = getattr(_saving, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _saving.depth -= 1
+
+
+@receiver([post_save, post_delete])
+def discard_changed_content(sender, instance, raw=False, **kwargs):
+    """
+    Increases the version of the changed course, of the courses of a changed
+    category or of the course of a changed module, question, multiple choice
+    answer or quiz question
+    """
+    if raw or getattr(_saving, 'depth', 0):
+        return
+    if isinstance(instance, Course):
+        instance.bump_version()
+    elif isinstance(instance, CourseCategory):
+        bump_course_version(category_id=instance.id)
+    elif isinstance(instance, QuizQuestion):
+        bump_course_version(id=instance.course_id)
+    elif isinstance(instance, Module):
+        bump_course_version(id=instance.course_id)
+    elif isinstance(instance, Question):
+        bump_course_version(module__id=instance.module_id)
+    elif isinstance(instance, MultipleChoiceAnswer):
+        bump_course_version(module__question__id=instance.question_id)
@@ -0,0 +1,652 @@
+"""
+module saving a course together with its modules, questions, answers and
+quiz. The incoming tree is compared with the stored course: removed rows are
+deleted with one statement per table, changed rows are updated with only the
+changed fields, the order and position of the modules and questions are
+written with one statement each and new rows are inserted in bulk where the
+model allows it. The whole course is saved in one transaction, so an invalid
+part of the tree leaves the stored course unchanged.
+"""
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, When, Value
+from rest_framework.exceptions import ParseError
+
+from . import content_cache
+from .info.models import InformationText, InformationYoutube
+from .models import Course, CourseCategory, Module, Question, QuizQuestion, \
+    QuizAnswer, delete_cascading
+from .multiple_choice.models import MultipleChoiceQuestion, \
+    MultipleChoiceAnswer
+
+# the fields that are set from the incoming data
+COURSE_FIELDS = ('name', 'difficulty', 'language', 'is_visible',
+                 'description', 'category_id', 'responsible_mod_id')
+MODULE_FIELDS = ('name', 'learning_text', 'description')
+QUESTION_FIELDS = ('title', 'text', 'question', 'feedback')
+MULTIPLE_CHOICE_ANSWER_FIELDS = ('text', 'is_correct', 'img')
+QUIZ_FIELDS = ('question', 'image')
+QUIZ_ANSWER_FIELDS = ('text', 'img', 'correct')
+
+# the model and the additional fields of every question type
+QUESTION_TYPES = {
+    'multiple_choice': (MultipleChoiceQuestion,
+                        ('question_image', 'feedback_image')),
+    'info_text': (InformationText, ('text_field', 'image')),
+    'info_text_youtube': (InformationYoutube, ('text_field', 'url')),
+}
+
+MIN_QUIZ_QUESTIONS = 5
+MAX_QUIZ_QUESTIONS = 20
+QUIZ_ANSWERS = 4
+
+
+def _assign(instance, data, fields):
+    """
+    Sets the fields of an instance to the values of the data
+    :param instance: the model instance
+    :param data: the incoming data, missing fields are not changed
+    :param fields: the names of the fields to be set
+    :return: the names of the changed fields
+    """
+    changed = []
+    for name in fields:
+        if name in data and getattr(instance, name) != data[name]:
+            setattr(instance, name, data[name])
+            changed.append(name)
+    return changed
+
+
+def _update(instance, changed):
+    """
+    Writes the changed fields of a stored instance with a single statement
+    :param instance: the model instance
+    :param changed: the names of the changed fields
+    """
+    if not changed:
+        return
+    values = {}
+    for name in changed:
+        field = instance._meta.get_field(name)
+        # pre_save stores the images of the asset fields
+        values[field.name] = field.pre_save(instance, False)
+    type(instance)._base_manager.filter(id=instance.id).update(**values)
+
+
+def _bulk_update(queryset, name, values):
+    """
+    Writes one field of several rows with a single statement
+    :param queryset: the queryset of the rows
+    :param name: the name of the field
+    :param values: a dictionary mapping the ids to the new values
+    """
+    if not values:
+        return
+    queryset.filter(id__in=values).update(**{name: Case(
+        *[When(id=pk, then=Value(value)) for pk, value in values.items()],
+        output_field=queryset.model._meta.get_field(name))})
+
+
+def _match(stored, rows, accept=None):
+    """
+    Finds the stored instance of every incoming row by its id
+    :param stored: a dictionary mapping the ids to the stored instances
+    :param rows: the incoming data
+    :param accept: an optional test whether a stored instance may be updated
+                   with a row, otherwise the row is saved as new instance
+    :return: a list of the stored instance or None for every row
+    """
+    matched = []
+    claimed = set()
+    for row in rows:
+        instance = stored.get(row.get('id'))
+        if (instance is None or instance.id in claimed
+                or (accept is not None and not accept(instance, row))):
+            instance = None
+        else:
+            claimed.add(instance.id)
+        matched.append(instance)
+    return matched
+
+
+def _delete_missing(queryset, stored, matched):
+    """
+    Deletes the stored instances without a matching row
+    :param queryset: the queryset of the stored instances
+    :param stored: a dictionary mapping the ids to the stored instances
+    :param matched: the matched instances as returned by _match
+    """
+    missing = set(stored) - set(
+        instance.id for instance in matched if instance is not None)
+    if missing:
+        delete_cascading(queryset.filter(id__in=missing))
+
+
+def _move_orders(queryset, parent, instances, rows, orders):
+    """
+    Calculates the positions of the rows and the changed orders and positions
+    of the stored siblings. The orders are unique per parent, so the stored
+    siblings whose order or parent changes are moved to temporary orders
+    until the final orders are written.
+    :param queryset: the queryset of all stored siblings
+    :param parent: the name of the foreign key to the parent
+    :param instances: the matched instances, None for new rows
+    :param rows: the incoming data
+    :param orders: a dictionary mapping the parent ids to the orders of the
+                   children, the positions are the indices in these lists
+    :return: the list of the position of every row and dictionaries mapping
+             the ids of the stored siblings to their changed orders and
+             positions
+    """
+    positions = []
+    new_orders = {}
+    new_positions = {}
+    for instance, row in zip(instances, rows):
+        position = orders[row['parent']].index(row['order'])
+        positions.append(position)
+        if instance is None:
+            continue
+        if (instance.order != row['order']
+                or getattr(instance, parent) != row['parent']):
+            new_orders[instance.id] = row['order']
+        if instance.position != position:
+            new_positions[instance.id] = position
+    _free_orders(queryset, new_orders)
+    return positions, new_orders, new_positions
+
+
+def _free_orders(queryset, new_orders):
+    """
+    Moves the rows whose order changes to temporary orders, so writing the
+    new orders does not violate the unique orders of the siblings
+    :param queryset: the queryset of all siblings
+    :param new_orders: a dictionary mapping the ids to the new orders
+    """
+    if not new_orders:
+        return
+    # the temporary orders are larger than all old and new orders
+    offset = 1 + max(list(queryset.values_list('order', flat=True))
+                     + list(new_orders.values()))
+    _bulk_update(queryset, 'order', {
+        pk: offset + i for i, pk in enumerate(new_orders)})
+
+
+def _get_orders(rows, parent, error):
+    """
+    Collects the orders of the rows per parent
+    :param rows: the incoming data, every row has an order and a parent
+    :param parent: the name of the parent in the error message
+    :param error: the error message if the orders of a parent are not unique
+    :return: a dictionary mapping the parents to their sorted orders
+    :raise: ParseError if an order is missing or not unique
+    """
+    orders = {}
+    for row in rows:
+        try:
+            row['order'] = int(row['order'])
+        except (KeyError, TypeError, ValueError):
+            raise ParseError(detail='the order of every {} needs to be an '
+                             'integer'.format(parent), code=None)
+        orders.setdefault(row['parent'], []).append(row['order'])
+    for values in orders.values():
+        if len(set(values)) != len(values):
+            raise ParseError(detail=error, code=None)
+        values.sort()
+    return orders
+
+
+def save_course(data):
+    """
+    Saves a course with all modules, questions and the quiz in one
+    transaction. Every part of the tree is validated by its serializer and
+    only the validated values are written.
+    :param data: the course data as posted by the course editor
+    :return: the saved course
+    :raise: ParseError if the course data is invalid, nothing is saved then
+    """
+    modules = data.get('modules')
+    if not modules:
+        raise ParseError(detail='Course needs to have at least one module',
+                         code=None)
+    with transaction.atomic(), content_cache.saving_course():
+        course = _save_course(data)
+        _save_quiz(course, data.get('quiz') or [])
+        _save_modules(course, modules)
+        # the cached content of the course is outdated now
+        course.bump_version()
+    return course
+
+
+def _save_course(data):
+    """
+    Creates or updates the course row
+    :return: the saved course
+    """
+    from .serializers import CourseSerializer
+    values = _validated(CourseSerializer(data=data), COURSE_FIELDS,
+                        'Error in course serialization')
+    if 'category' in data:
+        category = CourseCategory.objects.filter(
+            name=data['category']).first()
+        if category is None:
+            raise ParseError(detail='{} is not a valid category'.format(
+                data['category']), code=None)
+        values['category_id'] = category.id
+    if 'responsible_mod' in data:
+        responsible_mod = data['responsible_mod']
+        values['responsible_mod_id'] = (responsible_mod.id if isinstance(
+            responsible_mod, User) else responsible_mod)
+
+    course = None
+    if data.get('id') is not None:
+        course = Course.objects.filter(id=data['id']).first()
+    if course is None:
+        course = Course(id=data.get('id'))
+        _assign(course, values, COURSE_FIELDS)
+        course.save()
+    else:
+        _update(course, _assign(course, values, COURSE_FIELDS))
+    return course
+
+
+def _save_quiz(course, quiz_data):
+    """
+    Saves the quiz questions and their answers. A quiz needs at least
+    MIN_QUIZ_QUESTIONS questions, otherwise the quiz of the course is
+    removed.
+    :raise: ParseError if the quiz has more than MAX_QUIZ_QUESTIONS questions
+    """
+    from .serializers import QuizSerializer, QuizAnswerSerializer
+
+    if len(quiz_data) > MAX_QUIZ_QUESTIONS:
+        raise ParseError(detail='A quiz can have at most {} questions'.format(
+            MAX_QUIZ_QUESTIONS), code=None)
+    if len(quiz_data) < MIN_QUIZ_QUESTIONS:
+        quiz = QuizQuestion.objects.filter(course=course)
+        if quiz.exists():
+            delete_cascading(quiz)
+        return
+
+    rows = []
+    for quiz in quiz_data:
+        quiz_serializer = QuizSerializer(data=quiz)
+        if not quiz_serializer.is_valid():
+            raise ParseError(detail=str(quiz_serializer.errors), code=None)
+        if 'answers' not in quiz:
+            raise ParseError(detail='The quiz has no answers', code=None)
+        if len(quiz['answers']) != QUIZ_ANSWERS:
+            raise ParseError(detail='Quiz must have 4 answers', code=None)
+        answers = []
+        for answer in quiz['answers']:
+            answer_serializer = QuizAnswerSerializer(data=answer)
+            if not answer_serializer.is_valid():
+                raise ParseError(detail=str(answer_serializer.errors),
+                                 code=None)
+            answers.append(dict(answer, **_validated(
+                answer_serializer, QUIZ_ANSWER_FIELDS,
+                'Error in quiz answer serialization')))
+        if not any(answer.get('correct') for answer in answers):
+            raise ParseError(detail='This quiz is not solvable', code=None)
+        rows.append(dict(quiz, answers=answers, **_validated(
+            quiz_serializer, QUIZ_FIELDS, 'Error in quiz serialization')))
+
+    queryset = QuizQuestion.objects.filter(course=course)
+    stored = {quiz.id: quiz for quiz in queryset}
+    matched = _match(stored, rows)
+    _delete_missing(queryset, stored, matched)
+
+    quizzes = []
+    for quiz, row in zip(matched, rows):
+        if quiz is None:
+            quiz = QuizQuestion(course=course)
+            _assign(quiz, row, QUIZ_FIELDS)
+            # the answers need the id of the quiz question
+            quiz.save()
+        else:
+            _update(quiz, _assign(quiz, row, QUIZ_FIELDS))
+        quizzes.append(quiz)
+
+    _save_answers(QuizAnswer, 'quiz', QUIZ_ANSWER_FIELDS,
+                  QuizAnswer.objects.filter(quiz__course=course),
+                  quizzes, [row['answers'] for row in rows])
+
+
+def _save_answers(model, parent, fields, queryset, parents, answer_data):
+    """
+    Saves the answers of several questions. Stored answers are only updated
+    with the data of an answer of the same question.
+    :param model: the answer model
+    :param parent: the name of the foreign key to the question
+    :param fields: the names of the fields set from the data
+    :param queryset: the queryset of all stored answers of the questions
+    :param parents: the saved questions
+    :param answer_data: the list of answer data of every question
+    """
+    parent_id = parent + '_id'
+    rows = []
+    for question, answers in zip(parents, answer_data):
+        for answer in answers:
+            rows.append(dict(answer, **{parent_id: question.id}))
+    stored = {answer.id: answer for answer in queryset}
+    matched = _match(
+        stored, rows,
+        lambda answer, row: getattr(answer, parent_id) == row[parent_id])
+    _delete_missing(queryset, stored, matched)
+
+    new = []
+    for answer, row in zip(matched, rows):
+        if answer is None:
+            answer = model(**{parent_id: row[parent_id]})
+            _assign(answer, row, fields)
+            new.append(answer)
+        else:
+            _update(answer, _assign(answer, row, fields))
+    model.objects.bulk_create(new)
+
+
+def _save_modules(course, module_data):
+    """
+    Saves the modules of a course and their questions
+    """
+    from .serializers import ModuleSerializer
+
+    rows = []
+    for module in module_data:
+        if not module.get('questions'):
+            raise ParseError(detail='empty module is not allowed', code=None)
+        rows.append(dict(module, parent=course.id, **_validated(
+            ModuleSerializer(data=module), MODULE_FIELDS,
+            'Error in module serialization')))
+    orders = _get_orders(rows, 'module',
+                         'the modules need to have different orders')
+
+    queryset = Module.objects.filter(course=course)
+    stored = {module.id: module for module in queryset}
+    matched = _match(stored, rows)
+    # deleting the modules deletes their questions as well
+    _delete_missing(queryset, stored, matched)
+    positions, new_orders, new_positions = _move_orders(
+        queryset, 'course_id', matched, rows, orders)
+
+    modules = []
+    new = []
+    for module, row, position in zip(matched, rows, positions):
+        if module is None:
+            module = Module(course=course, order=row['order'],
+                            position=position)
+            _assign(module, row, MODULE_FIELDS)
+            new.append(module)
+        else:
+            _update(module, _assign(module, row, MODULE_FIELDS))
+        modules.append(module)
+    _bulk_update(queryset, 'order', new_orders)
+    _bulk_update(queryset, 'position', new_positions)
+
+    Module.objects.bulk_create(new)
+    # the order of a module is unique within the course
+    ids = dict(Module.objects.filter(course=course).values_list(
+        'order', 'id'))
+    for module in new:
+        module.id = ids[module.order]
+
+    _save_questions(course, modules, [row['questions'] for row in rows])
+
+
+def _save_questions(course, modules, question_data):
+    """
+    Saves the questions of the modules of a course and the answers of the
+    multiple choice questions. Questions can be moved between the modules of
+    the course, a question whose type changed is replaced.
+    :param course: the course
+    :param modules: the saved modules
+    :param question_data: the list of question data of every module
+    """
+    from .serializers import QuestionSerializer
+    from .multiple_choice.serializer import \
+        MultipleChoiceAnswerEditSerializer
+
+    error = 'Error in question serialization'
+    rows = []
+    for module, questions in zip(modules, question_data):
+        for question in questions:
+            values = _validated(QuestionSerializer(data=question),
+                                QUESTION_FIELDS, error)
+            if question.get('type') not in QUESTION_TYPES:
+                raise ParseError(
+                    detail='{} is not a valid question type'.format(
+                        question.get('type')), code=None)
+            model, fields = QUESTION_TYPES[question['type']]
+            # the fields of the type are optional
+            values.update(_validated(
+                model.get_edit_serializer()(data=question, partial=True),
+                fields, error))
+            row = dict(question, parent=module.id, module_id=module.id,
+                       **values)
+            if question['type'] == 'multiple_choice':
+                answers = []
+                for answer in question.get('answers') or []:
+                    answer_serializer = MultipleChoiceAnswerEditSerializer(
+                        data=answer)
+                    if not answer_serializer.is_valid():
+                        raise ParseError(detail=answer_serializer.errors,
+                                         code=None)
+                    answers.append(dict(answer, **_validated(
+                        answer_serializer, MULTIPLE_CHOICE_ANSWER_FIELDS,
+                        'Error in answer serialization')))
+                if not any(answer.get('is_correct') for answer in answers):
+                    raise ParseError(
+                        detail="Unsolvable question {}".format(
+                            question.get('title')), code=None)
+                row['answers'] = answers
+            if question['type'] == 'info_text_youtube' and 'url' in row:
+                row['url'] = _get_video_id(row['url'])
+            rows.append(row)
+    orders = _get_orders(rows, 'question',
+                         'the questions of a module need to have different '
+                         'orders')
+
+    siblings = Question.objects.non_polymorphic().filter(
+        module__course=course)
+    stored = {question.id: question for question in
+              Question.objects.filter(module__course=course)}
+    matched = _match(
+        stored, rows, lambda question, row: isinstance(
+            question, QUESTION_TYPES[row['type']][0]))
+    _delete_missing(siblings, stored, matched)
+    positions, new_orders, new_positions = _move_orders(
+        siblings, 'module_id', matched, rows, orders)
+
+    questions = []
+    for question, row, position in zip(matched, rows, positions):
+        model, fields = QUESTION_TYPES[row['type']]
+        if question is None:
+            question = model(module_id=row['module_id'], order=row['order'],
+                             position=position)
+            _assign(question, row, QUESTION_FIELDS + fields)
+            # multi table models can't be inserted in bulk
+            question.save(update_position=False)
+        else:
+            _update(question, _assign(
+                question, row, QUESTION_FIELDS + ('module_id',) + fields))
+        questions.append(question)
+    _bulk_update(siblings, 'order', new_orders)
+    _bulk_update(siblings, 'position', new_positions)
+
+    multiple_choice = [(question, row['answers'])
+                       for question, row in zip(questions, rows)
+                       if row['type'] == 'multiple_choice']
+    _save_answers(MultipleChoiceAnswer, 'question',
+                  MULTIPLE_CHOICE_ANSWER_FIELDS,
+                  MultipleChoiceAnswer.objects.filter(
+                      question__module__course=course),
+                  [question for question, _ in multiple_choice],
+                  [answers for _, answers in multiple_choice])
+
+
+def _get_video_id(url):
+    """
+    :param url: a youtube url or the id of a video
+    :return: the id of the video
+    """
+    from .info.serializer import InformationYoutubeSerializer
+    video_ids = InformationYoutubeSerializer.pattern.findall(url)
+    return video_ids[0] if video_ids else url
+
+
+def _validate(serializer, error):
+    """
+    :param serializer: a serializer with the incoming data
+    :param error: the detail of the ParseError
+    :raise: ParseError if the data is invalid
+    """
+    if not serializer.is_valid():
+        raise ParseError(detail=error, code=None)
+
+
+def _validated(serializer, fields, error):
+    """
+    Validates the incoming data of some fields. Fields the serializer doesn't
+    cover are validated by the model field.
+    :param serializer: a serializer with the incoming data
+    :param fields: the names of the fields to be set
+    :param error: the detail of the ParseError
+    :return: the validated values of the given fields, fields missing in the
+             data (and filled by defaults of the serializer) are left out
+    :raise: ParseError if the data is invalid
+    """
+    _validate(serializer, error)
+    values = {name: value for name, value in serializer.validated_data.items()
+              if name in fields and name in serializer.initial_data}
+    model = serializer.Meta.model
+    for name in fields:
+        if name in serializer.initial_data and name not in serializer.fields:
+            try:
+                values[name] = model._meta.get_field(name).clean(
+                    serializer.initial_data[name], None)
+            except ValidationError:
+                raise ParseError(detail=error, code=None)
+    return values
+
+
+def update_module(course, module, data):
+    """
+    Updates the fields of a single module
+    :param course: the course of the module
+    :param module: the module
+    :param data: the changed fields
+    :raise: ParseError if the data is invalid
+    """
+    from .serializers import ModuleSerializer
+    data = _validated(ModuleSerializer(module, data=data, partial=True),
+                      MODULE_FIELDS, 'Error in module serialization')
+    with transaction.atomic():
+        _update(module, _assign(module, data, MODULE_FIELDS))
+        course.bump_version()
+
+
+def update_question(course, question, data):
+    """
+    Updates the fields of a single question, the answers are updated by
+    update_answer
+    :param course: the course of the question
+    :param question: the question (of its actual subclass)
+    :param data: the changed fields
+    :raise: ParseError if the data is invalid
+    """
+    from .serializers import QuestionSerializer
+    fields = next(fields for model, fields in QUESTION_TYPES.values()
+                  if isinstance(question, model))
+    error = 'Error in question serialization'
+    data = dict(
+        _validated(QuestionSerializer(question, data=data, partial=True),
+                   QUESTION_FIELDS, error),
+        **_validated(question.get_edit_serializer()(
+            question, data=data, partial=True), fields, error))
+    if isinstance(question, InformationYoutube) and 'url' in data:
+        data = dict(data, url=_get_video_id(data['url']))
+    with transaction.atomic():
+        _update(question, _assign(question, data, QUESTION_FIELDS + fields))
+        course.bump_version()
+
+
+def update_answer(course, answer, data):
+    """
+    Updates the fields of a single multiple choice answer
+    :param course: the course of the answer
+    :param answer: the answer
+    :param data: the changed fields
+    :raise: ParseError if the data is invalid or the question would not be
+            solvable anymore
+    """
+    from .multiple_choice.serializer import \
+        MultipleChoiceAnswerEditSerializer
+    data = _validated(
+        MultipleChoiceAnswerEditSerializer(answer, data=data, partial=True),
+        MULTIPLE_CHOICE_ANSWER_FIELDS, 'Error in answer serialization')
+    with transaction.atomic():
+        changed = _assign(answer, data, MULTIPLE_CHOICE_ANSWER_FIELDS)
+        if ('is_correct' in changed and not answer.is_correct
+                and not MultipleChoiceAnswer.objects.filter(
+                    question_id=answer.question_id, is_correct=True).exclude(
+                    id=answer.id).exists()):
+            raise ParseError(detail='Unsolvable question', code=None)
+        _update(answer, changed)
+        course.bump_version()
+
+
+def _reorder(queryset, ids, name):
+    """
+    Orders the siblings like the given ids. The siblings keep their set of
+    order values, only the rows that move are written.
+    :param queryset: the queryset of all siblings
+    :param ids: the ids of all siblings in the new order
+    :param name: the name of the siblings in the error message
+    :raise: ParseError if the ids are not the ids of the siblings
+    """
+    stored = {pk: (order, position) for pk, order, position in
+              queryset.values_list('id', 'order', 'position')}
+    try:
+        ids = [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise ParseError(detail='the ids of the {} need to be integers'.format(
+            name), code=None)
+    if sorted(ids) != sorted(stored):
+        raise ParseError(detail='the new order needs to contain all {} '
+                         'exactly once'.format(name), code=None)
+    orders = sorted(order for order, _ in stored.values())
+    new_orders = {pk: order for pk, order in zip(ids, orders)
+                  if stored[pk][0] != order}
+    _free_orders(queryset, new_orders)
+    _bulk_update(queryset, 'order', new_orders)
+    _bulk_update(queryset, 'position', {
+        pk: position for position, pk in enumerate(ids)
+        if stored[pk][1] != position})
+
+
+def reorder(course, data):
+    """
+    Changes the order of the modules of a course and of the questions of its
+    modules
+    :param course: the course
+    :param data: the ids of the modules in the new order ('modules') and a
+                 dictionary mapping module ids to the ids of their questions
+                 in the new order ('questions'), both are optional
+    :raise: ParseError if the ids don't match the stored modules or questions
+    """
+    questions = data.get('questions') or {}
+    if not isinstance(questions, dict):
+        raise ParseError(detail='the questions need to be mapped to the ids '
+                         'of their modules', code=None)
+    modules = Module.objects.filter(course=course)
+    module_ids = set(str(pk) for pk in modules.values_list('id', flat=True))
+    with transaction.atomic():
+        if 'modules' in data:
+            _reorder(modules, data['modules'], 'modules')
+        for module_id, ids in questions.items():
+            if str(module_id) not in module_ids:
+                raise ParseError(detail='{} is not a module of the '
+                                 'course'.format(module_id), code=None)
+            _reorder(Question.objects.non_polymorphic().filter(
+                module_id=module_id), ids, 'questions')
+        course.bump_version()
@@ -0,0 +1,112 @@
+"""
+module containing the loader for a complete course tree. Serializing a
+course needs its modules, questions and answers. Instead of fetching these
+while walking the tree, the CourseTree loads them up front in a fixed number
+of queries.
+"""
+from collections import OrderedDict
+
+from django.db.models import prefetch_related_objects
+
+from .models import Question
+from .multiple_choice.models import MultipleChoiceQuestion
+
+
+def load_structure(course):
+    """
+    Loads the ids and titles of all questions of a course without loading
+    the questions themselves
+    :param course: the course
+    :return: a list containing a list of (id, title) tuples for every module
+    """
+    structure = OrderedDict(
+        (module_id, []) for module_id in
+        course.module_set.values_list('id', flat=True))
+    questions = Question.objects.non_polymorphic().filter(
+        module__course=course).order_by('module__order', 'order')
+    for module_id, question_id, title in questions.values_list(
+            'module_id', 'id', 'title'):
+        structure[module_id].append((question_id, title))
+    return list(structure.values())
+
+
+def get_progress(structure, solved):
+    """
+    calculates the current progress of a user in a course as an array of
+    arrays. The outer array is the module and the inner contains the title
+    of the question, e.g [[{'solved': True, 'title': 'question 1'}],
+    [{'solved': False, 'title': 'question 2'}]]. A question only counts as
+    solved if all questions before it are solved as well.
+    :param structure: the question ids and titles, see load_structure
+    :param solved: the set of ids of the questions solved by the user
+    :return: the progress array
+    """
+    progress = []
+    answered_question_before = True
+    for questions in structure:
+        module_set = []
+        for question_id, title in questions:
+            answered_question_before = (answered_question_before
+                                        and question_id in solved)
+            module_set.append(
+                {'solved': answered_question_before, 'title': title})
+        progress.append(module_set)
+    return progress
+
+
+class CourseTree(object):
+    """
+    A course with all its modules, questions and answers, loaded into memory
+    at once.
+    """
+
+    def __init__(self, course):
+        """
+        Loads the course tree
+        :param course: the course to be loaded
+        """
+        self.course = course
+        self.modules = list(course.module_set.all())
+        self._questions = OrderedDict(
+            (module.id, []) for module in self.modules)
+        modules = {module.id: module for module in self.modules}
+
+        questions = list(Question.objects.filter(
+            module__course=course).order_by('module__order', 'order'))
+        for question in questions:
+            # reuse the loaded objects instead of fetching them per question
+            question.module = modules[question.module_id]
+            question.module.course = course
+            self._questions[question.module_id].append(question)
+
+        prefetch_related_objects(
+            [x for x in questions if isinstance(x, MultipleChoiceQuestion)],
+            'multiplechoiceanswer_set')
+
+    def questions_of(self, module):
+        """
+        :param module: a module of the course
+        :return: the ordered list of questions of the module
+        """
+        return self._questions[module.id]
+
+    def structure(self):
+        """
+        :return: the ids and titles of all questions, grouped by module
+        """
+        return [[(question.id, question.title) for question in questions]
+                for questions in self._questions.values()]
+
+    def is_last_question(self, question):
+        """
+        :param question: a question of the course
+        :return: True iff the question is the last one in its module
+        """
+        return self._questions[question.module_id][-1] == question
+
+    def is_last_module(self, module):
+        """
+        :param module: a module of the course
+        :return: True iff the module is the last one in the course
+        """
+        return self.modules[-1] == module
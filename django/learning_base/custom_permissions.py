@@ -4,6 +4,8 @@ module containing all custom access management
 
 from rest_framework.permissions import IsAuthenticated
 
+from . import roles
+
 SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 
@@ -19,8 +21,7 @@ class IsModOrAdmin(IsAuthenticated):
         :return: True iff the user is part of the groups 'admin' or 'moderator'
         """
         return (super().has_permission(request, view)
-                and (request.user.groups.filter(name="moderator").exists()
-                     or request.user.groups.filter(name="admin").exists()))
+                and roles.is_mod_or_admin(request.user))
 
 
 class IsAdmin(IsAuthenticated):
@@ -36,7 +37,7 @@ class IsAdmin(IsAuthenticated):
         """
 
         return (super().has_permission(request, view)
-                and request.user.groups.filter(name="admin").exists())
+                and roles.is_admin(request.user))
 
 
 class IsAdminOrReadOnly(IsAuthenticated):
@@ -55,7 +56,7 @@ class IsAdminOrReadOnly(IsAuthenticated):
 
         return (super().has_permission(request, view)
                 and (request.method in SAFE_METHODS
-                     or request.user.groups.filter(name="admin").exists()))
+                     or roles.is_admin(request.user)))
 
 
 class IsModOrAdminOrReadOnly(IsAuthenticated):
@@ -74,5 +75,20 @@ class IsModOrAdminOrReadOnly(IsAuthenticated):
 
         return (super().has_permission(request, view)
                 and (request.method in SAFE_METHODS
-                     or request.user.groups.filter(name="moderator").exists()
-                     or request.user.groups.filter(name="admin").exists()))
+                     or roles.is_mod_or_admin(request.user)))
+
+
+class IsResponsibleModOrAdmin(IsModOrAdmin):
+    """
+    Permission class for editing a course
+    """
+
+    def has_object_permission(self, request, view, obj):
+        """
+        Allows editing a course only to admins and the responsible moderator
+        of the course
+        :param obj: the course
+        :return: True iff the user is admin or the responsible mod
+        """
+        return (roles.is_admin(request.user)
+                or obj.responsible_mod_id == request.user.id)
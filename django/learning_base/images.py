@@ -0,0 +1,82 @@
+"""
+module processing uploaded images. The images are decoded, scaled down to a
+maximal size and encoded again, so the stored images stay small no matter
+what was uploaded. A small thumbnail is created for listings.
+"""
+import io
+
+from PIL import Image
+
+# the size of the thumbnails shown in listings
+THUMBNAIL_SIZE = (64, 64)
+
+JPEG_QUALITY = 85
+
+
+def _has_transparency(image):
+    return 'A' in image.mode or 'transparency' in image.info
+
+
+def encode(image):
+    """
+    Encodes an image as png if it is transparent, otherwise as jpeg
+    :param image: the PIL image
+    :return: a tuple of the content type and the encoded image
+    """
+    output = io.BytesIO()
+    if _has_transparency(image):
+        image.convert('RGBA').save(output, 'PNG', optimize=True)
+        return 'image/png', output.getvalue()
+    image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY,
+                              optimize=True, progressive=True)
+    return 'image/jpeg', output.getvalue()
+
+
+def open_image(data):
+    """
+    :param data: the encoded image
+    :return: the decoded PIL image
+    :raise: ValueError if the data is not a readable image
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (IOError, SyntaxError, Image.DecompressionBombError):
+        raise ValueError('the image can not be read')
+    return image
+
+
+def process(data, max_size):
+    """
+    Scales an image down to a maximal size and encodes it efficiently.
+    Animated images within the maximal size are kept as they are.
+    :param data: the uploaded image
+    :param max_size: the maximal width and height
+    :return: a tuple of the content type and the processed image
+    :raise: ValueError if the data is not a readable image or an animated
+            image exceeds the maximal size
+    """
+    image = open_image(data)
+    if getattr(image, 'is_animated', False):
+        if image.width > max_size[0] or image.height > max_size[1]:
+            raise ValueError('animated images may not exceed {}x{} '
+                             'pixels'.format(*max_size))
+        # the content type is taken from the decoded image, not the upload
+        content_type = Image.MIME.get(image.format)
+        if content_type is None:
+            raise ValueError('the image can not be read')
+        return content_type, data
+    if image.width > max_size[0] or image.height > max_size[1]:
+        image.thumbnail(max_size, Image.LANCZOS)
+    return encode(image)
+
+
+def thumbnail(data):
+    """
+    :param data: an encoded image
+    :return: a tuple of the content type and the encoded thumbnail
+    :raise: ValueError if the data is not a readable image
+    """
+    image = open_image(data)
+    image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+    return encode(image)
@@ -2,7 +2,7 @@
 Models for information type questions
 """
 from django.db import models
-from learning_base.models import Question
+from learning_base.models import Question, AssetField
 
 
 class InformationText(Question):
@@ -15,7 +15,7 @@ class InformationText(Question):
 
     __name__ = "info_text"
 
-    image = models.TextField(
+    image = AssetField(
         blank=True,
     )
 
@@ -77,10 +77,6 @@ class InformationText(Question):
     def __str__(self):
         return "Learning text {}".format(self.id)
 
-    def delete(self):
-        print("information Text")
-        super(InformationText, self).delete()
-
 
 class InformationYoutube(Question):
     """
@@ -160,6 +156,3 @@ class InformationYoutube(Question):
         :return: string representation from the id
         """
         return "Learning text {}".format(self.id)
-
-    def delete(self):
-        super(InformationYoutube, self).delete()
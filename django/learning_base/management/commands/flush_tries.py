@@ -0,0 +1,27 @@
+"""
+command inserting the tries of the journal into the database
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_base import try_journal
+
+
+class Command(BaseCommand):
+    help = ('Inserts the tries written to the journal (TRY_JOURNAL) into the '
+            'database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='keep flushing every given number of seconds')
+
+    def handle(self, *args, **options):
+        if try_journal.get_path() is None:
+            raise CommandError('TRY_JOURNAL is not set')
+        while True:
+            flushed = try_journal.flush()
+            self.stdout.write('Inserted {} tries'.format(flushed))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+"""
+command recalculating the ranking of all users from the tries
+"""
+from django.core.management.base import BaseCommand
+
+from learning_base.ranking import recompute_rankings
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the ranking of all users from the solved tries'
+
+    def handle(self, *args, **options):
+        updated = recompute_rankings()
+        self.stdout.write('Updated the ranking of {} users'.format(updated))
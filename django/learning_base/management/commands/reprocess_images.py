@@ -0,0 +1,17 @@
+"""
+command processing the stored avatars and assets again like new uploads
+"""
+from django.core.management.base import BaseCommand
+
+from learning_base.models import Asset, Avatar
+
+
+class Command(BaseCommand):
+    help = ('Scales down and encodes the stored avatars and assets again, '
+            'e.g. the images stored before the uploads were processed')
+
+    def handle(self, *args, **options):
+        for model in (Avatar, Asset):
+            changed = model.reprocess()
+            self.stdout.write('Replaced {} {} images'.format(
+                changed, model.__name__.lower()))
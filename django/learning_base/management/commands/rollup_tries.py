@@ -0,0 +1,24 @@
+"""
+command aggregating the tries into the daily rollups used by the statistics
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_base.statistics import parse_day, rollup_tries
+
+
+class Command(BaseCommand):
+    help = ('Aggregates the tries of all complete days that are not '
+            'aggregated yet into the daily rollups')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since',
+                            help='first day to aggregate again (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['since']:
+            start = parse_day(options['since'])
+            if start is None:
+                raise CommandError('invalid day, use YYYY-MM-DD')
+        created = rollup_tries(start)
+        self.stdout.write('Created {} daily rollups'.format(created))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 19:48
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_progress(apps, schema_editor):
+    """
+    creates the progress entries from the solved tries
+    """
+    Try = apps.get_model('learning_base', 'Try')
+    CourseProgress = apps.get_model('learning_base', 'CourseProgress')
+    progress = {}
+    solved = Try.objects.filter(solved=True, user__isnull=False)
+    for user_id, course_id, question_id in solved.filter(
+            question__isnull=False).values_list(
+                'user_id', 'question__module__course_id',
+                'question_id').distinct():
+        entry = progress.setdefault((user_id, course_id), (set(), set()))
+        entry[0].add(question_id)
+    for user_id, course_id, quiz_id in solved.filter(
+            quiz_question__isnull=False).values_list(
+                'user_id', 'quiz_question__course_id',
+                'quiz_question_id').distinct():
+        entry = progress.setdefault((user_id, course_id), (set(), set()))
+        entry[1].add(quiz_id)
+    CourseProgress.objects.bulk_create([
+        CourseProgress(
+            user_id=user_id, course_id=course_id,
+            solved=','.join(str(x) for x in sorted(questions)),
+            solved_quiz=','.join(str(x) for x in sorted(quiz)))
+        for (user_id, course_id), (questions, quiz) in progress.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learning_base', '0019_auto_20171006_1120'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('solved', models.TextField(blank=True, default='', help_text='The ids of all solved questions')),
+                ('solved_quiz', models.TextField(blank=True, default='', help_text='The ids of all solved quiz questions')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning_base.Course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='courseprogress',
+            unique_together=set([('user', 'course')]),
+        ),
+        migrations.RunPython(fill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 19:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_positions(apps, schema_editor):
+    """
+    numbers the modules of every course and the questions of every module
+    """
+    Module = apps.get_model('learning_base', 'Module')
+    Question = apps.get_model('learning_base', 'Question')
+    for model, parent in ((Module, 'course_id'), (Question, 'module_id')):
+        last_parent = None
+        position = 0
+        for pk, parent_id in model.objects.order_by(
+                parent, 'order').values_list('id', parent):
+            position = position + 1 if parent_id == last_parent else 0
+            last_parent = parent_id
+            model.objects.filter(id=pk).update(position=position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0021_course_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='position',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='position',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='module',
+            index_together=set([('course', 'position')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='question',
+            index_together=set([('module', 'position')]),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+    ]
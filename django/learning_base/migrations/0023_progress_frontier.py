@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 19:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0022_positions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='course_version',
+            field=models.IntegerField(default=-1),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='frontier_module',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='frontier_question',
+            field=models.IntegerField(default=0),
+        ),
+    ]
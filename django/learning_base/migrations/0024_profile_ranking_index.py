@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 19:57
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0023_progress_frontier'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='profile',
+            index_together=set([('ranking', 'id')]),
+        ),
+    ]
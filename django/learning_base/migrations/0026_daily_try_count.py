@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0025_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTryCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tries', models.PositiveIntegerField(default=0)),
+                ('solved', models.PositiveIntegerField(default=0)),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.CourseCategory')),
+                ('course', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.Course')),
+                ('question', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.Question')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailytrycount',
+            unique_together=set([('day', 'question')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dailytrycount',
+            index_together=set([('day', 'category'), ('day', 'course')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:03
+from __future__ import unicode_literals
+
+from hashlib import sha512
+
+from django.db import migrations, models
+
+
+def fill_user_hashes(apps, schema_editor):
+    """
+    stores the hash of the username of every profile
+    """
+    Profile = apps.get_model('learning_base', 'Profile')
+    for pk, username in Profile.objects.values_list('id', 'user__username'):
+        Profile.objects.filter(id=pk).update(
+            user_hash=sha512(str.encode(username)).hexdigest()[:10])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0026_daily_try_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='user_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=10),
+        ),
+        migrations.RunPython(fill_user_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:04
+from __future__ import unicode_literals
+
+import base64
+import binascii
+import re
+from hashlib import sha256
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from learning_base import images
+from learning_base.default_picture import default_picture
+
+# the maximal size of the avatars, see Avatar.MAX_SIZE
+MAX_SIZE = (500, 500)
+
+
+def _process(data_uri):
+    """
+    decodes, validates and scales down a stored image like the uploads are
+    :return: a tuple of the content type and the processed image or None if
+             the data is no readable image
+    """
+    match = re.match(r'^data:(image/[\w.+-]+);base64,(.*)$', data_uri,
+                     re.DOTALL)
+    if not match:
+        return None
+    try:
+        return images.process(
+            base64.b64decode(match.group(2), validate=True), MAX_SIZE)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def store_avatars(apps, schema_editor):
+    """
+    moves the avatars of the profiles into the avatar table, profiles with
+    the default picture or an invalid image get the default avatar. The
+    images are processed like new uploads, so only decodable images of the
+    content type of their data are served.
+    """
+    Avatar = apps.get_model('learning_base', 'Avatar')
+    Profile = apps.get_model('learning_base', 'Profile')
+    profiles = Profile.objects.exclude(avatar_data=default_picture).exclude(
+        avatar_data__isnull=True).exclude(avatar_data='')
+    for pk, data_uri in profiles.values_list('id', 'avatar_data').iterator():
+        processed = _process(data_uri)
+        if processed is None:
+            continue
+        content_type, data = processed
+        avatar, _ = Avatar.objects.get_or_create(
+            digest=sha256(data).hexdigest(),
+            defaults={'content_type': content_type, 'data': data})
+        Profile.objects.filter(id=pk).update(avatar=avatar.digest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0027_profile_user_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Avatar',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='profile',
+            old_name='avatar',
+            new_name='avatar_data',
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.Avatar', to_field='digest', verbose_name='Avatar of the User'),
+        ),
+        migrations.RunPython(store_avatars, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='profile',
+            name='avatar_data',
+        ),
+    ]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:06
+from __future__ import unicode_literals
+
+import base64
+import binascii
+import re
+from hashlib import sha256
+
+from django.db import migrations, models
+import learning_base.models
+from learning_base import images
+
+# the maximal size of the assets, see Asset.MAX_SIZE
+MAX_SIZE = (1024, 1024)
+
+
+# the image fields of every model
+IMAGE_FIELDS = [
+    ('InformationText', 'image'),
+    ('MultipleChoiceAnswer', 'img'),
+    ('MultipleChoiceQuestion', 'feedback_image'),
+    ('MultipleChoiceQuestion', 'question_image'),
+    ('QuizAnswer', 'img'),
+    ('QuizQuestion', 'image'),
+]
+
+
+def _process(data_uri):
+    """
+    decodes, validates and scales down a stored image like the uploads are
+    :return: a tuple of the content type and the processed image or None if
+             the data is no readable image
+    """
+    match = re.match(r'^data:(image/[\w.+-]+);base64,(.*)$', data_uri,
+                     re.DOTALL)
+    if not match:
+        return None
+    try:
+        return images.process(
+            base64.b64decode(match.group(2), validate=True), MAX_SIZE)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def store_assets(apps, schema_editor):
+    """
+    moves the inline images into the asset table and references them. The
+    images are processed like new uploads, inline data that is no readable
+    image is removed.
+    """
+    Asset = apps.get_model('learning_base', 'Asset')
+    for model_name, field in IMAGE_FIELDS:
+        model = apps.get_model('learning_base', model_name)
+        inline = model.objects.filter(**{field + '__startswith': 'data:'})
+        for pk, data_uri in inline.values_list('id', field).iterator():
+            processed = _process(data_uri)
+            if processed is None:
+                model.objects.filter(id=pk).update(**{field: ''})
+                continue
+            content_type, data = processed
+            asset, _ = Asset.objects.get_or_create(
+                digest=sha256(data).hexdigest(),
+                defaults={'content_type': content_type, 'data': data})
+            model.objects.filter(id=pk).update(
+                **{field: 'asset:' + asset.digest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0028_avatar_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Asset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='informationtext',
+            name='image',
+            field=learning_base.models.AssetField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoiceanswer',
+            name='img',
+            field=learning_base.models.AssetField(blank=True, verbose_name='The Image for the answer'),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoicequestion',
+            name='feedback_image',
+            field=learning_base.models.AssetField(blank=True, verbose_name='The Image for the question'),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoicequestion',
+            name='question_image',
+            field=learning_base.models.AssetField(blank=True, verbose_name='The Image for the question'),
+        ),
+        migrations.AlterField(
+            model_name='quizanswer',
+            name='img',
+            field=learning_base.models.AssetField(blank=True, default='', help_text='The image for this answer'),
+        ),
+        migrations.AlterField(
+            model_name='quizquestion',
+            name='image',
+            field=learning_base.models.AssetField(blank=True, default='', help_text='The image which is shown in this quiz'),
+        ),
+        migrations.RunPython(store_assets, migrations.RunPython.noop),
+    ]
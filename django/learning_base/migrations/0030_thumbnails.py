@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0029_assets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='thumbnail',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='thumbnail_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='avatar',
+            name='thumbnail',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='avatar',
+            name='thumbnail_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 20:24
+from __future__ import unicode_literals
+
+import ast
+
+from django.db import migrations, models
+from django.db.models import Case, When, Value
+
+BATCH_SIZE = 500
+
+
+def _join(ids):
+    return ','.join(str(x) for x in sorted(set(ids)))
+
+
+def _ids(values):
+    """
+    converts the values to ids like Try.encode_answer, ids submitted as
+    strings are kept
+    :return: the list of ids or None if a value is no id
+    """
+    try:
+        return [int(x) for x in values]
+    except (TypeError, ValueError):
+        return None
+
+
+def _chosen(value):
+    """
+    collects the ids of the chosen answers of a stored quiz submission. The
+    ids of the submitted quiz questions were partly removed before the
+    submission was stored, so the chosen answers of all questions are
+    collected.
+    """
+    if isinstance(value, dict):
+        ids = _ids([value.get('id')])
+        if value.get('chosen') is True and ids is not None:
+            yield ids[0]
+        for child in value.values():
+            yield from _chosen(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _chosen(child)
+
+
+def _encode(answer, quiz_answers):
+    """
+    encodes a stored answer, the repr of the submitted answers
+    """
+    try:
+        value = ast.literal_eval(answer)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+    if quiz_answers is not None:
+        return _join(quiz_answers.intersection(_chosen(value)))
+    ids = _ids(value) if isinstance(value, (list, tuple)) else None
+    return None if ids is None else _join(ids)
+
+
+def compact_answers(apps, schema_editor):
+    """
+    replaces the stored reprs of the submissions by the ids of the chosen
+    answers
+    """
+    Try = apps.get_model('learning_base', 'Try')
+    QuizAnswer = apps.get_model('learning_base', 'QuizAnswer')
+    quiz_answers = {}
+    for quiz_id, answer_id in QuizAnswer.objects.values_list('quiz_id', 'id'):
+        quiz_answers.setdefault(quiz_id, set()).add(answer_id)
+
+    changes = []
+    for pk, answer, quiz_id in Try.objects.filter(
+            answer__isnull=False).values_list(
+                'id', 'answer', 'quiz_question_id').iterator():
+        encoded = _encode(answer, None if quiz_id is None
+                          else quiz_answers.get(quiz_id, set()))
+        if encoded != answer:
+            changes.append((pk, encoded))
+    for start in range(0, len(changes), BATCH_SIZE):
+        batch = changes[start:start + BATCH_SIZE]
+        Try.objects.filter(id__in=[pk for pk, _ in batch]).update(
+            answer=Case(*[When(id=pk, then=Value(encoded))
+                          for pk, encoded in batch],
+                        output_field=models.TextField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0031_token_revocation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='try',
+            name='answer',
+            field=models.TextField(help_text='The ids of the chosen answers, sorted and separated by commas (None if the answer could not be read)', null=True, verbose_name='The given answer'),
+        ),
+        migrations.RunPython(compact_answers, migrations.RunPython.noop),
+    ]
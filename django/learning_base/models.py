@@ -4,15 +4,315 @@ itself.
 :author: Claas Voelcker
 """
 
-from hashlib import sha512
-from django.db import models
+import base64
+import binascii
+import re
+from functools import lru_cache
+from hashlib import sha256, sha512
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from polymorphic.models import PolymorphicModel
 
+from . import images, roles
 from .default_picture import default_picture
 
 
+def update_positions(queryset):
+    """
+    Numbers the position column of the ordered queryset densely, starting
+    with 0. Only rows whose position changed are written.
+    :param queryset: the ordered siblings (modules of a course or questions
+                     of a module)
+    :return: a dictionary mapping the ids to the positions
+    """
+    positions = {}
+    for position, (pk, old_position) in enumerate(
+            queryset.values_list('id', 'position')):
+        if position != old_position:
+            queryset.model.objects.filter(id=pk).update(position=position)
+        positions[pk] = position
+    return positions
+
+
+def delete_cascading(queryset):
+    """
+    Deletes the rows of a queryset together with all rows depending on them.
+    Unlike Model.delete, the dependent rows are not loaded: every related
+    table is deleted from (CASCADE) or nulled (SET_NULL) by a single statement
+    selecting the rows through a subquery, so the number of statements only
+    depends on the schema. No delete signals are sent.
+    Must be called inside a transaction.
+    :param queryset: the queryset of the rows to delete
+    :return: the number of deleted rows of the queryset
+    :raise: ValueError if a relation has an unsupported on_delete
+    """
+    for relation in queryset.model._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        field = relation.field
+        related = relation.related_model._base_manager.filter(
+            **{field.name + '__in': queryset.values('pk')})
+        if relation.on_delete is models.CASCADE:
+            delete_cascading(related)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{field.name: None})
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise ValueError('unsupported on_delete of {}'.format(field))
+    # the private fast delete of the deletion collector, it deletes with a
+    # single statement without loading the rows
+    return queryset._raw_delete(queryset.db)
+
+
+class StoredImage(models.Model):
+    """
+    An image stored once per content. Uploaded images are scaled down to
+    MAX_SIZE and encoded again before they are stored. The image is addressed
+    by the sha256 hash of the stored data, so equal images are stored once
+    and the image behind an address never changes.
+    """
+
+    class Meta:
+        abstract = True
+
+    MAX_SIZE = (1024, 1024)
+
+    # the share of its size a stored image has to lose to be replaced when
+    # the images are processed again
+    MIN_SAVING = 0.1
+
+    digest = models.CharField(
+        max_length=64,
+        unique=True,
+    )
+
+    content_type = models.CharField(
+        max_length=100,
+    )
+
+    data = models.BinaryField()
+
+    # a small version of the image for listings
+    thumbnail = models.BinaryField(
+        null=True,
+    )
+
+    thumbnail_type = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+
+    @staticmethod
+    def parse(data_uri):
+        """
+        Decodes an image given as base64 data uri
+        :param data_uri: the image, e.g. "data:image/png;base64,..."
+        :return: a tuple of the content type and the image
+        :raise: ValueError if the data uri is malformed
+        """
+        match = re.match(r'^data:(image/[\w.+-]+);base64,(.*)$',
+                         data_uri or '', re.DOTALL)
+        if not match:
+            raise ValueError('the image needs to be a base64 data uri')
+        try:
+            return match.group(1), base64.b64decode(match.group(2),
+                                                    validate=True)
+        except binascii.Error:
+            raise ValueError('the image needs to be a base64 data uri')
+
+    @staticmethod
+    def get_digest(data):
+        """
+        :param data: the image
+        :return: the hash addressing the image
+        """
+        return sha256(data).hexdigest()
+
+    @classmethod
+    def process(cls, data_uri):
+        """
+        Decodes and scales down an image given as data uri
+        :param data_uri: the image as base64 data uri
+        :return: a tuple of the content type and the processed image
+        :raise: ValueError if the data uri is malformed or no image
+        """
+        _, data = cls.parse(data_uri)
+        return images.process(data, cls.MAX_SIZE)
+
+    @classmethod
+    def store(cls, data_uri):
+        """
+        Stores an image given as data uri unless it is already stored
+        :param data_uri: the image as base64 data uri
+        :return: the stored object
+        :raise: ValueError if the data uri is malformed or no image
+        """
+        content_type, data = cls.process(data_uri)
+        digest = cls.get_digest(data)
+        image = cls.objects.filter(digest=digest).first()
+        if image is None:
+            thumbnail_type, thumbnail = images.thumbnail(data)
+            image, _ = cls.objects.get_or_create(
+                digest=digest,
+                defaults={'content_type': content_type, 'data': data,
+                          'thumbnail_type': thumbnail_type,
+                          'thumbnail': thumbnail})
+        return image
+
+    @classmethod
+    def protected_digests(cls):
+        """
+        :return: the hashes of the images that are never replaced
+        """
+        return set()
+
+    @classmethod
+    def replace_references(cls, digest, replacement):
+        """
+        Points the references to an image to another image
+        :param digest: the hash of the replaced image
+        :param replacement: the hash of the new image or None if the
+                            references are removed
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def reprocess(cls):
+        """
+        Processes the stored images again like new uploads, e.g. the images
+        stored before the uploads were processed. Images that are no readable
+        image are removed. Images whose processing saves less than
+        MIN_SAVING of their size are kept, so they are not encoded again on
+        every run.
+        :return: the number of replaced or removed images
+        """
+        changed = 0
+        protected = cls.protected_digests()
+        for pk in list(cls.objects.exclude(digest__in=protected).values_list(
+                'id', flat=True)):
+            image = cls.objects.get(id=pk)
+            try:
+                content_type, data = images.process(bytes(image.data),
+                                                    cls.MAX_SIZE)
+            except ValueError:
+                replacement = None
+            else:
+                if (content_type == image.content_type and len(data)
+                        > len(image.data) * (1 - cls.MIN_SAVING)):
+                    continue
+                replacement, _ = cls.objects.get_or_create(
+                    digest=cls.get_digest(data),
+                    defaults={'content_type': content_type, 'data': data})
+                if replacement.id == image.id:
+                    continue
+            with transaction.atomic():
+                cls.replace_references(
+                    image.digest, getattr(replacement, 'digest', None))
+                image.delete()
+            changed += 1
+        return changed
+
+    def get_thumbnail(self):
+        """
+        Returns the thumbnail, it is created for images stored without one
+        :return: a tuple of the content type and the thumbnail
+        """
+        if self.thumbnail is None:
+            self.thumbnail_type, self.thumbnail = images.thumbnail(
+                bytes(self.data))
+            self.save(update_fields=['thumbnail_type', 'thumbnail'])
+        return self.thumbnail_type, bytes(self.thumbnail)
+
+    def __str__(self):
+        return self.digest
+
+
+class Avatar(StoredImage):
+    """
+    The avatar image of users, shared by all profiles with the same image
+    """
+    MAX_SIZE = (500, 500)
+
+    @classmethod
+    def protected_digests(cls):
+        return {get_default_avatar()}
+
+    @classmethod
+    def replace_references(cls, digest, replacement):
+        Profile.objects.filter(avatar_id=digest).update(avatar_id=replacement)
+
+
+class Asset(StoredImage):
+    """
+    An image of a question, an answer or a quiz, shared by all of them
+    showing the same image
+    """
+
+    @classmethod
+    def replace_references(cls, digest, replacement):
+        from django.apps import apps
+        new = AssetField.PREFIX + replacement if replacement else ''
+        for model in apps.get_app_config('learning_base').get_models():
+            for field in model._meta.local_fields:
+                if isinstance(field, AssetField):
+                    model._base_manager.filter(**{
+                        field.name: AssetField.PREFIX + digest}).update(
+                        **{field.name: new})
+        # the cached content contains the urls of the images
+        bump_course_version()
+
+
+class AssetField(models.TextField):
+    """
+    A text field holding an image. Images uploaded as data uri are stored as
+    Asset when the model is saved and only a reference ('asset:<hash>') is
+    written to the column. When loaded the reference is replaced by the url
+    of the asset, so serializers return the url and posting it back keeps
+    the image. Other values (e.g. external urls) are kept as they are.
+    """
+    PREFIX = 'asset:'
+    DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+    def from_db_value(self, value, expression, connection, context):
+        if value and value.startswith(self.PREFIX):
+            from django.urls import reverse
+            return reverse('asset',
+                           kwargs={'digest': value[len(self.PREFIX):]})
+        return value
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if value and value.startswith('data:'):
+            value = self.PREFIX + Asset.store(value).digest
+            setattr(model_instance, self.attname,
+                    self.from_db_value(value, None, None, None))
+        return value
+
+    def get_prep_value(self, value):
+        value = super(AssetField, self).get_prep_value(value)
+        # only the urls of the stored assets of this site are references,
+        # external urls of the same form are kept
+        digest = (value or '')[-64:]
+        if (self.DIGEST_PATTERN.match(digest)
+                and value == self.from_db_value(
+                    self.PREFIX + digest, None, None, None)
+                and Asset.objects.filter(digest=digest).exists()):
+            return self.PREFIX + digest
+        return value
+
+
+@lru_cache(maxsize=None)
+def get_default_avatar():
+    """
+    :return: the hash of the default avatar of all profiles without an avatar
+    """
+    return Avatar.get_digest(Avatar.process(default_picture)[1])
+
+
 class Profile(models.Model):
     """
     A user profile that stores additional information about a user
@@ -21,6 +321,7 @@ class Profile(models.Model):
 
     class Meta:
         ordering = ('ranking',)
+        index_together = ['ranking', 'id']
 
     user = models.OneToOneField(
         User,
@@ -43,17 +344,31 @@ class Profile(models.Model):
         default="en"
     )
 
-    avatar = models.TextField(
+    # the avatar is referenced by its hash, no avatar means the default one
+    avatar = models.ForeignKey(
+        'Avatar',
         verbose_name="Avatar of the User",
-        default=default_picture,
+        to_field='digest',
         null=True,
         blank=True,
+        on_delete=models.SET_NULL,
     )
 
     ranking = models.IntegerField(
         default=0
     )
 
+    # the anonymous hash of the username, see hash_username
+    user_hash = models.CharField(
+        max_length=10,
+        blank=True,
+        db_index=True,
+    )
+
+    def save(self, *args, **kwargs):
+        self.user_hash = self.hash_username(self.user.username)
+        super(Profile, self).save(*args, **kwargs)
+
     def get_link_to_profile(self):
         """
         :return: the link to the users profile page
@@ -72,26 +387,92 @@ class Profile(models.Model):
         """
         :return: True if the user is in the group moderators
         """
-        return self.user.groups.filter(name="moderator").exists()
+        return roles.is_mod(self.user)
 
     def is_admin(self):
         """
         Returns True if the user is in the group admin
         :return: whether the user belong to the admin group
         """
-        return self.user.groups.filter(name="admin").exists()
+        return roles.is_admin(self.user)
+
+    def get_avatar_digest(self):
+        """
+        :return: the hash of the avatar of the user
+        """
+        return self.avatar_id or get_default_avatar()
 
     def get_hash(self):
         """
-        calculates a hash to get anonymous user data
+        returns the hash to get anonymous user data
         :return: the first 10 digits of the hash
         """
-        return sha512(str.encode(self.user.username)).hexdigest()[:10]
+        return self.user_hash or self.hash_username(self.user.username)
+
+    @staticmethod
+    def hash_username(username):
+        """
+        :param username: the name of a user
+        :return: the first 10 digits of the hash of the name
+        """
+        return sha512(str.encode(username)).hexdigest()[:10]
 
     def __str__(self):
         return str(self.user)
 
 
+@receiver(post_save, sender=User)
+def update_user_hash(sender, instance, **kwargs):
+    """
+    Keeps the stored hash of the profile in sync with the username
+    """
+    user_hash = Profile.hash_username(instance.username)
+    Profile.objects.filter(user=instance).exclude(
+        user_hash=user_hash).update(user_hash=user_hash)
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive(sender, instance, **kwargs):
+    """
+    Revokes the tokens of a deactivated user
+    """
+    if not instance.is_active:
+        from . import tokens
+        tokens.revoke(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted(sender, instance, **kwargs):
+    """
+    Revokes the tokens of a deleted user
+    """
+    from . import tokens
+    tokens.revoke(instance.id)
+
+
+class TokenRevocation(models.Model):
+    """
+    The time the json web tokens of a user were revoked, e.g. because the
+    rights or the password of the user changed. Tokens issued before this
+    time are rejected.
+    """
+
+    # the revocation outlives a deleted user, so its tokens stay rejected
+    user = models.OneToOneField(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    revoked_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+    )
+
+    def __str__(self):
+        return "TokenRevocation_{}".format(self.user_id)
+
+
 class CourseCategory(models.Model):
     """
     The type of a course, meaning the field in which the course belongs, e.g.
@@ -112,6 +493,10 @@ class CourseCategory(models.Model):
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            delete_cascading(CourseCategory.objects.filter(id=self.id))
+
 
 class Course(models.Model):
     """
@@ -195,21 +580,71 @@ class Course(models.Model):
         default=""
     )
 
+    # increased on every change, used to invalidate the cached content
+    version = models.IntegerField(
+        default=0
+    )
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # the version is only increased by bump_version, an instance loaded
+        # before the last increase must not write back its older version
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version']
+        super(Course, self).save(*args, **kwargs)
+
+    def bump_version(self):
+        """
+        Increases the version of the course, which invalidates all cached
+        content of the course
+        """
+        if Course.objects.filter(id=self.id).update(
+                version=F('version') + 1):
+            self.refresh_from_db(fields=['version'])
+
     def num_of_modules(self):
         """
         Returns the number of modules
         """
         return len(Module.objects.filter(course=self))
 
-    def delete(self):
-        for module in self.module_set.all():
-            for question in module.question_set.all():
-                question.delete()
-            module.delete()
-        super(Course, self).delete()
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            delete_cascading(Course.objects.filter(id=self.id))
+
+    def get_question(self, module_index, question_index):
+        """
+        Returns the question at the given position with a single indexed
+        lookup
+        :param module_index: the position of the module in the course
+        :param question_index: the position of the question in the module
+        :return: the question (of its actual subclass)
+        :raise: Question.DoesNotExist if there is no such question
+        """
+        question = Question.objects.non_polymorphic().select_related(
+            'module').get(module__course=self,
+                          module__position=int(module_index),
+                          position=int(question_index))
+        module = question.module
+        module.course = self
+        question = question.get_real_instance()
+        question.module = module
+        return question
+
+
+def bump_course_version(**lookup):
+    """
+    Increases the version of the courses matching the lookup with a single
+    statement, which invalidates all cached content of the courses
+    :param lookup: the filter of the courses
+    """
+    Course.objects.filter(**lookup).update(version=F('version') + 1)
+
 
 class Module(models.Model):
     """
@@ -218,6 +653,7 @@ class Module(models.Model):
 
     class Meta:
         unique_together = ['order', 'course']
+        index_together = ['course', 'position']
         ordering = ['order']
 
     name = models.CharField(
@@ -238,6 +674,12 @@ class Module(models.Model):
 
     order = models.IntegerField()
 
+    # the index of the module in the course (0, 1, 2, ...), derived from the
+    # order and kept up to date on save and delete
+    position = models.IntegerField(
+        default=0
+    )
+
     description = models.CharField(
         max_length=144,
         null=True,
@@ -247,6 +689,33 @@ class Module(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        module = super(Module, cls).from_db(db, field_names, values)
+        # the positions only change with the order or the course
+        module._stored_order = (module.__dict__.get('order'),
+                                module.__dict__.get('course_id'))
+        return module
+
+    def save(self, *args, **kwargs):
+        stored = getattr(self, '_stored_order', None)
+        super(Module, self).save(*args, **kwargs)
+        if stored == (self.order, self.course_id):
+            return
+        self.position = update_positions(
+            Module.objects.filter(course_id=self.course_id))[self.id]
+        if stored is not None and stored[1] != self.course_id:
+            update_positions(Module.objects.filter(course_id=stored[1]))
+        self._stored_order = (self.order, self.course_id)
+
+    def delete(self, *args, **kwargs):
+        course_id = self.course_id
+        with transaction.atomic():
+            delete_cascading(Module.objects.filter(id=self.id))
+            update_positions(Module.objects.filter(course_id=course_id))
+            # the set based delete sends no signals
+            bump_course_version(id=course_id)
+
     def num_of_questions(self):
         """
         Returns the number of questions in the module
@@ -258,25 +727,32 @@ class Module(models.Model):
         Gets the previous module in the ordering
         :return: the previous module in the same course
         """
-        modules = self.course.module_set.all()
-        if list(modules).index(self) <= 0:
-            return False
-        return modules[list(modules).index(self) - 1]
+        return Module.objects.filter(
+            course_id=self.course_id,
+            position=self.position - 1).first() or False
+
+    def get_next_in_order(self):
+        """
+        Gets the next module in the ordering
+        :return: the next module in the same course
+        """
+        return Module.objects.filter(
+            course_id=self.course_id,
+            position=self.position + 1).first() or False
 
     def is_first_module(self):
         """
         checks whether the given module is the first in a course
         :return: True, iff this module has the lowest order in the course
         """
-        modules = self.course.module_set
-        return self == modules.first()
+        return self.position == 0
 
     def is_last_module(self):
         """
         Returns True if this is the final module in a course
         """
-        modules = self.course.module_set
-        return self == modules.last()
+        return not Module.objects.filter(
+            course_id=self.course_id, position__gt=self.position).exists()
 
 
 
@@ -291,6 +767,7 @@ class Question(PolymorphicModel):
 
     class Meta:
         unique_together = ['module', 'order']
+        index_together = ['module', 'position']
         ordering = ['module', 'order']
 
     # a title for the question
@@ -326,6 +803,12 @@ class Question(PolymorphicModel):
     # the ordering attribute of the question (needs to be explicitly saved)
     order = models.IntegerField()
 
+    # the index of the question in the module (0, 1, 2, ...), derived from
+    # the order and kept up to date on save and delete
+    position = models.IntegerField(
+        default=0
+    )
+
     # foreign key mapping to the module that contains this question
     module = models.ForeignKey(
         Module,
@@ -334,6 +817,37 @@ class Question(PolymorphicModel):
         on_delete=models.CASCADE
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        question = super(Question, cls).from_db(db, field_names, values)
+        # the positions only change with the order or the module
+        question._stored_order = (question.__dict__.get('order'),
+                                  question.__dict__.get('module_id'))
+        return question
+
+    def save(self, *args, update_position=True, **kwargs):
+        stored = getattr(self, '_stored_order', None)
+        super(Question, self).save(*args, **kwargs)
+        # the course save numbers the positions of all questions at once
+        if update_position and stored != (self.order, self.module_id):
+            self.position = update_positions(
+                Question.objects.non_polymorphic().filter(
+                    module_id=self.module_id).order_by('order'))[self.id]
+            if stored is not None and stored[1] != self.module_id:
+                update_positions(Question.objects.non_polymorphic().filter(
+                    module_id=stored[1]).order_by('order'))
+        self._stored_order = (self.order, self.module_id)
+
+    def delete(self, *args, **kwargs):
+        module_id = self.module_id
+        with transaction.atomic():
+            delete_cascading(
+                Question.objects.non_polymorphic().filter(id=self.id))
+            update_positions(Question.objects.non_polymorphic().filter(
+                module_id=module_id).order_by('order'))
+            # the set based delete sends no signals
+            bump_course_version(module__id=module_id)
+
     def is_first_question(self):
         """
         Checks whether this is the first question in the module
@@ -341,8 +855,7 @@ class Question(PolymorphicModel):
         :author: Claas Voelcker
         :return: whether this is the first question or not
         """
-        questions = self.module.question_set
-        return self == questions.first()
+        return self.position == 0
 
     def is_last_question(self):
         """
@@ -351,8 +864,8 @@ class Question(PolymorphicModel):
         :author: Claas Voelcker
         :return: whether this is the last question or not
         """
-        questions = self.module.question_set
-        return self == questions.last()
+        return not Question.objects.filter(
+            module_id=self.module_id, position__gt=self.position).exists()
 
     def get_previous_in_order(self):
         """
@@ -360,10 +873,18 @@ class Question(PolymorphicModel):
         :author: Claas Voelcker
         :return: the previous question in the same module
         """
-        questions = self.module.question_set.all()
-        if list(questions).index(self) <= 0:
-            return False
-        return questions[list(questions).index(self) - 1]
+        return Question.objects.filter(
+            module_id=self.module_id,
+            position=self.position - 1).first() or False
+
+    def get_next_in_order(self):
+        """
+        Returns the next question in the module
+        :return: the next question in the same module
+        """
+        return Question.objects.filter(
+            module_id=self.module_id,
+            position=self.position + 1).first() or False
 
     def get_points(self):
         """
@@ -391,7 +912,7 @@ class QuizQuestion(models.Model):
         default=""
     )
 
-    image = models.TextField(
+    image = AssetField(
         help_text="The image which is shown in this quiz",
         default="",
         blank=True
@@ -405,21 +926,27 @@ class QuizQuestion(models.Model):
 
     def evaluate(self, data):
         """
-        Checks whether the quiz question is answered correctly
+        Checks whether the quiz question is answered correctly. The answers
+        are read from the prefetched answer set if it was prefetched.
+        :param data: the submission, its 'answers' are dictionaries of the
+                     answer 'id' and whether it was 'chosen'
         :return: True iff all and only the correct answers are
                  provided
         """
-        answers = self.answer_set()
-        for ans in answers:
-            if ans.correct:
-                for i in data['answers']:
-                    if 'id' in i and (i['id'] == ans.id and not i['chosen']):
-                        return False
-            if not ans.correct:
-                for i in data:
-                    if 'id' in i and (i['id'] == ans.id and i['chosen']):
-                        return False
-        return True
+        chosen = {answer['id']: answer['chosen']
+                  for answer in data['answers'] if 'id' in answer}
+        # answers left out of the submission are not chosen
+        return all(chosen.get(answer.id, False) == answer.correct
+                   for answer in self.answer_set())
+
+    @staticmethod
+    def chosen_answers(data):
+        """
+        :param data: the submission, see evaluate
+        :return: the ids of the chosen answers
+        """
+        return [answer['id'] for answer in data['answers']
+                if 'id' in answer and answer['chosen']]
 
     def answer_set(self):
         """
@@ -455,7 +982,7 @@ class QuizAnswer(models.Model):
         help_text="The answer text"
     )
 
-    img = models.TextField(
+    img = AssetField(
         help_text="The image for this answer",
         default="",
         blank=True
@@ -508,7 +1035,8 @@ class Try(models.Model):
 
     answer = models.TextField(
         verbose_name="The given answer",
-        help_text="The answers as pure string",
+        help_text="The ids of the chosen answers, sorted and separated by "
+                  "commas (None if the answer could not be read)",
         null=True
     )
 
@@ -521,11 +1049,333 @@ class Try(models.Model):
         default=False
     )
 
+    @staticmethod
+    def encode_answer(answer_ids):
+        """
+        :param answer_ids: the ids of the chosen answers
+        :return: the sorted ids separated by commas or None if the given
+                 values are no ids
+        """
+        try:
+            ids = set(int(x) for x in answer_ids)
+        except (TypeError, ValueError):
+            return None
+        return ','.join(str(x) for x in sorted(ids))
+
+    def answer_ids(self):
+        """
+        :return: the set of ids of the chosen answers or None if the answer is
+                 unknown
+        """
+        if self.answer is None:
+            return None
+        return set(int(x) for x in self.answer.split(',') if x)
+
     def __str__(self):
         return "Solution_{}_{}_{}".format(
             self.question, self.solved, self.date)
 
 
+class CourseProgress(models.Model):
+    """
+    The progress of a user in a course. It stores which questions and quiz
+    questions of the course the user has solved, so the progress can be read
+    with a single lookup instead of querying the try set of every question.
+    The entry is updated every time a solved Try is recorded.
+    """
+
+    class Meta:
+        unique_together = ['user', 'course']
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+    )
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+    )
+
+    # comma separated ids of the solved questions
+    solved = models.TextField(
+        help_text="The ids of all solved questions",
+        default="",
+        blank=True,
+    )
+
+    # comma separated ids of the solved quiz questions
+    solved_quiz = models.TextField(
+        help_text="The ids of all solved quiz questions",
+        default="",
+        blank=True,
+    )
+
+    # the position (module and question) of the first question that is not
+    # solved, all questions before it are solved
+    frontier_module = models.IntegerField(
+        default=0
+    )
+
+    frontier_question = models.IntegerField(
+        default=0
+    )
+
+    # the version of the course the frontier was calculated for
+    course_version = models.IntegerField(
+        default=-1
+    )
+
+    @staticmethod
+    def get_for(user, course):
+        """
+        Returns the progress of a user in a course. If the user has not
+        solved anything yet, an unsaved empty progress is returned.
+        :param user: the user
+        :param course: the course or its id
+        :return: the CourseProgress object
+        """
+        course_id = getattr(course, 'id', course)
+        progress = CourseProgress.objects.filter(
+            user=user, course_id=course_id).first()
+        if progress is None:
+            progress = CourseProgress(user=user, course_id=course_id)
+        return progress
+
+    @staticmethod
+    def _parse(ids):
+        return set(int(x) for x in ids.split(',') if x)
+
+    @staticmethod
+    def _join(ids):
+        return ','.join(str(x) for x in sorted(ids))
+
+    def solved_questions(self):
+        """
+        :return: the set of ids of all solved questions
+        """
+        return self._parse(self.solved)
+
+    def solved_quiz_questions(self):
+        """
+        :return: the set of ids of all solved quiz questions
+        """
+        return self._parse(self.solved_quiz)
+
+    def add_question(self, question, save=True):
+        """
+        Marks a question as solved and saves the progress
+        :param question: the solved question or its id
+        :param save: whether the progress should be saved
+        :return: True iff the question was not solved before
+        """
+        question_id = getattr(question, 'id', question)
+        solved = self.solved_questions()
+        if question_id in solved:
+            return False
+        solved.add(question_id)
+        self.solved = self._join(solved)
+        if save:
+            self.save()
+        return True
+
+    def update_frontier(self, structure, version):
+        """
+        Calculates the position of the first question that is not solved
+        :param structure: the question ids and titles of the course, see
+                          course_tree.load_structure
+        :param version: the version of the course
+        """
+        solved = self.solved_questions()
+        self.frontier_module = len(structure)
+        self.frontier_question = 0
+        for module_index, questions in enumerate(structure):
+            unsolved = next((index for index, (question_id, _)
+                             in enumerate(questions)
+                             if question_id not in solved), None)
+            if unsolved is not None:
+                self.frontier_module = module_index
+                self.frontier_question = unsolved
+                break
+        self.course_version = version
+
+    def can_access(self, module_index, question_index):
+        """
+        Checks whether all questions before the given position are solved
+        (the frontier needs to be up to date)
+        :param module_index: the position of the module in the course
+        :param question_index: the position of the question in the module
+        :return: True iff the question may be accessed
+        """
+        return ((int(module_index), int(question_index))
+                <= (self.frontier_module, self.frontier_question))
+
+    def add_quiz_questions(self, quiz_questions, save=True):
+        """
+        Marks quiz questions as solved and saves the progress
+        :param quiz_questions: the solved quiz questions or their ids
+        :param save: whether the progress should be saved
+        :return: True iff at least one of them was not solved before
+        """
+        solved = self.solved_quiz_questions()
+        new = set(getattr(x, 'id', x) for x in quiz_questions) - solved
+        if not new:
+            return False
+        self.solved_quiz = self._join(solved | new)
+        if save:
+            self.save()
+        return True
+
+    def save_if_unchanged(self, solved, solved_quiz):
+        """
+        Saves the progress unless another request changed the solved
+        questions since they were read
+        :param solved: the stored solved questions when they were read
+        :param solved_quiz: the stored solved quiz questions when they were
+                            read
+        :return: True iff the progress was saved
+        """
+        if self.id is None:
+            # a concurrent request may have created the progress
+            try:
+                with transaction.atomic():
+                    self.save()
+            except IntegrityError:
+                return False
+            return True
+        return CourseProgress.objects.filter(
+            id=self.id, solved=solved, solved_quiz=solved_quiz).update(
+            solved=self.solved, solved_quiz=self.solved_quiz,
+            frontier_module=self.frontier_module,
+            frontier_question=self.frontier_question,
+            course_version=self.course_version) == 1
+
+    def __str__(self):
+        return "Progress_{}_{}".format(self.user_id, self.course_id)
+
+
+class CourseScore(models.Model):
+    """
+    The ranking points a user earned in a course. The points are added
+    whenever the user is awarded points for a question or a quiz of the
+    course, so the leaderboard of a course does not need to scan the tries.
+    """
+
+    class Meta:
+        unique_together = ['user', 'course']
+        index_together = ['course', 'ranking', 'id']
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+    )
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+    )
+
+    ranking = models.IntegerField(
+        default=0
+    )
+
+    def __str__(self):
+        return "CourseScore_{}_{}".format(self.user_id, self.course_id)
+
+
+class CategoryScore(models.Model):
+    """
+    The ranking points a user earned in all courses of a category
+    """
+
+    class Meta:
+        unique_together = ['user', 'category']
+        index_together = ['category', 'ranking', 'id']
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+    )
+
+    category = models.ForeignKey(
+        CourseCategory,
+        on_delete=models.CASCADE,
+    )
+
+    ranking = models.IntegerField(
+        default=0
+    )
+
+    def __str__(self):
+        return "CategoryScore_{}_{}".format(self.user_id, self.category_id)
+
+
+class DailyTryCount(models.Model):
+    """
+    The number of tries of a question on a single day. The counts are
+    aggregated from the tries by the rollup_tries command, so statistics over
+    long periods don't need to scan the tries. Tries of quiz questions are
+    counted in rows without a question.
+    """
+
+    class Meta:
+        unique_together = ['day', 'question']
+        index_together = [['day', 'course'], ['day', 'category']]
+
+    day = models.DateField()
+
+    question = models.ForeignKey(
+        Question,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+
+    # the course and category of the question when the day was aggregated
+    course = models.ForeignKey(
+        Course,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+
+    category = models.ForeignKey(
+        CourseCategory,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+
+    tries = models.PositiveIntegerField(
+        default=0
+    )
+
+    solved = models.PositiveIntegerField(
+        default=0
+    )
+
+    # the number of different users, it can't be summed over several rows
+    users = models.PositiveIntegerField(
+        default=0
+    )
+
+    def __str__(self):
+        return "DailyTryCount_{}_{}".format(self.day, self.question_id)
+
+
+class FlushedTryBatch(models.Model):
+    """
+    A batch of journaled tries inserted by a flush (see try_journal). The
+    batch is stored in the transaction inserting its tries, so a flush
+    interrupted before the journal was removed doesn't insert them again.
+    """
+
+    batch = models.CharField(
+        max_length=32,
+        unique=True,
+    )
+
+    def __str__(self):
+        return "FlushedTryBatch_{}".format(self.batch)
+
+
 def started_courses(user):
     """
     returns all courses started by a user
@@ -3,7 +3,7 @@ module containing all models for multiple choice questions
 """
 
 from django.db import models
-from learning_base.models import Question
+from learning_base.models import Question, AssetField
 
 
 class MultipleChoiceQuestion(Question):
@@ -13,12 +13,12 @@ class MultipleChoiceQuestion(Question):
     """
     __name__ = "multiple_choice"
 
-    question_image = models.TextField(
+    question_image = AssetField(
         verbose_name="The Image for the question",
         blank=True,
     )
 
-    feedback_image = models.TextField(
+    feedback_image = AssetField(
         verbose_name="The Image for the question",
         blank=True,
     )
@@ -47,11 +47,10 @@ class MultipleChoiceQuestion(Question):
         :author: Tobias Huber
         """
 
-        # get all correct answers, map them to their id and make a
-        # (mathematical) set out of it"
-        answers = set([x.id for x in
-                       self.multiplechoiceanswer_set.filter(is_correct=True)])
-        return answers == set(data)
+        # the ids of the correct answers are cached per course version
+        from learning_base import content_cache
+        return content_cache.get_answer_key(
+            self.module.course, self.id) == set(data)
 
     def __str__(self):
         return self.title
@@ -91,10 +90,6 @@ class MultipleChoiceQuestion(Question):
         from . import serializer
         return serializer.MultipleChoiceQuestionEditSerializer
 
-    def delete(self):
-        print("multiple choice")
-        super(MultipleChoiceQuestion, self).delete()
-
 
 class MultipleChoiceAnswer(models.Model):
     """
@@ -116,7 +111,7 @@ class MultipleChoiceAnswer(models.Model):
         default=False
     )
 
-    img = models.TextField(
+    img = AssetField(
         verbose_name="The Image for the answer",
         blank=True
     )
@@ -3,7 +3,6 @@ serializers for MultipleChoice question types
 """
 
 from rest_framework import serializers
-from rest_framework.exceptions import ParseError
 from .models import MultipleChoiceAnswer, MultipleChoiceQuestion
 
 
@@ -16,16 +15,6 @@ class MultipleChoiceAnswerSerializer(serializers.ModelSerializer):
         model = MultipleChoiceAnswer
         fields = ('text', 'id', 'img')
 
-    def create(self, validated_data):
-        """
-        creation method for new db entries
-        :author: Leonhard Wiedmann
-        :param: validated_data valid data for the creation
-        """
-        answer = MultipleChoiceAnswer(**validated_data)
-        answer.question = validated_data['question']
-        answer.save()
-
 
 class MultipleChoiceQuestionPreviewSerializer(serializers.ModelSerializer):
     """
@@ -93,27 +82,3 @@ class MultipleChoiceQuestionSerializer(serializers.ModelSerializer):
         values['answers'] = MultipleChoiceAnswerSerializer(answers,
                                                            many=True).data
         return values
-
-    def create(self, validated_data):
-        """
-        creating new database entries while editing
-        :author: Leonhard Wiedmann
-        :param validated_data: valid data
-        """
-        answers = validated_data.pop('answers')
-        question = MultipleChoiceQuestion(**validated_data)
-        question.module = validated_data['module']
-        question.save()
-
-        for answer in answers:
-            answer['question'] = question
-            answer_serializer = MultipleChoiceAnswerSerializer(data=answer)
-            if not answer_serializer.is_valid():
-                raise ParseError(detail=answer_serializer.errors, code=None)
-            else:
-                answer_serializer.create(answer)
-        if question.not_solvable():
-            question.delete()
-            raise ParseError(
-                detail="Unsolvable question {}".format(question.title),
-                code=None)
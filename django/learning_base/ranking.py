@@ -0,0 +1,296 @@
+"""
+module containing the calculation of the ranking points of the users. Besides
+the global ranking of the profile the points are summed per course
+(CourseScore) and per category (CategoryScore).
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Count, prefetch_related_objects
+from django.urls import reverse
+
+from . import try_journal
+from .models import Profile, Question, QuizQuestion, Course, Try, \
+    CourseScore, CategoryScore, get_default_avatar
+
+
+# the order of the leaderboard, ties are broken by the id so every profile
+# has a unique position. It matches the index on (ranking, id).
+LEADERBOARD_ORDER = ('-ranking', '-id')
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_NEIGHBOURS = 25
+
+
+def calculate_quiz_points(old_percentage, new_percentage, difficulty):
+    """
+    calculates the quiz points from the old existing statistics and the new
+    quiz answers
+    :param old_percentage: percentage of questions already answered correctly
+    :param new_percentage: percentage of questions newly answered correctly
+    :param difficulty: the course difficulty
+    :return: the additional points
+    """
+    multiplier = 2 if difficulty == 2 else 1
+    ranking_threshold = [0.4, 0.7, 0.9]
+    old_extra_points = [x[0] for x in enumerate(ranking_threshold) if
+                        x[1] > old_percentage]
+    new_extra_points = [x[0] for x in enumerate(ranking_threshold) if
+                        x[1] > new_percentage]
+    old_extra_points = 3 if not old_extra_points else old_extra_points[0]
+    new_extra_points = 3 if not new_extra_points else new_extra_points[0]
+    return max(0, 5 * multiplier * (new_extra_points - old_extra_points))
+
+
+def _add_score(model, points, **lookup):
+    """
+    Adds points to the score identified by the lookup, creating it if needed
+    """
+    if model.objects.filter(**lookup).update(ranking=F('ranking') + points):
+        return
+    try:
+        # the savepoint keeps the transaction usable if a concurrent request
+        # created the score first
+        with transaction.atomic():
+            model.objects.create(ranking=points, **lookup)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(ranking=F('ranking') + points)
+
+
+def award_points(user, points, course=None):
+    """
+    Adds points to the ranking of a user. The ranking is increased by the
+    database, so concurrent submissions don't overwrite each other and the
+    rest of the profile is not written.
+    :param user: the user
+    :param points: the number of points
+    :param course: the course the points were earned in
+    """
+    if not points:
+        return
+    Profile.objects.filter(user=user).update(ranking=F('ranking') + points)
+    if course is not None:
+        _add_score(CourseScore, points, user=user, course=course)
+        if course.category_id is not None:
+            _add_score(CategoryScore, points, user=user,
+                       category_id=course.category_id)
+
+
+def calculate_scores():
+    """
+    Calculates the points of all users per course from the solved tries.
+    Every solved question counts once and the quiz points are given for the
+    share of solved quiz questions of every course.
+    :return: a dictionary mapping tuples of user and course id to the points
+    """
+    scores = defaultdict(int)
+    solved = Try.objects.filter(solved=True, user__isnull=False)
+
+    question_tries = list(solved.filter(question__isnull=False).values_list(
+        'user_id', 'question_id').distinct())
+    questions = {question.id: question for question in Question.objects.filter(
+        id__in=set(question_id for _, question_id in question_tries))}
+    prefetch_related_objects(list(questions.values()),
+                             'module__course__category')
+    for user_id, question_id in question_tries:
+        question = questions[question_id]
+        scores[user_id, question.module.course_id] += question.get_points()
+
+    quiz_tries = list(solved.filter(quiz_question__isnull=False).values_list(
+        'user_id', 'quiz_question_id').distinct())
+    quiz_questions = {quiz.id: quiz for quiz in QuizQuestion.objects.filter(
+        id__in=set(quiz_id for _, quiz_id in quiz_tries))}
+    courses = {course.id: course for course in Course.objects.filter(
+        id__in=set(quiz.course_id for quiz in quiz_questions.values())
+    ).annotate(num_quiz=Count('quizquestion'))}
+    solved_quiz = defaultdict(int)
+    for user_id, quiz_id in quiz_tries:
+        quiz = quiz_questions[quiz_id]
+        scores[user_id, quiz.course_id] += quiz.get_points()
+        solved_quiz[user_id, quiz.course_id] += 1
+    # the quiz points only depend on the final share of solved questions
+    for (user_id, course_id), num_solved in solved_quiz.items():
+        course = courses[course_id]
+        scores[user_id, course_id] += calculate_quiz_points(
+            0, float(num_solved / course.num_quiz), course.difficulty)
+    return scores
+
+
+def calculate_rankings(scores=None):
+    """
+    Calculates the ranking of all users from the solved tries
+    :param scores: the points per course as returned by calculate_scores
+    :return: a dictionary mapping the user ids to the ranking
+    """
+    if scores is None:
+        scores = calculate_scores()
+    rankings = defaultdict(int)
+    for (user_id, _), points in scores.items():
+        rankings[user_id] += points
+    return rankings
+
+
+def recompute_rankings():
+    """
+    Recalculates the ranking of all users and stores the changed ones. The
+    course and category scores are rebuilt as well. The journaled tries are
+    flushed first, otherwise their points would be missing.
+    :return: the number of updated profiles
+    """
+    try_journal.flush()
+    scores = calculate_scores()
+    rankings = calculate_rankings(scores)
+    categories = dict(Course.objects.values_list('id', 'category_id'))
+    category_scores = defaultdict(int)
+    for (user_id, course_id), points in scores.items():
+        if categories.get(course_id) is not None:
+            category_scores[user_id, categories[course_id]] += points
+    updated = 0
+    with transaction.atomic():
+        for profile_id, user_id, ranking in Profile.objects.values_list(
+                'id', 'user_id', 'ranking'):
+            if rankings.get(user_id, 0) != ranking:
+                Profile.objects.filter(id=profile_id).update(
+                    ranking=rankings.get(user_id, 0))
+                updated += 1
+        CourseScore.objects.all().delete()
+        CourseScore.objects.bulk_create(
+            CourseScore(user_id=user_id, course_id=course_id, ranking=points)
+            for (user_id, course_id), points in scores.items())
+        CategoryScore.objects.all().delete()
+        CategoryScore.objects.bulk_create(
+            CategoryScore(user_id=user_id, category_id=category_id,
+                          ranking=points)
+            for (user_id, category_id), points in category_scores.items())
+    return updated
+
+
+def get_avatar_thumbnail(digest):
+    """
+    :param digest: the hash of the avatar of a user or None
+    :return: the url of the thumbnail of the avatar
+    """
+    return reverse('avatar-thumbnail',
+                   kwargs={'digest': digest or get_default_avatar()})
+
+
+def _get_rows(queryset):
+    """
+    Serializes profiles or scores for the leaderboard, joining the usernames
+    and avatars
+    :param queryset: a queryset of profiles or scores
+    :return: a list of tuples of the id of the row (which orders equal
+             rankings) and the entry
+    """
+    if queryset.model is Profile:
+        profile, avatar = 'id', 'avatar'
+    else:
+        profile, avatar = 'user__profile__id', 'user__profile__avatar'
+    return [(row_id, {'name': name, 'id': profile_id, 'ranking': points,
+                      'avatar': get_avatar_thumbnail(digest)})
+            for row_id, profile_id, points, name, digest
+            in queryset.values_list('id', profile, 'ranking',
+                                    'user__username', avatar)]
+
+
+def get_entries(queryset):
+    """
+    Serializes profiles or scores for the leaderboard, joining the usernames
+    and avatars
+    :param queryset: a queryset of profiles or scores
+    :return: a list of dictionaries with the name, the id of the profile,
+             the ranking and the avatar
+    """
+    return [entry for _, entry in _get_rows(queryset)]
+
+
+def get_cursor(points, row_id):
+    """
+    :param points: the ranking of an entry of the leaderboard
+    :param row_id: the id of the profile or score of the entry
+    :return: the cursor pointing behind the entry
+    """
+    return '{}:{}'.format(points, row_id)
+
+
+def parse_cursor(cursor):
+    """
+    :param cursor: a cursor as returned by get_cursor
+    :return: a tuple of the ranking and the id
+    :raise: ValueError if the cursor is malformed
+    """
+    points, row_id = cursor.split(':')
+    return int(points), int(row_id)
+
+
+def _behind(points, profile_id):
+    """
+    :return: a filter for the profiles behind the given position
+    """
+    return Q(ranking__lt=points) | Q(ranking=points, id__lt=profile_id)
+
+
+def _ahead(points, profile_id):
+    """
+    :return: a filter for the profiles ahead of the given position
+    """
+    return Q(ranking__gt=points) | Q(ranking=points, id__gt=profile_id)
+
+
+def get_leaderboard(limit, after=None, scores=None):
+    """
+    Returns a page of the leaderboard
+    :param limit: the maximal number of entries
+    :param after: the cursor of the last entry of the previous page
+    :param scores: a queryset of course or category scores, by default the
+                   global ranking of the profiles is used
+    :return: the list of entries and the cursor of the next page or None
+    """
+    profiles = scores if scores is not None else Profile.objects.all()
+    profiles = profiles.order_by(*LEADERBOARD_ORDER)
+    if after is not None:
+        profiles = profiles.filter(_behind(*parse_cursor(after)))
+    rows = _get_rows(profiles[:limit + 1])
+    entries = [entry for _, entry in rows[:limit]]
+    if len(rows) > limit:
+        row_id, entry = rows[limit - 1]
+        return entries, get_cursor(entry['ranking'], row_id)
+    return entries, None
+
+
+def get_rank(profile):
+    """
+    Counts the profiles ahead of a user. The count only reads the covering
+    (ranking, id) index, no rows are loaded. The B-trees of SQLite and
+    PostgreSQL don't store the sizes of their subtrees, so the count still
+    walks the index entries ahead of the user: the lookup is O(log n + rank),
+    not O(log n).
+    :param profile: the profile of a user
+    :return: the position of the user in the leaderboard starting at 1
+    """
+    return Profile.objects.filter(
+        _ahead(profile.ranking, profile.id)).count() + 1
+
+
+def get_neighbours(profile, count, rank):
+    """
+    Returns the leaderboard around a user
+    :param profile: the profile of the user
+    :param count: the number of entries before and after the user
+    :param rank: the rank of the user as returned by get_rank
+    :return: the entries including the user, every entry has its rank
+    """
+    above = get_entries(Profile.objects.filter(
+        _ahead(profile.ranking, profile.id)).order_by('ranking', 'id')[:count])
+    below = get_entries(Profile.objects.filter(
+        _behind(profile.ranking, profile.id)).order_by(
+        *LEADERBOARD_ORDER)[:count])
+    entries = above[::-1] + [{
+        'name': profile.user.username,
+        'id': profile.id,
+        'ranking': profile.ranking,
+        'avatar': get_avatar_thumbnail(profile.avatar_id)}] + below
+    first = rank - len(above)
+    for i, entry in enumerate(entries):
+        entry['rank'] = first + i
+    return entries
@@ -0,0 +1,95 @@
+"""
+module resolving the roles of the users. The roles are the names of the groups
+of a user ('moderator', 'admin'). They are loaded with a single query and
+kept in the 'roles' cache, so the permission checks of the following requests
+don't query the database. Users authenticated by a json web token carry their
+roles in the token (see the tokens module).
+
+The cached roles of a user are discarded whenever the group membership of the
+user changes. The cache is local to each process, so the timeout of the cache
+bounds how long other processes may use outdated roles.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+CACHE_NAME = 'roles'
+
+MODERATOR = 'moderator'
+ADMIN = 'admin'
+
+
+def get_key(user_id):
+    """
+    :param user_id: the id of a user
+    :return: the cache key of the roles of the user
+    """
+    return 'roles:{}'.format(user_id)
+
+
+def get_roles(user):
+    """
+    :param user: the user
+    :return: the frozenset of the group names of the user
+    """
+    if user is None or user.id is None:
+        return frozenset()
+    # users authenticated by a json web token carry their roles
+    if getattr(user, 'token_roles', None) is not None:
+        return user.token_roles
+    cache = caches[CACHE_NAME]
+    key = get_key(user.id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, roles)
+    return roles
+
+
+def is_mod(user):
+    """
+    :param user: the user
+    :return: True iff the user is in the group moderator
+    """
+    return MODERATOR in get_roles(user)
+
+
+def is_admin(user):
+    """
+    :param user: the user
+    :return: True iff the user is in the group admin
+    """
+    return ADMIN in get_roles(user)
+
+
+def is_mod_or_admin(user):
+    """
+    :param user: the user
+    :return: True iff the user is in the group moderator or admin
+    """
+    return not get_roles(user).isdisjoint((MODERATOR, ADMIN))
+
+
+def invalidate(user_ids):
+    """
+    Discards the cached roles of users
+    :param user_ids: the ids of the users
+    """
+    caches[CACHE_NAME].delete_many([get_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def discard_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Discards the cached roles of the users whose groups changed
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate([instance.id])
+    elif pk_set is not None:
+        invalidate(pk_set)
+    else:
+        # the members of a cleared group are unknown
+        caches[CACHE_NAME].clear()
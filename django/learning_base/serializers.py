@@ -3,16 +3,14 @@ module containing all serializers
 """
 
 from django.contrib.auth.models import User
+from django.urls import reverse
 
 from rest_framework import serializers
-from rest_framework.exceptions import ParseError
 
-from .info.serializer import InformationYoutubeSerializer, \
-    InformationTextSerializer
-from .multiple_choice.serializer import \
-    MultipleChoiceQuestionSerializer
 from .models import Question, CourseCategory, Module, Course, QuizQuestion, \
-    QuizAnswer, LearningGroup, Try, Profile
+    QuizAnswer, LearningGroup, Try, Profile, CourseProgress, Avatar
+from .course_tree import CourseTree, get_progress, load_structure
+from . import content_cache, course_save
 
 
 def get_answer_serializer(obj):
@@ -47,54 +45,34 @@ class QuestionSerializer(serializers.ModelSerializer):
         course_module = obj.module
         value = super(QuestionSerializer, self).to_representation(obj)
         value['type'] = obj.__class__.__name__
-        user = self.context['request'].user
-
-        # calculate the current progress of the user in a array of arrays
-        # the outer array is the module and the inner
-        # is the title of the quesiton
-        # e.g [['question 1', 'question, 2'], ['quesiton 3']]
-        value['progress'] = []
-        answered_question_before = True
-        for course_module in obj.module.course.module_set.all():
-            module_set = []
-            for question in course_module.question_set.all():
-                if answered_question_before and question.try_set.filter(
-                        solved=True, user=user).exists():
-                    module_set.append({'solved': True, 'title': question.title})
 
-                else:
-                    answered_question_before = False
-                    module_set.append({'solved': False, 'title': question.title})
-            value['progress'].append(module_set)
+        # a question serialized as part of the course content uses the
+        # preloaded tree, the user specific fields are added by
+        # content_cache.add_progress
+        tree = self.context.get('tree')
+        if tree is not None:
+            solved = None
+            value['progress'] = None
+            value['last_question'] = tree.is_last_question(obj)
+            value['last_module'] = tree.is_last_module(course_module)
+        else:
+            # the solved questions are read from the progress of the user
+            user = self.context['request'].user
+            solved = CourseProgress.get_for(
+                user, course_module.course_id).solved_questions()
+            value['progress'] = get_progress(
+                load_structure(course_module.course), solved)
+            value['last_question'] = obj.is_last_question()
+            value['last_module'] = course_module.is_last_module()
 
-        value['last_question'] = obj.is_last_question()
-        value['last_module'] = course_module.is_last_module()
         value['learning_text'] = course_module.learning_text
         serializer = obj.get_serializer()
         value['question_body'] = serializer(obj).data
 
-        value['solved'] = obj.try_set.filter(solved=True, user=user).exists()
+        value['solved'] = None if solved is None else obj.id in solved
 
         return value
 
-    def create(self, validated_data):
-        """
-        Serializer that governs the dispatch to specific class serializers
-        :param validated_data: the data to be serialized
-        :return: serialized representation
-        """
-        question_type = validated_data.pop('type')
-        if question_type == 'multiple_choice':
-            MultipleChoiceQuestionSerializer().create(validated_data)
-        elif question_type == 'info_text':
-            InformationTextSerializer().create(validated_data)
-        elif question_type == 'info_text_youtube':
-            InformationYoutubeSerializer().create(validated_data)
-        else:
-            raise ParseError(
-                detail='{} is not a valid question type'.format(
-                    question_type))
-
 
 class QuestionEditSerializer(serializers.ModelSerializer):
     """
@@ -172,53 +150,17 @@ class ModuleSerializer(serializers.ModelSerializer):
 
         value = super(ModuleSerializer, self).to_representation(obj)
 
-        questions = Question.objects.filter(module=obj)
+        tree = self.context.get('tree')
+        if tree is not None:
+            questions = tree.questions_of(obj)
+        else:
+            questions = Question.objects.filter(module=obj)
         questions = QuestionSerializer(
             questions, many=True, read_only=True, context=self.context).data
 
         value['questions'] = questions
         return value
 
-    def create(self, validated_data):
-        """
-        This method is used to save modules and their respective questions
-        """
-        questions = validated_data.pop('questions')
-
-        if questions is None or len(questions) is 0:
-            raise ParseError(detail='empty module is not allowed', code=None)
-
-        module = Module(**validated_data)
-        module.course = validated_data['course']
-        module.save()
-
-        question_id = []
-        # create a array with the ids for all questions of this module
-        for quest in questions:
-            if 'id' in quest:
-                question_id.append(quest['id'])
-
-        # check if this is a edit or creation of a new module
-        if question_id:
-            # get all questions for the current module
-            query_questions = Question.objects.filter(
-                module_id=validated_data['id'])
-            # iterate over the questions and if the questions does not exist in
-            # the edited module it will be removed
-            for question in query_questions:
-                if question.id not in question_id:
-                    question.delete()
-
-        for question in questions:
-            question['module'] = module
-            question_serializer = QuestionSerializer(data=question)
-            if not question_serializer.is_valid():
-                raise ParseError(
-                    detail='Error in question serialization', code=None)
-            else:
-                question_serializer.create(question)
-
-
 class CourseSerializer(serializers.ModelSerializer):
     """
     A serializer to view courses
@@ -239,112 +181,55 @@ class CourseSerializer(serializers.ModelSerializer):
         :return: a json serialization
         """
 
+        user = self.context['request'].user
+        content = content_cache.get_course_content(obj)
+        solved = CourseProgress.get_for(user, obj).solved_questions()
+        return content_cache.add_progress(content, solved)
+
+    def get_content(self, obj):
+        """
+        Serializes the user independent content of a course, which is cached
+        by the content_cache module.
+        :param obj: the course to be serialized
+        :return: the content, see content_cache.get_course_content
+        """
         value = super(CourseSerializer, self).to_representation(obj)
 
-        all_modules = obj.module_set.all()
-        modules = ModuleSerializer(all_modules, many=True, read_only=True,
-                                   context=self.context).data
+        # load the whole course at once and pass it down to the modules
+        # and questions
+        tree = CourseTree(obj)
+        modules = ModuleSerializer(tree.modules, many=True, read_only=True,
+                                   context={'tree': tree}).data
 
         value['modules'] = modules
-
-        num_questions = 0
-        num_answered = 0
-        count_question = 0
-        count_module = 0
-        for module in modules:
-            count_module += 1
-            for question in module['questions']:
-                count_question += 1
-                if question['solved']:
-                    num_answered += 1
+        value['num_questions'] = sum(
+            len(module['questions']) for module in modules)
+        value['responsible_mod'] = obj.responsible_mod_id
+
+        answers = []
+        for module in tree.modules:
+            answers.append([])
+            for question in tree.questions_of(module):
+                if hasattr(question, 'answer_set'):
+                    answers[-1].append([get_answer_serializer(answer)
+                                        for answer in question.answer_set()])
                 else:
-                    value['next_question'] = count_question
-                    value['current_module'] = count_module
-                num_questions += 1
-        value['num_answered'] = num_answered
-        value['num_questions'] = num_questions
-        value['responsible_mod'] = obj.responsible_mod.id
-        return value
+                    answers[-1].append(None)
+
+        return {'course': value,
+                'structure': tree.structure(),
+                'answers': answers,
+                'quiz': obj.quizquestion_set.exists()}
 
     def create(self, validated_data):
         """
         This method is used to save courses together with all modules and
-        questions.
+        questions. Only the changes to the stored course are written, see
+        the course_save module.
         :param validated_data: valid data for the Course object
+        :return: the saved course
         """
-        modules = validated_data.pop('modules')
-        quiz_data = []
-        if 'quiz' in validated_data:
-            quiz_data = validated_data.pop('quiz')
-
-        # check if course is empty and raise error if so
-        if not modules:
-            raise ParseError(detail='Course needs to have at least one module',
-                             code=None)
-        category = validated_data.pop('category')
-        category = CourseCategory.objects.get(name=category)
-        validated_data['category'] = category
-        course = Course(**validated_data)
-        course.save()
-
-        # add quiz to a course
-        if quiz_data and len(quiz_data) >= 5:
-            try:
-                if 5 <= len(quiz_data) <= 20:
-                    quiz_id = [q['id'] for q in quiz_data if 'id' in q.keys()]
-                    for quiz in course.quizquestion_set.all():
-                        if quiz.id not in quiz_id:
-                            quiz.delete()
-                    for quiz in quiz_data:
-                        quiz_serializer = QuizSerializer(data=quiz)
-                        if not quiz_serializer.is_valid():
-                            raise ParseError(
-                                detail=str(quiz_serializer.errors),
-                                code=None)
-                        else:
-                            quiz['course'] = course
-                            quiz_serializer.create(quiz)
-            except ParseError as error:
-                if 'id' not in validated_data:
-                    course.delete()
-                raise ParseError(detail=error.detail, code=None)
-        else:
-            for quiz in course.quizquestion_set.all():
-                quiz.delete()
-
-        # create a array with the ids for all module ids of this course
-        module_id = []
-        for course_module in modules:
-            if 'id' in course_module:
-                module_id.append(course_module['id'])
-
-        # check if this is a edit or creation of a new course
-        if module_id:
-            # get all modules for the current course
-            module_query = Module.objects.filter(
-                course_id=validated_data['id'])
-            # iterate over the modules and if the modules does not exist in the
-            # edited course it will be removed
-            for course_module in module_query:
-                if course_module.id not in module_id:
-                    course_module.delete()
-
-        try:
-            if len(modules) <= 0:
-                raise ParseError(detail='no Empty course allowed', code=None)
-            for module in modules:
-                module_serializer = ModuleSerializer(data=module)
-                if not module_serializer.is_valid():
-                    raise ParseError(
-                        detail='Error in module serialization', code=None)
-                else:
-                    module['course'] = course
-                    module_serializer.create(module)
-            return True
-        except ParseError as error:
-            if 'id' not in validated_data:
-                course.delete()
-            raise ParseError(detail=error.detail, code=None)
+        return course_save.save_course(validated_data)
 
 
 class CourseEditSerializer(serializers.ModelSerializer):
@@ -389,34 +274,6 @@ class QuizSerializer(serializers.ModelSerializer):
         model = QuizQuestion
         fields = ('question', 'image', 'id',)
 
-    def create(self, validated_data):
-        """
-        method creating a Quiz object form a json input
-        :param validated_data: validated json data for the object
-        """
-        if 'answers' not in validated_data:
-            raise ParseError(detail='The quiz has no answers',
-                             code=None)
-        answers = validated_data.pop('answers')
-        quiz = QuizQuestion(**validated_data)
-        quiz.save()
-        try:
-            if len(answers) != 4:
-                raise ParseError(detail='Quiz must have 4 answers', code=None)
-            for ans in answers:
-                quiz_answer_serializer = QuizAnswerSerializer(data=ans)
-                if not quiz_answer_serializer.is_valid():
-                    raise ParseError(detail=str(quiz_answer_serializer.errors),
-                                     code=None)
-                else:
-                    ans['quiz'] = quiz
-                    quiz_answer_serializer.create(ans)
-            if not quiz.is_solvable():
-                raise ParseError(detail='This quiz is not solvable', code=None)
-        except ParseError as error:
-            quiz.delete()
-            raise ParseError(detail=error.detail, code=None)
-
     def to_representation(self, obj):
         """
         representation of a Quiz object
@@ -440,14 +297,6 @@ class QuizAnswerSerializer(serializers.ModelSerializer):
         model = QuizAnswer
         fields = ('text', 'img', 'id')
 
-    def create(self, validated_data):
-        """
-        method creating a QuizAnswer object form a json input
-        :param validated_data: validated json data for the object
-        """
-        quiz_answer = QuizAnswer(**validated_data)
-        quiz_answer.save()
-
     def to_representation(self, obj):
         """
         representation of a Quiz object
@@ -472,6 +321,29 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ('name', 'id')
 
 
+def get_avatar_url(digest, thumbnail=False):
+    """
+    :param digest: the hash of an avatar
+    :param thumbnail: whether the url of the thumbnail is returned
+    :return: the url the avatar is served from
+    """
+    return reverse('avatar-thumbnail' if thumbnail else 'avatar',
+                   kwargs={'digest': digest})
+
+
+def store_avatar(data_uri):
+    """
+    Stores an uploaded avatar
+    :param data_uri: the avatar as base64 data uri
+    :return: the Avatar object
+    :raise: ValidationError if the avatar is not a valid image
+    """
+    try:
+        return Avatar.store(data_uri)
+    except ValueError as error:
+        raise serializers.ValidationError({'avatar': str(error)})
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Model serializer for the User model
@@ -497,10 +369,12 @@ class UserSerializer(serializers.ModelSerializer):
 
         if 'language' not in value:
             value['language'] = 'en'
-        profile = Profile.objects.filter(user=obj).first()
+        profile = obj.profile
         value['language'] = profile.language
 
-        value['avatar'] = profile.avatar
+        # listings only show the thumbnail of the avatar
+        value['avatar'] = get_avatar_url(profile.get_avatar_digest(),
+                                         self.context.get('thumbnail', False))
         value['ranking'] = profile.ranking
         return value
 
@@ -516,7 +390,8 @@ class UserSerializer(serializers.ModelSerializer):
             validated_data['language'] = 'en'
         profile_data['language'] = validated_data.pop('language')
         if 'avatar' in validated_data:
-            profile_data['avatar'] = validated_data.pop('avatar')
+            profile_data['avatar'] = store_avatar(
+                validated_data.pop('avatar'))
         # if 'language' in profile_data:
         #    profile_data['language'] = validated_data.pop('language')
         user = User.objects.create_user(**validated_data)
@@ -538,7 +413,7 @@ class UserSerializer(serializers.ModelSerializer):
         # profile.language = validated_data['language']
         if 'avatar' in validated_data:
             profile = instance.profile
-            profile.avatar = validated_data['avatar']
+            profile.avatar = store_avatar(validated_data['avatar'])
             profile.save()
         instance.save()
 
@@ -592,6 +467,7 @@ class RankingSerializer(serializers.BaseSerializer):
             value.append({
                 'name': profile.user.username,
                 'id': profile.id,
-                'ranking': profile.ranking
+                'ranking': profile.ranking,
+                'avatar': get_avatar_url(profile.get_avatar_digest(), True)
             })
         return value
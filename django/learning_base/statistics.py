@@ -0,0 +1,310 @@
+"""
+module containing the statistics queries over the tries. The tries are
+grouped and counted by the database, only the labels of the groups are
+converted to strings in python.
+
+Counts that don't depend on the user can be served from the daily rollups
+(DailyTryCount). The rollups cover all days before get_rollup_end, the tries
+of later days are counted directly.
+"""
+import csv
+import datetime
+import zlib
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Sum, Max, Min, Case, When, \
+    IntegerField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Course, CourseCategory, Question, Try, DailyTryCount, \
+    Profile
+
+
+def _user_labels(ids):
+    return {user_id: str(name) for user_id, name in
+            User.objects.filter(id__in=ids).values_list('id', 'username')}
+
+
+def _question_labels(ids):
+    # the labels depend on the question type, so the real instances are used
+    return {question.id: str(question)
+            for question in Question.objects.filter(id__in=ids)}
+
+
+def _course_labels(ids):
+    return {course.id: str(course)
+            for course in Course.objects.filter(id__in=ids)}
+
+
+def _category_labels(ids):
+    return {category.id: str(category)
+            for category in CourseCategory.objects.filter(id__in=ids)}
+
+
+# the dimensions the tries can be grouped by. Every dimension maps to the
+# grouped field and a function loading the labels of the grouped ids.
+DIMENSIONS = {
+    'user': ('user_id', _user_labels),
+    'user_hash': ('user__profile__user_hash', None),
+    'question': ('question_id', _question_labels),
+    'solved': ('solved', None),
+    'date': ('date', None),
+    'course': ('question__module__course_id', _course_labels),
+    'category': ('question__module__course__category_id', _category_labels),
+}
+
+# the number of csv rows written at once by the export
+CSV_CHUNK_ROWS = 500
+
+# the grouped fields of the dimensions that can be counted from the rollups
+ROLLUP_FIELDS = {
+    'question': 'question_id',
+    'course': 'course_id',
+    'category': 'category_id',
+}
+
+
+def get_rollup_end():
+    """
+    :return: the first day that is not aggregated or None if there are no
+             rollups
+    """
+    last = DailyTryCount.objects.aggregate(last=Max('day'))['last']
+    return last + datetime.timedelta(days=1) if last else None
+
+
+def start_of(day):
+    """
+    :return: the aware datetime of the beginning of a day
+    """
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time()))
+
+
+def parse_day(value):
+    """
+    :param value: a date string of a statistics request
+    :return: the date if the string is a whole day (YYYY-MM-DD), else None
+    """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def rollup_tries(start=None, end=None):
+    """
+    Aggregates the tries of the days from start until end (exclusive) into
+    the daily rollups. The rollups of these days are replaced.
+    :param start: the first day, by default the first day that is not
+                  aggregated yet
+    :param end: the day after the last day, by default today
+    :return: the number of created rollups
+    """
+    if end is None:
+        end = timezone.localdate()
+    if start is None:
+        start = get_rollup_end()
+    if start is None:
+        first = Try.objects.aggregate(first=Min('date'))['first']
+        if first is None:
+            return 0
+        start = timezone.localtime(first).date()
+    groups = Try.objects.filter(
+        date__gte=start_of(start), date__lt=start_of(end)
+    ).annotate(day=TruncDate('date')).order_by().values(
+        'day', 'question_id', 'question__module__course_id',
+        'question__module__course__category_id'
+    ).annotate(
+        num_tries=Count('id'),
+        num_solved=Sum(Case(When(solved=True, then=1), default=0,
+                            output_field=IntegerField())),
+        num_users=Count('user', distinct=True))
+    rollups = [DailyTryCount(
+        day=group['day'],
+        question_id=group['question_id'],
+        course_id=group['question__module__course_id'],
+        category_id=group['question__module__course__category_id'],
+        tries=group['num_tries'],
+        solved=group['num_solved'],
+        users=group['num_users']) for group in groups]
+    with transaction.atomic():
+        DailyTryCount.objects.filter(day__gte=start, day__lt=end).delete()
+        DailyTryCount.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def _count_rollups(rollups, field, solved):
+    """
+    Counts the tries of the rollups per value of a field
+    :param rollups: a queryset of rollups
+    :param field: the grouped field or None to group by the solved flag
+    :param solved: None to count all tries, otherwise only the tries with
+                   this solved flag are counted
+    :return: a list of tuples of the value and the count
+    """
+    if field is None:
+        totals = rollups.aggregate(tries=Sum('tries'), solved=Sum('solved'))
+        counts = {True: totals['solved'] or 0,
+                  False: (totals['tries'] or 0) - (totals['solved'] or 0)}
+        return [(key, counter) for key, counter in counts.items()
+                if counter and solved in (None, key)]
+    groups = rollups.order_by().values_list(field).annotate(
+        num_tries=Sum('tries'), num_solved=Sum('solved'))
+    if solved is None:
+        counts = [(key, num_tries) for key, num_tries, _ in groups]
+    elif solved:
+        counts = [(key, num_solved) for key, _, num_solved in groups]
+    else:
+        counts = [(key, num_tries - num_solved)
+                  for key, num_tries, num_solved in groups]
+    return [(key, counter) for key, counter in counts if counter]
+
+
+def _split(tries, rollups, field, solved):
+    """
+    Counts the days covered by the rollups from the rollups and the tries of
+    later days directly
+    :return: the remaining tries and the counts of the rollups
+    """
+    end = get_rollup_end() if rollups is not None else None
+    if end is None:
+        return tries, []
+    counts = _count_rollups(rollups.filter(day__lt=end), field, solved)
+    return tries.filter(date__gte=start_of(end)), counts
+
+
+def count_by(tries, dimension, rollups=None, solved=None):
+    """
+    Counts the tries per value of a dimension
+    :param tries: a queryset of tries
+    :param dimension: one of the keys of DIMENSIONS
+    :param rollups: the rollups matching the tries or None if the tries
+                    need to be counted directly
+    :param solved: the solved flag the tries were filtered with
+    :return: a dictionary mapping the string of the values to the counts
+    :raise: ValueError if the dimension is unknown
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError('unknown dimension {}'.format(dimension))
+    field, get_labels = DIMENSIONS[dimension]
+    counts = []
+    if dimension in ROLLUP_FIELDS or dimension == 'solved':
+        tries, counts = _split(tries, rollups, ROLLUP_FIELDS.get(dimension),
+                               solved)
+    groups = counts + list(tries.order_by().values_list(field).annotate(
+        counter=Count('id')))
+    labels = {}
+    if get_labels is not None:
+        labels = get_labels(set(key for key, _ in groups if key is not None))
+    value = OrderedDict()
+    for key, counter in groups:
+        label = labels.get(key, str(key))
+        # different values may have the same string (e.g. question titles)
+        value[label] = value.get(label, 0) + counter
+    return value
+
+
+def count_per_category(tries, rollups=None, solved=None):
+    """
+    Counts the tries per course category
+    :param tries: a queryset of tries
+    :param rollups: the rollups matching the tries or None if the tries
+                    need to be counted directly
+    :param solved: the solved flag the tries were filtered with
+    :return: a list of dictionaries with the name, color and counter of
+             every category
+    """
+    tries, counts = _split(tries, rollups, 'category_id', solved)
+    counters = {}
+    for key, counter in counts + list(tries.order_by().values_list(
+            'question__module__course__category').annotate(
+            counter=Count('id'))):
+        counters[key] = counters.get(key, 0) + counter
+    return [{'name': category.name,
+             'color': category.color,
+             'counter': counters.get(category.id, 0)}
+            for category in CourseCategory.objects.all()]
+
+
+def count_per_question(course):
+    """
+    Counts the solved and unsolved tries of every question of a course
+    :param course: the course
+    :return: a list per module containing the name and the counters of
+             every question
+    """
+    counters = {}
+    for question_id, solved, counter in Try.objects.filter(
+            question__module__course=course).order_by().values_list(
+            'question_id', 'solved').annotate(counter=Count('id')):
+        counters[question_id, solved] = counter
+    questions = Question.objects.non_polymorphic().filter(
+        module__course=course).values_list('module_id', 'id', 'title')
+    per_module = {}
+    for module_id, question_id, title in questions:
+        per_module.setdefault(module_id, []).append({
+            'name': title,
+            'solved': counters.get((question_id, True), 0),
+            'not solved': counters.get((question_id, False), 0)})
+    return [per_module.get(module_id, [])
+            for module_id in course.module_set.values_list('id', flat=True)]
+
+
+class _Echo(object):
+    """
+    A file like object returning the written value instead of storing it,
+    so the csv writer can format single rows
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(tries):
+    """
+    Generates the csv export of tries with the question, the hash of the
+    user, the date and whether the try was solved. The tries are read in
+    chunks by the database cursor and the rows are generated in chunks, so
+    the memory does not grow with the number of tries. The hashes of the
+    users are read from their profiles.
+    :param tries: a queryset of tries
+    :return: a generator of strings containing several rows
+    """
+    writer = csv.writer(_Echo())
+    labels = _question_labels(set(tries.order_by().values_list(
+        'question_id', flat=True).distinct()) - {None})
+    lines = [writer.writerow(['question', 'user', 'date', 'solved'])]
+    for question_id, user_hash, username, date, solved in tries.values_list(
+            'question_id', 'user__profile__user_hash', 'user__username',
+            'date', 'solved').iterator():
+        # users without a profile don't have a stored hash
+        if not user_hash and username is not None:
+            user_hash = Profile.hash_username(username)
+        lines.append(writer.writerow([
+            labels.get(question_id, ''),
+            user_hash or '',
+            timezone.localtime(date).strftime('%d/%m/%Y') if date else '',
+            solved]))
+        if len(lines) >= CSV_CHUNK_ROWS:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a generator of strings into a gzip stream
+    :param chunks: the generator of strings
+    :return: a generator of compressed bytes
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,177 @@
+"""
+module grading several answers to the questions of a course at once. Clients
+on poor connections and offline clients syncing their queued answers submit
+them in a single request instead of one request per question.
+
+The submissions are graded in order, so a solved question unlocks the
+following ones for the rest of the batch. The questions are loaded with a
+fixed number of queries, the tries are written with one insert (see
+try_journal) and the ranking is increased once by the points of the whole
+batch.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import access, ranking, statistics, try_journal
+from .models import Question, Try
+
+# the maximal number of submissions of a single request
+MAX_SUBMISSIONS = 100
+
+# how long offline clients may queue their answers, older dates are replaced
+# by the time of the submission
+SYNC_WINDOW = datetime.timedelta(days=7)
+
+
+def get_earliest_date():
+    """
+    :return: the earliest date accepted from offline clients. Days that are
+             aggregated by the statistics are not accepted, their tries would
+             not be counted.
+    """
+    earliest = timezone.now() - SYNC_WINDOW
+    rollup_end = statistics.get_rollup_end()
+    if rollup_end is not None:
+        earliest = max(earliest, statistics.start_of(rollup_end))
+    return earliest
+
+
+def _parse(item, earliest):
+    """
+    :param item: a submission of the request
+    :param earliest: the earliest accepted date of an answer
+    :return: a tuple of the module index, the question index, the answers
+             and the date of the answer
+    :raise: ValueError if the submission is malformed
+    """
+    if not isinstance(item, dict) or 'answers' not in item:
+        raise ValueError('invalid submission')
+    try:
+        module_index = int(item['module'])
+        question_index = int(item['question'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('invalid position')
+    if module_index < 0 or question_index < 0:
+        raise ValueError('invalid position')
+    now = timezone.now()
+    date = now
+    # offline clients send the time the question was answered
+    if item.get('date') is not None:
+        try:
+            date = parse_datetime(str(item['date']))
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValueError('invalid date')
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.utc)
+        if not earliest <= date <= now:
+            date = now
+    return module_index, question_index, item['answers'], date
+
+
+def _load_questions(course, structure, items):
+    """
+    Loads the submitted questions of a course
+    :param course: the course
+    :param structure: the question ids of the course, see
+                      course_tree.load_structure
+    :param items: the parsed submissions
+    :return: a dictionary mapping the ids to the questions
+    """
+    ids = set()
+    for module_index, question_index, _, _ in items:
+        if (module_index < len(structure)
+                and question_index < len(structure[module_index])):
+            ids.add(structure[module_index][question_index][0])
+    if not ids:
+        return {}
+    modules = {module.id: module for module in course.module_set.all()}
+    questions = {}
+    for question in Question.objects.filter(id__in=ids):
+        question.module = modules[question.module_id]
+        question.module.course = course
+        questions[question.id] = question
+    return questions
+
+
+def submit(user, course, data):
+    """
+    Grades the answers of a user to several questions of a course. Every
+    question has to be accessible when it is graded, questions solved by an
+    earlier submission of the batch count.
+    :param user: the user
+    :param course: the course
+    :param data: the list of submissions, each a dictionary of the 'module'
+                 and 'question' index (as in the question urls), the
+                 'answers' and optionally the 'date' of the answer, which
+                 is used if it lies between get_earliest_date and now
+    :return: the list of results, either the 'evaluate' result (and the
+             'feedback' of solved questions) or an 'error' per submission
+    :raise: ValueError if the data is not a list of at most MAX_SUBMISSIONS
+            submissions
+    """
+    if not isinstance(data, list):
+        raise ValueError('the submissions have to be a list')
+    if len(data) > MAX_SUBMISSIONS:
+        raise ValueError('at most {} submissions are accepted'.format(
+            MAX_SUBMISSIONS))
+    items = []
+    earliest = get_earliest_date()
+    for item in data:
+        try:
+            items.append(_parse(item, earliest))
+        except ValueError as error:
+            items.append(error)
+
+    structure = access.get_structure(course)
+    questions = _load_questions(
+        course, structure,
+        [item for item in items if not isinstance(item, ValueError)])
+
+    def grade(progress):
+        results = []
+        tries = []
+        points = 0
+        for item in items:
+            if isinstance(item, ValueError):
+                results.append({'error': str(item)})
+                continue
+            module_index, question_index, answers, date = item
+            try:
+                question = questions[
+                    structure[module_index][question_index][0]]
+            except IndexError:
+                results.append({'error': 'Question not found'})
+                continue
+            if not progress.can_access(module_index, question_index):
+                results.append({'error': "Previous question(s) haven't been "
+                                         'answered correctly yet'})
+                continue
+            try:
+                solved = question.evaluate(answers)
+            except (KeyError, TypeError):
+                results.append({'error': 'invalid answers'})
+                continue
+            if solved and access.add_solved_question(progress, course,
+                                                     question):
+                points += question.get_points()
+            tries.append(Try(user=user, question=question,
+                             answer=Try.encode_answer(answers),
+                             solved=solved, date=date))
+            result = {'evaluate': solved}
+            if solved and question.feedback:
+                result['feedback'] = question.feedback
+            results.append(result)
+        return results, tries, points
+
+    with transaction.atomic():
+        # graded again if a concurrent submission changed the progress
+        _, (results, tries, points) = access.change_progress(
+            user, course, grade)
+        try_journal.record(tries)
+        ranking.award_points(user, points, course)
+    return results
@@ -1,12 +1,31 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import importlib
+import io
+import os
+import tempfile
+import unittest
+
+from django.core.cache import caches
+from django.forms.models import model_to_dict
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User, Group, UserManager
+from PIL import Image
 
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import force_authenticate
 from rest_framework.exceptions import ParseError
 
-from learning_base import views, models, serializers
+from learning_base import views, models, serializers, course_tree, \
+    content_cache, access, course_save, ranking, roles, statistics, \
+    submissions, tokens, try_journal
+from learning_base.cache import LRUCache
+from learning_base.default_picture import default_picture
 from learning_base.models import Profile
 import learning_base.multiple_choice as MultipleChoice
 import learning_base.info as InformationText
@@ -15,6 +34,8 @@ import learning_base.info as InformationText
 class DatabaseMixin():
     def setup_database(self):
         self.factory = APIRequestFactory()
+        caches[content_cache.CACHE_NAME].clear()
+        caches[roles.CACHE_NAME].clear()
 
         self.admin_group = Group.objects.create(name='admin')
         self.mod_group = Group.objects.create(name='moderator')
@@ -333,6 +354,148 @@ class CourseViewTest(DatabaseMixin, TestCase):
                 title='a question').exists())
 
 
+class CourseTreeTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def count_queries(self):
+        caches[content_cache.CACHE_NAME].clear()
+        request = self.factory.get('/courses/1')
+        force_authenticate(request, self.u1)
+        with CaptureQueriesContext(connection) as queries:
+            response = views.CourseView.as_view()(
+                request, course_id=self.c1_test_en.id)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        num_queries = self.count_queries()
+        module = models.Module(name='module_2', course=self.c1_test_en,
+                               order=2)
+        module.save()
+        for order in range(5):
+            question = MultipleChoice.models.MultipleChoiceQuestion(
+                title='question {}'.format(order), text='', order=order,
+                module=module)
+            question.save()
+            MultipleChoice.models.MultipleChoiceAnswer(
+                question=question, text='answer', is_correct=True).save()
+        self.assertEqual(num_queries, self.count_queries())
+
+    def test_tree(self):
+        tree = course_tree.CourseTree(self.c1_test_en)
+        self.assertEqual(tree.modules, [self.m1_test])
+        self.assertEqual(tree.questions_of(self.m1_test),
+                         [self.q1_test, self.q2_test, self.q3_test])
+        self.assertTrue(tree.is_last_question(self.q3_test))
+        self.assertFalse(tree.is_last_question(self.q1_test))
+        self.assertEqual(
+            course_tree.get_progress(tree.structure(), {self.q1_test.id}),
+            [[{'solved': True, 'title': ''},
+              {'solved': False, 'title': ''},
+              {'solved': False, 'title': 'youtube video'}]])
+
+
+class ContentCacheTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def get_course(self):
+        request = self.factory.get('/courses/1')
+        force_authenticate(request, self.u1)
+        return views.CourseView.as_view()(request,
+                                          course_id=self.c1_test_en.id)
+
+    def test_cached_content(self):
+        self.assertEqual(self.get_course().data['name'], 'test_1')
+        # changes without a version bump are not visible
+        models.Course.objects.filter(id=self.c1_test_en.id).update(
+            name='renamed')
+        self.assertEqual(self.get_course().data['name'], 'test_1')
+        self.c1_test_en.bump_version()
+        self.assertEqual(self.get_course().data['name'], 'renamed')
+
+    def test_toggle_visibility(self):
+        self.assertTrue(self.get_course().data['is_visible'])
+        request = self.factory.post('/courses/1/toggleVisibility')
+        force_authenticate(request, self.u1)
+        views.ToggleCourseVisibilityView.as_view()(
+            request, course_id=str(self.c1_test_en.id))
+        self.assertFalse(self.get_course().data['is_visible'])
+
+    def test_answer_keys(self):
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        question = course.get_question(0, 0)
+        self.assertTrue(question.evaluate([self.a2_test.id]))
+        # grading reads the cached answer key
+        with self.assertNumQueries(0):
+            self.assertFalse(question.evaluate([self.a1_test.id]))
+            self.assertTrue(question.evaluate([self.a2_test.id]))
+        self.a1_test.is_correct = True
+        self.a1_test.save()
+        course.bump_version()
+        self.assertTrue(question.evaluate([self.a1_test.id, self.a2_test.id]))
+
+    def test_single_changes(self):
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        question = course.get_question(0, 0)
+        self.assertFalse(question.evaluate([self.a1_test.id]))
+        # changes outside of the course save (e.g. in the admin) increase
+        # the version of the course
+        self.a1_test.is_correct = True
+        self.a1_test.save()
+        course.refresh_from_db()
+        self.assertTrue(course.get_question(0, 0).evaluate(
+            [self.a1_test.id, self.a2_test.id]))
+        version = course.version
+        self.q2_test.delete()
+        course.refresh_from_db()
+        self.assertEqual(version + 1, course.version)
+
+    def test_admin_changes(self):
+        self.assertEqual(self.get_course().data['name'], 'test_1')
+        admin = User.objects.create_superuser(
+            'superuser', 'superuser@example.com', 'password')
+        self.client.force_login(admin)
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        data = {key: '' if value is None else value
+                for key, value in model_to_dict(course).items()}
+        data['name'] = 'renamed'
+        response = self.client.post(reverse(
+            'admin:learning_base_course_change', args=[course.id]), data)
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(self.get_course().data['name'], 'renamed')
+
+        # the course of a new quiz question and the courses of a renamed
+        # category are changed as well
+        version = models.Course.objects.get(id=course.id).version
+        models.QuizQuestion.objects.create(course=course, question='quiz')
+        self.category.name = 'renamed'
+        self.category.save()
+        self.assertEqual(version + 2, models.Course.objects.get(
+            id=course.id).version)
+
+    def test_stale_instance(self):
+        # saving an instance loaded before an increase keeps the version
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        self.c1_test_en.bump_version()
+        course.save()
+        self.assertEqual(self.c1_test_en.version + 1, models.Course.objects
+                         .get(id=course.id).version)
+
+    def test_lru_cache(self):
+        cache = LRUCache('test', {'OPTIONS': {'MAX_ENTRIES': 2}})
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertFalse(cache.add('c', 4))
+        cache.clear()
+
+
 class CourseEditViewTest(DatabaseMixin, TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -651,10 +814,102 @@ class RequestViewTest(DatabaseMixin, TestCase):
         self.assertFalse(self.mod_group in self.u1.groups.all())
 
 
+class RolesTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_cached_roles(self):
+        self.assertTrue(roles.is_admin(self.u1))
+        self.assertFalse(roles.is_mod(self.u1))
+        self.assertTrue(roles.is_mod_or_admin(self.moderator))
+        self.assertFalse(roles.is_mod_or_admin(self.normal_user))
+        self.assertFalse(roles.is_admin(None))
+        # the roles are not loaded again
+        with self.assertNumQueries(0):
+            self.assertTrue(self.u1.profile.is_admin())
+            self.assertTrue(self.moderator.profile.is_mod())
+
+    def test_invalidate(self):
+        self.assertFalse(roles.is_mod(self.normal_user))
+        request = self.factory.post(
+            'user/{}/rights'.format(self.normal_user.id),
+            {'right': 'moderator', 'action': 'promote'}, format='json')
+        force_authenticate(request, self.u1)
+        response = views.UserRightsView.as_view()(
+            request, user_id=self.normal_user.id)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(roles.is_mod(self.normal_user))
+        self.mod_group.user_set.remove(self.normal_user)
+        self.assertFalse(roles.is_mod(self.normal_user))
+
+
+class TokenTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.u1.set_password('secret')
+        self.u1.save()
+
+    def get_user(self, token):
+        request = self.factory.get('user/current',
+                                   HTTP_AUTHORIZATION='JWT ' + token)
+        return views.UserView.as_view()(request)
+
+    def test_issue(self):
+        request = self.factory.post('api-auth', {
+            'username': 'admin', 'password': 'secret'}, format='json')
+        response = views.ObtainTokenView.as_view()(request)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('token', response.data)
+        response = self.get_user(response.data['jwt'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('admin', response.data['username'])
+
+    def test_claims(self):
+        token = tokens.issue(self.u1)
+        request = self.factory.get('courses/',
+                                   HTTP_AUTHORIZATION='JWT ' + token)
+        tokens.get_revocations()
+        # neither the user nor the roles are loaded, the revocations are cached
+        with self.assertNumQueries(0):
+            user, _ = tokens.ClaimsAuthentication().authenticate(request)
+            self.assertTrue(roles.is_admin(user))
+        self.assertEqual(self.u1.id, user.id)
+        self.assertEqual('admin', user.username)
+
+    def test_revoke(self):
+        token = tokens.issue(self.moderator)
+        self.assertEqual(200, self.get_user(token).status_code)
+        request = self.factory.post(
+            'user/{}/rights'.format(self.moderator.id),
+            {'right': 'moderator', 'action': 'demote'}, format='json')
+        force_authenticate(request, self.u1)
+        views.UserRightsView.as_view()(request, user_id=self.moderator.id)
+        self.assertEqual(401, self.get_user(token).status_code)
+        token = tokens.issue(self.moderator)
+        self.assertEqual(200, self.get_user(token).status_code)
+        self.assertFalse(roles.is_mod(
+            tokens.ClaimsAuthentication().authenticate_credentials(
+                tokens.jwt_payload_handler(self.moderator))))
+
+
+    def test_deactivate(self):
+        token = tokens.issue(self.normal_user)
+        self.assertEqual(200, self.get_user(token).status_code)
+        self.normal_user.is_active = False
+        self.normal_user.save()
+        self.assertEqual(401, self.get_user(token).status_code)
+
+    def test_delete(self):
+        token = tokens.issue(self.normal_user)
+        User.objects.get(id=self.normal_user.id).delete()
+        self.assertEqual(401, self.get_user(token).status_code)
+
+
 class UserRightsViewTest(DatabaseMixin, TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
         self.view = views.UserRightsView.as_view()
+        caches[roles.CACHE_NAME].clear()
 
         self.mod_group = Group.objects.create(name='moderator')
         self.admin_group = Group.objects.create(name='admin')
@@ -876,6 +1131,115 @@ class TryTest(DatabaseMixin, TestCase):
         self.assertEqual(len(response.data), 0)
 
 
+class StatisticsTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        for question, solved in [(self.q1_test, False), (self.q1_test, True),
+                                 (self.q2_test, True)]:
+            models.Try.objects.create(user=self.u1, question=question,
+                                      solved=solved)
+        models.Try.objects.create(user=self.normal_user,
+                                  question=self.q1_test, solved=True)
+
+    def post(self, data):
+        data.update({'id': self.u1.id})
+        request = self.factory.post('user/statistics/', data, format='json')
+        force_authenticate(request, self.u1)
+        return views.StatisticsView.as_view()(request)
+
+    def test_filter(self):
+        self.assertEqual({'admin': 3}, self.post({'filter': 'user'}).data)
+        self.assertEqual({'True': 2, 'False': 1},
+                         self.post({'filter': 'solved'}).data)
+        self.assertEqual({'': 2, str(self.q2_test): 1},
+                         self.post({'filter': 'question'}).data)
+        self.assertEqual({'test_1': 3}, self.post({'filter': 'course'}).data)
+        self.assertEqual({'test': 3}, self.post({'filter': 'category'}).data)
+        self.assertEqual({self.u1_profile.get_hash(): 3},
+                         self.post({'filter': 'user_hash'}).data)
+        self.assertEqual(400, self.post({'filter': 'answer'}).status_code)
+
+    def test_filter_queries(self):
+        tries = models.Try.objects.all()
+        with CaptureQueriesContext(connection) as queries:
+            statistics.count_by(tries, 'user')
+        self.assertEqual(2, len(queries))
+
+    def test_rollup(self):
+        from datetime import timedelta
+
+        old = timezone.now() - timedelta(days=3)
+        for solved in [True, False]:
+            models.Try.objects.create(user=self.normal_user,
+                                      question=self.q1_test, solved=solved,
+                                      date=old)
+        self.assertEqual(1, statistics.rollup_tries())
+        rollup = models.DailyTryCount.objects.get()
+        self.assertEqual((self.q1_test.id, self.c1_test_en.id, 2, 1, 1),
+                         (rollup.question_id, rollup.course_id, rollup.tries,
+                          rollup.solved, rollup.users))
+        self.assertEqual(0, statistics.rollup_tries())
+
+        # the aggregated tries are no longer read
+        models.Try.objects.filter(date__lt=timezone.now().date()).delete()
+        request = self.factory.post('user/statistics/',
+                                    {'filter': 'solved', 'solved': False},
+                                    format='json')
+        force_authenticate(request, self.u1)
+        response = views.StatisticsView.as_view()(request)
+        self.assertEqual({'False': 2}, response.data)
+        request = self.factory.post('user/statistics/',
+                                    {'categories__with__counter': True},
+                                    format='json')
+        force_authenticate(request, self.u1)
+        response = views.StatisticsView.as_view()(request)
+        self.assertEqual(6, response.data[0]['counter'])
+
+    def test_csv(self):
+        rows = ''.join(statistics.csv_rows(models.Try.objects.filter(
+            user=self.u1).order_by('id'))).splitlines()
+        self.assertEqual('question,user,date,solved', rows[0])
+        user_hash = self.u1_profile.get_hash()
+        date = timezone.localtime().strftime('%d/%m/%Y')
+        self.assertEqual([
+            ',{},{},False'.format(user_hash, date),
+            ',{},{},True'.format(user_hash, date),
+            '{},{},{},True'.format(self.q2_test, user_hash, date)
+        ], rows[1:])
+
+        response = self.post({'format': 'csv'})
+        self.assertEqual(4, len(b''.join(
+            response.streaming_content).splitlines()))
+        response = self.post({'format': 'csv', 'gzip': True})
+        self.assertEqual(rows, gzip.decompress(b''.join(
+            response.streaming_content)).decode().splitlines())
+
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_csv_local_date(self):
+        # half an hour after midnight in Berlin is still the day before in
+        # UTC
+        date = datetime.datetime(2018, 1, 2, 23, 30, tzinfo=timezone.utc)
+        attempt = models.Try.objects.create(
+            user=self.u1, question=self.q1_test, solved=False, date=date)
+        rows = ''.join(statistics.csv_rows(models.Try.objects.filter(
+            id=attempt.id))).splitlines()
+        self.assertEqual('03/01/2018', rows[1].split(',')[2])
+
+    def test_categories_with_counter(self):
+        self.assertEqual(
+            [{'name': 'test', 'color': '#000000', 'counter': 3}],
+            self.post({'categories__with__counter': True}).data)
+
+    def test_list_questions(self):
+        response = self.post({'course': self.c1_test_en.id,
+                              'list_questions': True})
+        self.assertEqual([[
+            {'name': '', 'solved': 2, 'not solved': 1},
+            {'name': '', 'solved': 1, 'not solved': 0},
+            {'name': 'youtube video', 'solved': 0, 'not solved': 0}
+        ]], response.data)
+
+
 class QuizTest(DatabaseMixin, TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -1333,6 +1697,56 @@ class QuizTest(DatabaseMixin, TestCase):
             quiz.create(courseData)
         self.assertFalse(models.Course.objects.filter(name='quiz_2').exists())
 
+    def test_check_answers(self):
+        submissions = []
+        for i in range(5):
+            quiz = models.QuizQuestion.objects.create(
+                question='quiz {}'.format(i), course=self.c1_test_en)
+            correct = models.QuizAnswer.objects.create(
+                text='correct', correct=True, quiz=quiz)
+            wrong = models.QuizAnswer.objects.create(
+                text='wrong', correct=False, quiz=quiz)
+            # every second question is answered wrong by choosing both
+            submissions.append({'id': quiz.id, 'answers': [
+                {'id': correct.id, 'chosen': True},
+                {'id': wrong.id, 'chosen': i % 2 == 1}]})
+        # the submissions are matched by id, not by position
+        submissions.reverse()
+        request = self.factory.post(
+            'courses/{}/quiz/'.format(self.c1_test_en.id),
+            {'type': 'check_answers', 'answers': submissions}, format='json')
+        force_authenticate(request, self.normal_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = views.QuizView.as_view()(
+                request, course_id=self.c1_test_en.id)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([True, False, True, False, True],
+                         [entry['solved'] for entry in response.data])
+        self.assertEqual(5, models.Try.objects.filter(
+            user=self.normal_user, quiz_question__isnull=False).count())
+        self.assertEqual(1, len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "learning_base_try"')]))
+
+    def test_check_empty_answers(self):
+        submissions = []
+        for i in range(5):
+            quiz = models.QuizQuestion.objects.create(
+                question='quiz {}'.format(i), course=self.c1_test_en)
+            models.QuizAnswer.objects.create(
+                text='correct', correct=True, quiz=quiz)
+            submissions.append({'id': quiz.id, 'answers': []})
+        request = self.factory.post(
+            'courses/{}/quiz/'.format(self.c1_test_en.id),
+            {'type': 'check_answers', 'answers': submissions}, format='json')
+        force_authenticate(request, self.normal_user)
+        response = views.QuizView.as_view()(
+            request, course_id=self.c1_test_en.id)
+        self.assertEqual([False] * 5,
+                         [entry['solved'] for entry in response.data])
+        self.assertEqual(0, Profile.objects.get(
+            user=self.normal_user).ranking)
+
 
 class ProfileTest(DatabaseMixin, TestCase):
     def setUp(self):
@@ -1358,6 +1772,15 @@ class ProfileTest(DatabaseMixin, TestCase):
 
         self.assertTrue(hash_u1_1 == hash_u1_2)
 
+    def test_stored_hash(self):
+        self.assertEqual(Profile.hash_username('admin'),
+                         Profile.objects.get(user=self.u1).user_hash)
+        self.u1.username = 'renamed'
+        self.u1.save()
+        profile = Profile.objects.get(user=self.u1)
+        self.assertEqual(Profile.hash_username('renamed'), profile.user_hash)
+        self.assertEqual(profile.user_hash, profile.get_hash())
+
 
 class UserViewTest(DatabaseMixin, TestCase):
     def setUp(self):
@@ -1401,7 +1824,7 @@ class UserViewTest(DatabaseMixin, TestCase):
             'email': self.test_user.email,
             'first_name': self.test_user.first_name,
             'last_name': self.test_user.last_name,
-            'avatar': self.test_user.profile.avatar,
+            'avatar': default_picture,
         })
         force_authenticate(request, self.test_user)
         response = self.view(request)
@@ -1412,7 +1835,7 @@ class UserViewTest(DatabaseMixin, TestCase):
             'email': self.test_user.email,
             'first_name': 'test first name',
             'last_name': self.test_user.last_name,
-            'avatar': self.test_user.profile.avatar,
+            'avatar': default_picture,
         })
         force_authenticate(request, self.test_user)
         response = self.view(request)
@@ -1435,7 +1858,207 @@ class UserViewTest(DatabaseMixin, TestCase):
         self.assertNotEqual(updated_user.email, 'please@dont.de')
         self.assertFalse(updated_user.first_name == 'please')
         self.assertFalse(updated_user.last_name == 'dont')
-        self.assertFalse(updated_user.profile.avatar == '...')
+        self.assertEqual(models.get_default_avatar(),
+                         updated_user.profile.get_avatar_digest())
+
+
+def create_image(size, mode='RGB'):
+    """
+    :return: a png of the given size as base64 data uri
+    """
+    output = io.BytesIO()
+    Image.new(mode, size, 'red').save(output, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        output.getvalue()).decode()
+
+
+class AvatarTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.view = views.AvatarView.as_view()
+
+    def test_migration(self):
+        migration = importlib.import_module(
+            'learning_base.migrations.0028_avatar_store')
+        # legacy avatars are processed like uploads
+        content_type, data = migration._process(create_image((800, 600)))
+        self.assertEqual('image/jpeg', content_type)
+        self.assertEqual((500, 375), Image.open(io.BytesIO(data)).size)
+        svg = 'data:image/svg+xml;base64,' + base64.b64encode(
+            b'<svg onload="alert(1)"/>').decode()
+        self.assertIsNone(migration._process(svg))
+        self.assertIsNone(migration._process('data:image/png;base64,!'))
+
+    def test_store(self):
+        image = create_image((10, 10))
+        avatar = models.Avatar.store(image)
+        self.assertEqual(avatar, models.Avatar.store(image))
+        self.assertEqual('image/png', models.Avatar.parse(image)[0])
+        with self.assertRaises(ValueError):
+            models.Avatar.store('...')
+        with self.assertRaises(ValueError):
+            models.Avatar.store('data:image/png;base64,'
+                                + base64.b64encode(b'png').decode())
+
+    def test_downscale(self):
+        avatar = models.Avatar.store(create_image((2000, 1000)))
+        # opaque images are stored as jpeg
+        self.assertEqual('image/jpeg', avatar.content_type)
+        image = Image.open(io.BytesIO(bytes(avatar.data)))
+        self.assertEqual((500, 250), image.size)
+        thumbnail = Image.open(io.BytesIO(bytes(avatar.thumbnail)))
+        self.assertEqual((64, 32), thumbnail.size)
+
+        transparent = models.Avatar.store(create_image((20, 20), 'RGBA'))
+        self.assertEqual('image/png', transparent.content_type)
+        self.assertEqual('image/png', transparent.thumbnail_type)
+
+        # thumbnails of images stored without one are created when requested
+        models.Avatar.objects.filter(id=avatar.id).update(thumbnail=None)
+        request = self.factory.get('avatars/')
+        response = views.AvatarView.as_view(thumbnail=True)(
+            request, digest=avatar.digest)
+        self.assertEqual('image/jpeg', response['Content-Type'])
+        self.assertIsNotNone(
+            models.Avatar.objects.get(id=avatar.id).thumbnail)
+
+    def test_animated(self):
+        frames = [Image.new('RGB', (20, 10), color) for color in
+                  ('red', 'blue')]
+        output = io.BytesIO()
+        frames[0].save(output, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        # the declared content type is ignored
+        avatar = models.Avatar.store(
+            'data:image/svg+xml;base64,'
+            + base64.b64encode(output.getvalue()).decode())
+        self.assertEqual('image/gif', avatar.content_type)
+        self.assertEqual(output.getvalue(), bytes(avatar.data))
+
+        output = io.BytesIO()
+        large = [frame.resize((2000, 10)) for frame in frames]
+        large[0].save(output, 'GIF', save_all=True, append_images=large[1:])
+        with self.assertRaises(ValueError):
+            models.Avatar.store('data:image/gif;base64,' + base64.b64encode(
+                output.getvalue()).decode())
+
+    def test_user_avatar(self):
+        request = self.factory.get('user/current')
+        force_authenticate(request, self.normal_user)
+        response = views.UserView.as_view()(request)
+        self.assertEqual(
+            serializers.get_avatar_url(models.get_default_avatar()),
+            response.data['avatar'])
+
+        serializers.UserSerializer().update(self.normal_user, {
+            'email': '', 'first_name': '', 'last_name': '',
+            'avatar': create_image((10, 10))})
+        digest = Profile.objects.get(user=self.normal_user).avatar_id
+        avatar = models.Avatar.objects.get(digest=digest)
+
+        request = self.factory.get(serializers.get_avatar_url(digest))
+        response = self.view(request, digest=digest)
+        self.assertEqual(bytes(avatar.data), response.content)
+        self.assertEqual(avatar.content_type, response['Content-Type'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+        request = self.factory.get(serializers.get_avatar_url(digest),
+                                   HTTP_IF_NONE_MATCH='"{}"'.format(digest))
+        self.assertEqual(304, self.view(request, digest=digest).status_code)
+
+    def test_default_avatar(self):
+        request = self.factory.get('avatars/')
+        response = self.view(request, digest=models.get_default_avatar())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, models.Avatar.objects.count())
+        response = self.view(request, digest='0' * 64)
+        self.assertEqual(404, response.status_code)
+
+
+class AssetTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.image = create_image((10, 10))
+
+    def test_store_images(self):
+        digest = models.Asset.get_digest(models.Asset.process(self.image)[1])
+        url = reverse('asset', kwargs={'digest': digest})
+        quiz = models.QuizQuestion.objects.create(
+            course=self.c1_test_en, question='quiz', image=self.image)
+        self.assertEqual(url, quiz.image)
+        self.q1_test.question_image = self.image
+        self.q1_test.save()
+        self.assertEqual(1, models.Asset.objects.count())
+
+        # only the reference is stored and the url is loaded
+        self.assertTrue(models.QuizQuestion.objects.filter(
+            image='asset:' + digest).exists())
+        quiz = models.QuizQuestion.objects.get(id=quiz.id)
+        self.assertEqual(url, quiz.image)
+        quiz.save()
+        self.assertEqual(url, models.QuizQuestion.objects.get(
+            id=quiz.id).image)
+        self.assertEqual(url, MultipleChoice.models.MultipleChoiceQuestion
+                         .objects.get(id=self.q1_test.id).question_image)
+
+        asset = models.Asset.objects.get(digest=digest)
+        response = views.AssetView.as_view()(self.factory.get(url),
+                                             digest=digest)
+        self.assertEqual(bytes(asset.data), response.content)
+        self.assertIn('max-age', response['Cache-Control'])
+        response = views.AssetView.as_view(thumbnail=True)(
+            self.factory.get(url), digest=digest)
+        self.assertEqual(bytes(asset.thumbnail), response.content)
+
+    def test_migration(self):
+        migration = importlib.import_module(
+            'learning_base.migrations.0029_assets')
+        content_type, data = migration._process(create_image((2000, 100)))
+        self.assertEqual('image/jpeg', content_type)
+        self.assertEqual((1024, 51), Image.open(io.BytesIO(data)).size)
+        html = 'data:image/png;base64,' + base64.b64encode(
+            b'<script>alert(1)</script>').decode()
+        self.assertIsNone(migration._process(html))
+
+    def test_reprocess(self):
+        # images stored before the uploads were processed
+        _, large = models.Asset.parse(create_image((2000, 2000)))
+        stored = []
+        for data in [large, b'<script>alert(1)</script>']:
+            asset = models.Asset.objects.create(
+                digest=models.Asset.get_digest(data),
+                content_type='image/png', data=data)
+            stored.append(models.QuizQuestion.objects.create(
+                course=self.c1_test_en, question='quiz',
+                image='asset:' + asset.digest))
+        self.assertEqual(2, models.Asset.reprocess())
+        self.assertEqual(0, models.Asset.reprocess())
+
+        asset = models.Asset.objects.get()
+        self.assertEqual((1024, 1024), Image.open(
+            io.BytesIO(bytes(asset.data))).size)
+        self.assertEqual(
+            [reverse('asset', kwargs={'digest': asset.digest}), ''],
+            [models.QuizQuestion.objects.get(id=quiz.id).image
+             for quiz in stored])
+
+    def test_other_values(self):
+        quiz = models.QuizQuestion.objects.create(
+            course=self.c1_test_en, question='quiz',
+            image='https://example.com/image.png')
+        self.assertEqual('https://example.com/image.png',
+                         models.QuizQuestion.objects.get(id=quiz.id).image)
+        self.assertEqual(0, models.Asset.objects.count())
+
+        # urls of other sites and of unknown assets are no references
+        url = reverse('asset', kwargs={'digest': 'a' * 64})
+        for image in ['https://example.com' + url, url]:
+            quiz.image = image
+            quiz.save()
+            self.assertFalse(models.QuizQuestion.objects.filter(
+                image__startswith='asset:').exists())
+            self.assertEqual(image, models.QuizQuestion.objects.get(
+                id=quiz.id).image)
 
 
 class UserRegisterViewTest(DatabaseMixin, TestCase):
@@ -1497,8 +2120,7 @@ class QuestionViewTest(DatabaseMixin, TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data, {'evaluate': False})
 
-        can = views.QuestionView().can_access_question(self.u1, self.q2_test,
-                                                       1, 1)
+        can = access.can_access_question(self.u1, self.c1_test_en, 1, 1)
         self.assertFalse(can)
 
         # Test doesn't work because of weird behavior of testing API
@@ -1513,15 +2135,520 @@ class QuestionViewTest(DatabaseMixin, TestCase):
         # self.assertTrue(can)
 
     def test_can_access_question(self):
-        can = views.QuestionView().can_access_question(self.u1, self.q1_test,
-                                                       0, 0)
+        can = access.can_access_question(self.u1, self.c1_test_en, 0, 0)
         self.assertTrue(can)
 
-        can = views.QuestionView().can_access_question(self.u1, self.q2_test,
-                                                       2, 1)
+        can = access.can_access_question(self.u1, self.c1_test_en, 2, 1)
         self.assertFalse(can)
 
 
+class PositionTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_positions(self):
+        self.assertEqual([self.q1_test.position, self.q2_test.position,
+                          self.q3_test.position], [0, 1, 2])
+        module = models.Module(name='module_0', course=self.c1_test_en,
+                               order=0)
+        module.save()
+        self.assertEqual(module.position, 0)
+        self.m1_test.refresh_from_db()
+        self.assertEqual(self.m1_test.position, 1)
+        self.assertEqual(self.m1_test.get_previous_in_order(), module)
+        self.assertEqual(module.get_next_in_order(), self.m1_test)
+        self.assertTrue(module.is_first_module())
+        self.assertFalse(module.is_last_module())
+
+        self.assertEqual(self.c1_test_en.get_question(1, 2), self.q3_test)
+        self.q2_test.delete()
+        self.q3_test.refresh_from_db()
+        self.assertEqual(self.q3_test.position, 1)
+        self.assertEqual(self.q3_test.get_previous_in_order(), self.q1_test)
+        self.assertEqual(self.c1_test_en.get_question(1, 1), self.q3_test)
+        self.assertIsInstance(self.c1_test_en.get_question(1, 1),
+                              InformationText.models.InformationYoutube)
+        with self.assertRaises(models.Question.DoesNotExist):
+            self.c1_test_en.get_question(1, 2)
+
+    def test_unchanged_order(self):
+        # the siblings are only numbered again if the order changed
+        module = models.Module.objects.get(id=self.m1_test.id)
+        question = models.Question.objects.get(id=self.q1_test.id)
+        module.name = 'renamed'
+        question.title = 'renamed'
+        with CaptureQueriesContext(connection) as queries:
+            module.save()
+            question.save()
+        # the positions of the siblings are not read
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT')])
+
+        question.order = 4
+        question.save()
+        self.q2_test.order = 0
+        self.q2_test.save()
+        self.assertEqual([self.q2_test.id, self.q3_test.id, self.q1_test.id],
+                         list(models.Question.objects.filter(
+                             module=self.m1_test).order_by(
+                             'position').values_list('id', flat=True)))
+
+
+class CourseSaveTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def get_data(self):
+        return {
+            'id': self.c1_test_en.id, 'name': 'test_1', 'category': 'test',
+            'modules': [{
+                'id': self.m1_test.id, 'name': 'module_1',
+                'learning_text': 'text', 'order': 1,
+                'questions': [{
+                    'id': self.q1_test.id, 'title': '', 'text': 'a question',
+                    'type': 'multiple_choice', 'order': 1,
+                    'answers': [
+                        {'id': self.a1_test.id, 'text': 'something',
+                         'is_correct': False},
+                        {'id': self.a2_test.id, 'text': 'something',
+                         'is_correct': True}]
+                }, {
+                    'id': self.q2_test.id, 'title': '',
+                    'text': 'an information text', 'type': 'info_text',
+                    'order': 2, 'text_field': ''
+                }, {
+                    'id': self.q3_test.id, 'title': 'youtube video',
+                    'text': 'an information text',
+                    'type': 'info_text_youtube', 'order': 3, 'url': ''
+                }]
+            }]
+        }
+
+    def test_unchanged(self):
+        self.m1_test.learning_text = 'text'
+        self.m1_test.save()
+        with CaptureQueriesContext(connection) as queries:
+            course_save.save_course(self.get_data())
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        # only the version of the course is increased
+        self.assertEqual(1, len(writes))
+        self.assertIn('version', writes[0])
+
+    def test_edit(self):
+        version = models.Course.objects.get(id=self.c1_test_en.id).version
+        data = self.get_data()
+        module = data['modules'][0]
+        module['order'] = 2
+        module['questions'] = [module['questions'][2], module['questions'][0]]
+        module['questions'][0].update(
+            order=1, url='https://www.youtube.com/watch?v=abc')
+        module['questions'][1].update(order=2, answers=[
+            {'id': self.a2_test.id, 'text': 'changed', 'is_correct': True}])
+        data['modules'].insert(0, {
+            'name': 'module_2', 'learning_text': 'new', 'order': 1,
+            'questions': [{'title': 'new', 'text': 'new question',
+                           'type': 'info_text', 'order': 1,
+                           'text_field': 'text'}]})
+        course_save.save_course(data)
+
+        modules = list(models.Module.objects.filter(
+            course=self.c1_test_en).order_by('position'))
+        self.assertEqual(['module_2', 'module_1'],
+                         [module.name for module in modules])
+        self.assertEqual([0, 1], [module.position for module in modules])
+        questions = list(models.Question.objects.filter(
+            module=self.m1_test).order_by('position'))
+        self.assertEqual([self.q3_test.id, self.q1_test.id],
+                         [question.id for question in questions])
+        self.assertEqual('abc', questions[0].url)
+        self.assertFalse(models.Question.objects.filter(
+            id=self.q2_test.id).exists())
+        self.assertEqual(['changed'], [answer.text for answer in
+                                       questions[1].answer_set()])
+        self.assertEqual(1, modules[0].question_set.count())
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        self.assertEqual(version + 1, course.version)
+        self.assertTrue(course.is_visible)
+
+    def test_atomic(self):
+        data = self.get_data()
+        data['modules'][0]['name'] = 'renamed'
+        del data['modules'][0]['questions'][1]
+        data['modules'].append({
+            'name': 'module_2', 'learning_text': 'new', 'order': 2,
+            'questions': [{'title': 'unsolvable', 'text': 'question',
+                           'type': 'multiple_choice', 'order': 1,
+                           'answers': [{'text': 'no', 'is_correct': False}]}]})
+        with self.assertRaises(ParseError):
+            course_save.save_course(data)
+        self.assertEqual('module_1', models.Module.objects.get(
+            id=self.m1_test.id).name)
+        self.assertTrue(models.Question.objects.filter(
+            id=self.q2_test.id).exists())
+        self.assertEqual(1, models.Module.objects.filter(
+            course=self.c1_test_en).count())
+
+    def test_validated(self):
+        data = self.get_data()
+        # the validated values are written, not the submitted ones
+        data['modules'][0]['questions'][0]['answers'][1].update(
+            is_correct='true', text='changed')
+        data['modules'][0]['questions'][0]['answers'][0].update(
+            is_correct='false')
+        course_save.save_course(data)
+        self.assertIs(True, MultipleChoice.models.MultipleChoiceAnswer
+                      .objects.get(id=self.a2_test.id).is_correct)
+        self.assertIs(False, MultipleChoice.models.MultipleChoiceAnswer
+                      .objects.get(id=self.a1_test.id).is_correct)
+
+        data['modules'][0]['name'] = 'x' * 1000
+        with self.assertRaises(ParseError):
+            course_save.save_course(data)
+
+    def test_too_many_quiz_questions(self):
+        data = self.get_data()
+        data['quiz'] = [{
+            'question': 'quiz {}'.format(i),
+            'answers': [{'text': str(j), 'correct': j == 0}
+                        for j in range(course_save.QUIZ_ANSWERS)]}
+            for i in range(course_save.MAX_QUIZ_QUESTIONS + 1)]
+        with self.assertRaises(ParseError):
+            course_save.save_course(data)
+        self.assertFalse(models.QuizQuestion.objects.exists())
+
+
+class ContentEditTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def patch(self, view, object_id, data, user=None):
+        request = self.factory.patch('courses/edit', data, format='json')
+        force_authenticate(request, user or self.u1)
+        return view.as_view()(request, course_id=self.c1_test_en.id,
+                              object_id=object_id)
+
+    def test_edit(self):
+        version = models.Course.objects.get(id=self.c1_test_en.id).version
+        response = self.patch(views.ModuleEditView, self.m1_test.id,
+                              {'name': 'renamed'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('renamed', models.Module.objects.get(
+            id=self.m1_test.id).name)
+        response = self.patch(views.QuestionEditView, self.q3_test.id, {
+            'url': 'https://www.youtube.com/watch?v=abc'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('abc', models.Question.objects.get(
+            id=self.q3_test.id).url)
+        response = self.patch(views.AnswerEditView, self.a1_test.id,
+                              {'text': 'changed'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(version + 3, models.Course.objects.get(
+            id=self.c1_test_en.id).version)
+
+        # the only correct answer can't be changed to a wrong one
+        response = self.patch(views.AnswerEditView, self.a2_test.id,
+                              {'is_correct': False})
+        self.assertEqual(400, response.status_code)
+        response = self.patch(views.ModuleEditView, self.m1_test.id + 1,
+                              {'name': 'renamed'})
+        self.assertEqual(404, response.status_code)
+        response = self.patch(views.ModuleEditView, self.m1_test.id,
+                              {'name': 'renamed'}, self.moderator)
+        self.assertEqual(403, response.status_code)
+
+    def test_invalid(self):
+        response = self.patch(views.AnswerEditView, self.a1_test.id,
+                              {'img': 'data:garbage'})
+        self.assertEqual(400, response.status_code)
+        response = self.patch(views.QuestionEditView, self.q2_test.id,
+                              {'text_field': None})
+        self.assertEqual(400, response.status_code)
+        response = self.patch(views.ModuleEditView, self.m1_test.id,
+                              {'description': 'x' * 1000})
+        self.assertEqual(400, response.status_code)
+
+    def test_order(self):
+        module = models.Module.objects.create(
+            name='module_2', course=self.c1_test_en, order=2)
+        request = self.factory.post('courses/edit/order', {
+            'modules': [module.id, self.m1_test.id],
+            'questions': {str(self.m1_test.id): [
+                self.q3_test.id, self.q1_test.id, self.q2_test.id]}},
+            format='json')
+        force_authenticate(request, self.u1)
+        response = views.CourseOrderView.as_view()(
+            request, course_id=self.c1_test_en.id)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [(module.id, 1, 0), (self.m1_test.id, 2, 1)],
+            list(models.Module.objects.filter(
+                course=self.c1_test_en).order_by('order').values_list(
+                'id', 'order', 'position')))
+        self.assertEqual(
+            [self.q3_test.id, self.q1_test.id, self.q2_test.id],
+            list(models.Question.objects.filter(
+                module=self.m1_test).order_by('position').values_list(
+                'id', flat=True)))
+
+        request = self.factory.post('courses/edit/order', {
+            'modules': [module.id]}, format='json')
+        force_authenticate(request, self.u1)
+        response = views.CourseOrderView.as_view()(
+            request, course_id=self.c1_test_en.id)
+        self.assertEqual(400, response.status_code)
+
+
+class CourseProgressTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.view = views.QuestionView.as_view()
+
+    def test_progress(self):
+        progress = models.CourseProgress.get_for(self.u1, self.c1_test_en)
+        self.assertEqual(progress.solved_questions(), set())
+        self.assertIsNone(progress.id)
+
+        request = self.factory.post('', {'answers': [self.a2_test.id]},
+                                    format='json')
+        force_authenticate(request, self.u1)
+        response = self.view(request, course_id=self.c1_test_en.id,
+                             module_id=0, question_id=0)
+        self.assertTrue(response.data['evaluate'])
+
+        progress = models.CourseProgress.get_for(self.u1, self.c1_test_en)
+        self.assertEqual(progress.solved_questions(), {self.q1_test.id})
+        self.assertFalse(progress.add_question(self.q1_test))
+
+        request = self.factory.get('')
+        request.user = self.u1
+        data = serializers.QuestionSerializer(
+            self.q2_test, context={'request': request}).data
+        self.assertFalse(data['solved'])
+        self.assertEqual(
+            [[entry['solved'] for entry in module]
+             for module in data['progress']],
+            [[True, False, False]])
+
+
+class SubmissionTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def submit(self, data):
+        request = self.factory.post(
+            'courses/{}/submissions'.format(self.c1_test_en.id),
+            {'submissions': data}, format='json')
+        force_authenticate(request, self.normal_user)
+        return views.SubmissionView.as_view()(
+            request, course_id=self.c1_test_en.id)
+
+    def test_submit(self):
+        answered = timezone.now() - datetime.timedelta(days=1)
+        response = self.submit([
+            {'module': 0, 'question': 1, 'answers': []},
+            {'module': 0, 'question': 0, 'answers': [self.a1_test.id]},
+            {'module': 0, 'question': 0, 'answers': [self.a2_test.id],
+             'date': answered.isoformat()},
+            {'module': 0, 'question': 1, 'answers': [],
+             'date': '2017-01-01T10:00:00Z'},
+            {'module': 'x', 'question': 0, 'answers': []},
+            {'module': 3, 'question': 0, 'answers': []}])
+        self.assertEqual(200, response.status_code)
+        results = response.data['results']
+        self.assertIn('error', results[0])
+        self.assertEqual({'evaluate': False}, results[1])
+        self.assertTrue(results[2]['evaluate'])
+        self.assertTrue(results[3]['evaluate'])
+        self.assertEqual({'error': 'invalid position'}, results[4])
+        self.assertEqual({'error': 'Question not found'}, results[5])
+
+        tries = models.Try.objects.filter(user=self.normal_user)
+        self.assertEqual(3, tries.count())
+        self.assertEqual(answered, tries.get(
+            question=self.q1_test, solved=True).date)
+        # dates before the sync window are replaced
+        self.assertGreater(tries.get(question=self.q2_test).date, answered)
+        self.assertEqual('{}'.format(self.a2_test.id), tries.get(
+            question=self.q1_test, solved=True).answer)
+        progress = models.CourseProgress.get_for(self.normal_user,
+                                                 self.c1_test_en)
+        self.assertEqual({self.q1_test.id, self.q2_test.id},
+                         progress.solved_questions())
+        self.assertEqual(self.q1_test.get_points(), Profile.objects.get(
+            user=self.normal_user).ranking)
+
+    def test_invalid(self):
+        self.assertEqual(400, self.submit('x').status_code)
+        self.assertEqual(400, self.submit(
+            [{'module': 0, 'question': 0, 'answers': []}]
+            * (submissions.MAX_SUBMISSIONS + 1)).status_code)
+
+
+class TryAnswerTest(TestCase):
+    def test_encode(self):
+        self.assertEqual('3,12', models.Try.encode_answer([12, 3, 12]))
+        self.assertEqual('', models.Try.encode_answer([]))
+        self.assertIsNone(models.Try.encode_answer(['x']))
+        self.assertIsNone(models.Try.encode_answer(None))
+        self.assertEqual({3, 12}, models.Try(answer='3,12').answer_ids())
+        self.assertEqual(set(), models.Try(answer='').answer_ids())
+        self.assertIsNone(models.Try().answer_ids())
+
+    def test_migration(self):
+        migration = importlib.import_module(
+            'learning_base.migrations.0032_compact_answers')
+        self.assertEqual('2,5', migration._encode('[5, 2]', None))
+        self.assertIsNone(migration._encode("{'a': 1}", None))
+        self.assertIsNone(migration._encode('__import__("os")', None))
+        # the stored quiz submissions contain the answers of all questions
+        answer = str({'type': 'check_answers', 'answers': [
+            {'answers': [{'chosen': True, 'id': 1},
+                         {'chosen': False, 'id': 2}]},
+            {'id': 9, 'answers': [{'chosen': True, 'id': 3}]}]})
+        self.assertEqual('1', migration._encode(answer, {1, 2}))
+        self.assertEqual('', migration._encode(answer, {4}))
+
+
+class TryJournalTest(DatabaseMixin, TransactionTestCase):
+    # the flushes commit their own transactions
+    def setUp(self):
+        self.setup_database()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'tries')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_journal(self):
+        request = self.factory.post('', {'answers': [self.a2_test.id]},
+                                    format='json')
+        force_authenticate(request, self.normal_user)
+        with override_settings(TRY_JOURNAL=self.path):
+            response = views.QuestionView.as_view()(
+                request, course_id=self.c1_test_en.id, module_id=0,
+                question_id=0)
+            self.assertTrue(response.data['evaluate'])
+            # the progress is saved right away, the try is journaled
+            self.assertEqual({self.q1_test.id}, access.get_progress(
+                self.normal_user, self.c1_test_en).solved_questions())
+            self.assertFalse(models.Try.objects.exists())
+            with open(self.path, 'a') as journal:
+                journal.write('{"user": ')
+            self.assertEqual(1, try_journal.flush())
+            self.assertEqual(0, try_journal.flush())
+        attempt = models.Try.objects.get()
+        self.assertEqual((self.normal_user.id, self.q1_test.id, True),
+                         (attempt.user_id, attempt.question_id,
+                          attempt.solved))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_interrupted_flush(self):
+        attempt = models.Try(user=self.normal_user, question=self.q1_test,
+                             solved=True)
+        with override_settings(TRY_JOURNAL=self.path):
+            try_journal.record([attempt])
+            try_journal.record([attempt])
+            # the tries are journaled before the submission is committed
+            with open(self.path) as journal:
+                self.assertEqual(2, len(journal.readlines()))
+            # a flush interrupted after inserting the tries of the journal
+            os.rename(self.path, self.path + '.flushing')
+            count, batches = try_journal._insert(self.path + '.flushing')
+            self.assertEqual((2, 2), (count, len(batches)))
+            try_journal.record([attempt])
+            # the inserted batches are skipped by the next flush
+            self.assertEqual(0, try_journal.flush())
+            self.assertEqual(1, try_journal.flush())
+        self.assertEqual(3, models.Try.objects.count())
+        self.assertFalse(models.FlushedTryBatch.objects.exists())
+
+    def test_rollups(self):
+        date = timezone.now() - datetime.timedelta(days=3)
+        models.Try.objects.create(user=self.normal_user, question=self.q1_test,
+                                  solved=False, date=date)
+        statistics.rollup_tries()
+        self.assertEqual(1, models.DailyTryCount.objects.get().tries)
+        with override_settings(TRY_JOURNAL=self.path):
+            try_journal.record([models.Try(
+                user=self.normal_user, question=self.q1_test, solved=True,
+                date=date)])
+            # the ranking is recalculated with the journaled tries
+            ranking.recompute_rankings()
+        self.assertEqual(2, models.Try.objects.count())
+        # the rollup of the day of the flushed try is calculated again
+        self.assertEqual(2, models.DailyTryCount.objects.get().tries)
+        self.assertEqual(self.q1_test.get_points(), Profile.objects.get(
+            user=self.normal_user).ranking)
+
+
+class AccessTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def solve(self, module_id, question_id, answers):
+        request = self.factory.post('', {'answers': answers}, format='json')
+        force_authenticate(request, self.u1)
+        return views.QuestionView.as_view()(
+            request, course_id=self.c1_test_en.id, module_id=module_id,
+            question_id=question_id)
+
+    def test_frontier(self):
+        self.assertTrue(access.can_access_question(
+            self.u1, self.c1_test_en, 0, 0))
+        self.assertFalse(access.can_access_question(
+            self.u1, self.c1_test_en, 0, 1))
+        self.assertEqual(self.solve(0, 2, []).status_code, 403)
+
+        self.solve(0, 0, [self.a2_test.id])
+        progress = access.get_progress(self.u1, self.c1_test_en)
+        self.assertEqual((progress.frontier_module,
+                          progress.frontier_question), (0, 1))
+        self.assertTrue(progress.can_access(0, 1))
+        self.assertFalse(progress.can_access(0, 2))
+        self.assertFalse(access.has_completed(progress, self.c1_test_en))
+
+        self.solve(0, 1, [])
+        self.solve(0, 2, [])
+        progress = access.get_progress(self.u1, self.c1_test_en)
+        self.assertTrue(access.has_completed(progress, self.c1_test_en))
+
+        # a new question invalidates the frontier
+        question = InformationText.models.InformationText(
+            title='new', text='', order=4, module=self.m1_test)
+        question.save()
+        self.c1_test_en.bump_version()
+        progress = access.get_progress(self.u1, self.c1_test_en)
+        self.assertEqual((progress.frontier_module,
+                          progress.frontier_question), (0, 3))
+        self.assertFalse(access.has_completed(progress, self.c1_test_en))
+
+    def test_concurrent(self):
+        for question in (self.q1_test, self.q2_test):
+            reads = []
+
+            def solve(progress):
+                if not reads:
+                    # a concurrent request solves the question after this
+                    # request read the progress
+                    other = access.get_progress(self.u1, self.c1_test_en)
+                    access.add_solved_question(other, self.c1_test_en,
+                                               question)
+                    other.save()
+                reads.append(progress)
+                return access.add_solved_question(progress, self.c1_test_en,
+                                                  question)
+
+            _, newly_solved = access.change_progress(
+                self.u1, self.c1_test_en, solve)
+            # the progress is read again and the question is counted once
+            self.assertFalse(newly_solved)
+            self.assertEqual(len(reads), 2)
+        progress = access.get_progress(self.u1, self.c1_test_en)
+        self.assertEqual(progress.solved_questions(),
+                         {self.q1_test.id, self.q2_test.id})
+
+
 class PwResetViewTest(DatabaseMixin, TestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -1619,6 +2746,99 @@ class RankingCalculationTest(TestCase):
         self.assertEqual(ranking(0.4, 0, 1), 0)
 
 
+class RankingTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_award_points(self):
+        ranking.award_points(self.normal_user, 3)
+        ranking.award_points(self.normal_user, 2)
+        ranking.award_points(self.normal_user, 0)
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 5)
+
+    def test_question_post_awards_once(self):
+        view = views.QuestionView.as_view()
+        for _ in range(2):
+            request = self.factory.post(
+                '', {'answers': [self.a2_test.id]}, format='json')
+            force_authenticate(request, self.normal_user)
+            response = view(request, course_id=self.c1_test_en.id,
+                            module_id=0, question_id=0)
+            self.assertTrue(response.data['evaluate'])
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 1)
+        self.assertEqual(models.Try.objects.filter(
+            user=self.normal_user).count(), 2)
+        self.assertEqual(models.CourseScore.objects.get(
+            user=self.normal_user, course=self.c1_test_en).ranking, 1)
+        self.assertEqual(models.CategoryScore.objects.get(
+            user=self.normal_user, category=self.category).ranking, 1)
+
+    def test_recompute_rankings(self):
+        quiz = [models.QuizQuestion.objects.create(
+            course=self.c1_test_en, question='quiz {}'.format(i))
+            for i in range(5)]
+        for question in [self.q1_test, self.q1_test, self.q2_test]:
+            models.Try.objects.create(user=self.normal_user,
+                                      question=question, solved=True)
+        models.Try.objects.create(user=self.moderator, question=self.q1_test,
+                                  solved=False)
+        for quiz_question in quiz[:4]:
+            models.Try.objects.create(user=self.normal_user,
+                                      quiz_question=quiz_question,
+                                      solved=True)
+        Profile.objects.filter(user=self.moderator).update(ranking=7)
+
+        self.assertEqual(ranking.calculate_rankings(),
+                         {self.normal_user.id: 11})
+        self.assertEqual(ranking.recompute_rankings(), 2)
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 11)
+        self.assertEqual(Profile.objects.get(user=self.moderator).ranking, 0)
+        self.assertEqual(ranking.recompute_rankings(), 0)
+        self.assertEqual(
+            [(self.normal_user.id, self.c1_test_en.id, 11)],
+            list(models.CourseScore.objects.values_list(
+                'user_id', 'course_id', 'ranking')))
+        self.assertEqual(
+            [(self.normal_user.id, self.category.id, 11)],
+            list(models.CategoryScore.objects.values_list(
+                'user_id', 'category_id', 'ranking')))
+
+    def test_course_leaderboard(self):
+        ranking.award_points(self.normal_user, 4, self.c1_test_en)
+        ranking.award_points(self.moderator, 2, self.c1_test_en)
+        ranking.award_points(self.u1, 9)
+        request = self.factory.get('/ranking/course/1', {'limit': 1})
+        force_authenticate(request, self.u1)
+        response = views.CourseRankingView.as_view()(
+            request, course_id=self.c1_test_en.id)
+        self.assertEqual(['normal user'],
+                         [entry['name'] for entry in response.data['results']])
+        request = self.factory.get('/ranking/course/1', {
+            'after': response.data['next']})
+        force_authenticate(request, self.u1)
+        response = views.CourseRankingView.as_view()(
+            request, course_id=self.c1_test_en.id)
+        self.assertEqual([('moderator', 2)],
+                         [(entry['name'], entry['ranking'])
+                          for entry in response.data['results']])
+        # the entries of all leaderboards are identified by the profile
+        self.assertEqual([Profile.objects.get(user=self.moderator).id],
+                         [entry['id'] for entry in response.data['results']])
+
+        request = self.factory.get('/ranking/category/1')
+        force_authenticate(request, self.u1)
+        response = views.CategoryRankingView.as_view()(
+            request, category_id=self.category.id)
+        self.assertEqual(['normal user', 'moderator'],
+                         [entry['name'] for entry in response.data['results']])
+        response = views.CategoryRankingView.as_view()(request,
+                                                       category_id=128)
+        self.assertEqual(404, response.status_code)
+
+
 class CourseCategoryTest(TestCase, DatabaseMixin):
     def setUp(self):
         self.view = views.CategoryView.as_view()
@@ -1696,3 +2916,94 @@ class RankingViewTest(TestCase, DatabaseMixin):
         force_authenticate(request_1, self.u1)
         response = self.view(request_1)
         self.assertEqual(405, response.status_code)
+
+    def test_pagination(self):
+        for points, user in [(5, self.u1), (9, self.normal_user),
+                             (5, self.moderator)]:
+            Profile.objects.filter(user=user).update(ranking=points)
+        request = self.factory.get('/ranking', {'limit': 2})
+        force_authenticate(request, self.u1)
+        response = self.view(request)
+        self.assertEqual(['normal user', 'moderator'],
+                         [entry['name'] for entry in response.data['results']])
+        self.assertIsNotNone(response.data['next'])
+
+        request = self.factory.get('/ranking', {
+            'limit': 2, 'after': response.data['next']})
+        force_authenticate(request, self.u1)
+        response = self.view(request)
+        self.assertEqual(['admin'],
+                         [entry['name'] for entry in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        request = self.factory.get('/ranking', {'after': 'x'})
+        force_authenticate(request, self.u1)
+        self.assertEqual(400, self.view(request).status_code)
+
+    def test_own_rank(self):
+        for points, user in [(5, self.u1), (9, self.normal_user),
+                             (1, self.moderator)]:
+            Profile.objects.filter(user=user).update(ranking=points)
+        request = self.factory.get('/ranking/me', {'neighbours': 1})
+        force_authenticate(request, User.objects.get(id=self.u1.id))
+        response = views.OwnRankingView.as_view()(request)
+        self.assertEqual(2, response.data['rank'])
+        self.assertEqual(
+            [('normal user', 1), ('admin', 2), ('moderator', 3)],
+            [(entry['name'], entry['rank'])
+             for entry in response.data['results']])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite',
+                         'the query plan is read from SQLite')
+    def test_rank_index(self):
+        profile = Profile.objects.get(user=self.u1)
+        with CaptureQueriesContext(connection) as queries:
+            ranking.get_rank(profile)
+        # the profiles ahead are counted from the index, no row is read
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN '
+                           + queries.captured_queries[0]['sql'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('COVERING INDEX', plan)
+
+
+class DeletionTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.attempt = models.Try.objects.create(
+            user=self.normal_user, question=self.q1_test, answer='[1]',
+            solved=True)
+
+    def test_delete_course(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.c1_test_en.delete()
+        # no rows are loaded to delete them
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT')])
+        self.assertFalse(models.Course.objects.filter(
+            id=self.c1_test_en.id).exists())
+        self.assertFalse(models.Module.objects.exists())
+        self.assertFalse(models.Question.objects.exists())
+        self.assertFalse(MultipleChoice.models.MultipleChoiceAnswer
+                         .objects.exists())
+        self.attempt.refresh_from_db()
+        self.assertIsNone(self.attempt.question)
+        self.assertTrue(models.CourseCategory.objects.filter(
+            id=self.category.id).exists())
+
+    def test_delete_category(self):
+        self.category.delete()
+        self.assertFalse(models.CourseCategory.objects.exists())
+        self.assertFalse(models.Course.objects.exists())
+        self.assertFalse(models.Question.objects.exists())
+        self.attempt.refresh_from_db()
+        self.assertIsNone(self.attempt.question)
+
+    def test_delete_question(self):
+        self.q1_test.delete()
+        self.assertEqual(
+            [(self.q2_test.id, 0), (self.q3_test.id, 1)],
+            list(models.Question.objects.order_by('position')
+                 .values_list('id', 'position')))
+        self.assertFalse(MultipleChoice.models.MultipleChoiceAnswer
+                         .objects.exists())
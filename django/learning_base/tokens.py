@@ -0,0 +1,129 @@
+"""
+module containing the json web token authentication of the API. The tokens
+carry the id, the name and the roles of the user and are verified in process,
+so requests authenticated by a token don't query the user.
+
+Tokens are revoked per user (TokenRevocation) whenever the rights or the
+password of the user change and when the user is deactivated or deleted. The
+revocations are kept in the 'roles' cache, so other processes reject revoked
+tokens after the timeout of the cache at the latest.
+"""
+import time
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from . import roles
+from .models import TokenRevocation
+
+REVOCATIONS_KEY = 'revocations'
+
+
+def jwt_payload_handler(user):
+    """
+    Creates the claims of the token of a user (the JWT_PAYLOAD_HANDLER)
+    :param user: the user
+    :return: the payload of the token
+    """
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'roles': sorted(roles.get_roles(user)),
+        'iat': time.time(),
+        'exp': datetime.utcnow() + api_settings.JWT_EXPIRATION_DELTA,
+    }
+
+
+def issue(user):
+    """
+    :param user: the user
+    :return: a new encoded token of the user
+    """
+    return api_settings.JWT_ENCODE_HANDLER(
+        api_settings.JWT_PAYLOAD_HANDLER(user))
+
+
+def get_revocations():
+    """
+    Returns the revocations that may still affect unexpired tokens
+    :return: a dictionary mapping the user ids to the timestamp of the
+             revocation
+    """
+    cache = caches[roles.CACHE_NAME]
+    revocations = cache.get(REVOCATIONS_KEY)
+    if revocations is None:
+        # older revocations precede the issue time of all valid tokens
+        start = timezone.now() - api_settings.JWT_EXPIRATION_DELTA
+        revocations = {
+            user_id: revoked_at.timestamp()
+            for user_id, revoked_at in TokenRevocation.objects.filter(
+                revoked_at__gt=start).values_list('user_id', 'revoked_at')}
+        cache.set(REVOCATIONS_KEY, revocations)
+    return revocations
+
+
+def revoke(user):
+    """
+    Revokes all tokens issued to a user until now
+    :param user: the user or its id
+    """
+    TokenRevocation.objects.update_or_create(
+        user_id=getattr(user, 'id', user),
+        defaults={'revoked_at': timezone.now()})
+    caches[roles.CACHE_NAME].delete(REVOCATIONS_KEY)
+
+
+def is_revoked(payload):
+    """
+    :param payload: the payload of a token
+    :return: True iff the token was issued before the tokens of the user
+             were revoked
+    """
+    revoked_at = get_revocations().get(payload['user_id'])
+    return revoked_at is not None and payload['iat'] <= revoked_at
+
+
+class ClaimsAuthentication(JSONWebTokenAuthentication):
+    """
+    Authenticates requests by a json web token without loading the user. The
+    user only has the fields of the claims, other fields are loaded from the
+    database when they are accessed.
+    """
+
+    def authenticate_credentials(self, payload):
+        """
+        :return: the user described by the payload
+        :raise: AuthenticationFailed if the payload is incomplete or the token
+                was revoked
+        """
+        if not all(claim in payload
+                   for claim in ('user_id', 'username', 'roles', 'iat')):
+            raise exceptions.AuthenticationFailed('Invalid payload.')
+        if is_revoked(payload):
+            raise exceptions.AuthenticationFailed('The token was revoked.')
+        user = User.from_db(DEFAULT_DB_ALIAS, ['id', 'username', 'is_active'],
+                            [payload['user_id'], payload['username'], True])
+        user.token_roles = frozenset(payload['roles'])
+        return user
+
+
+def load_user(user):
+    """
+    :param user: the user of a request
+    :return: the user with all fields loaded from the database
+    """
+    if user.get_deferred_fields():
+        return User.objects.get(id=user.id)
+    return user
+
+
+# the authentication of the API views, tokens issued by api-auth are accepted
+# besides the json web tokens
+AUTHENTICATION_CLASSES = (ClaimsAuthentication, TokenAuthentication)
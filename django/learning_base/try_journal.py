@@ -0,0 +1,208 @@
+"""
+module writing the tries of the users. By default the tries are inserted
+right away. If TRY_JOURNAL is set to a file path in the settings, the tries
+are appended to this journal instead, so submissions don't wait for the write
+lock of the database. The grading and the progress are still saved right
+away, only the tries are written later.
+
+The tries of a submission are appended and synced to disk before its
+transaction is committed, so no committed submission loses its tries. A
+submission failing after the append keeps its tries, the answers were given
+nonetheless.
+
+The journal is flushed into the database by the flush_tries command, which
+should run regularly (e.g. as a cron job). The entries are only removed from
+the journal after they were inserted, so the journaled tries survive restarts.
+Every append is a batch with a random id. The ids of the inserted batches are
+stored in the transaction inserting their tries (FlushedTryBatch), so a flush
+interrupted between the insert and the removal of the journal skips these
+batches on the next flush instead of inserting them twice.
+
+Flushed tries keep the date of their submission. If the daily rollups of the
+statistics already cover that day, the rollups of the flushed days are
+calculated again.
+"""
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import statistics
+from .models import FlushedTryBatch, Question, QuizQuestion, Try
+
+# the number of tries inserted per statement by the flush
+BATCH_SIZE = 500
+
+
+def get_path():
+    """
+    :return: the path of the journal or None if the tries are written right
+             away
+    """
+    return getattr(settings, 'TRY_JOURNAL', None)
+
+
+@contextmanager
+def _locked(path):
+    """
+    Holds the lock of a file. The lock of the journal is taken to append to
+    the journal and to take the journal for a flush.
+    :param path: the path of the file
+    """
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _encode(attempt, batch):
+    return json.dumps({
+        'batch': batch,
+        'user': attempt.user_id,
+        'question': attempt.question_id,
+        'quiz_question': attempt.quiz_question_id,
+        'answer': attempt.answer,
+        'solved': attempt.solved,
+        'date': attempt.date.isoformat() if attempt.date else None,
+    })
+
+
+def _decode(line):
+    """
+    :return: a tuple of the batch id and the unsaved try or None if the line
+             is cut off
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        # the last line of a journal may be cut off by a crash while it was
+        # appended, it was never confirmed to the user
+        return None
+    return entry.get('batch'), Try(
+        user_id=entry['user'], question_id=entry['question'],
+        quiz_question_id=entry['quiz_question'], answer=entry['answer'],
+        solved=entry['solved'],
+        date=parse_datetime(entry['date']) if entry['date'] else None)
+
+
+def _append(path, lines):
+    with _locked(path):
+        with open(path, 'a') as journal:
+            journal.write(''.join(line + '\n' for line in lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+def record(tries):
+    """
+    Writes tries, either right away or to the journal as one batch
+    :param tries: the unsaved Try objects
+    """
+    if not tries:
+        return
+    path = get_path()
+    if path is None:
+        Try.objects.bulk_create(tries)
+        return
+    batch = uuid.uuid4().hex
+    _append(path, [_encode(attempt, batch) for attempt in tries])
+
+
+def _update_rollups(tries):
+    """
+    Aggregates the days of the tries again that are already aggregated
+    :param tries: the inserted tries
+    """
+    end = statistics.get_rollup_end()
+    dates = [attempt.date for attempt in tries if attempt.date is not None]
+    if end is None or not dates:
+        return
+    start = timezone.localtime(min(dates)).date()
+    if start < end:
+        statistics.rollup_tries(start=start, end=end)
+
+
+def _flushed(batches):
+    """
+    :param batches: the ids of batches
+    :return: the set of the ids of the batches that were inserted before
+    """
+    batches = list(batches)
+    flushed = set()
+    for start in range(0, len(batches), BATCH_SIZE):
+        flushed.update(FlushedTryBatch.objects.filter(
+            batch__in=batches[start:start + BATCH_SIZE]).values_list(
+            'batch', flat=True))
+    return flushed
+
+
+def _insert(pending):
+    """
+    Inserts the tries of the batches of a journal that were not inserted
+    before
+    :param pending: the path of the journal
+    :return: the number of inserted tries and the list of the ids of all
+             batches of the journal
+    """
+    with open(pending) as journal:
+        entries = [_decode(line) for line in journal if line.strip()]
+    entries = [entry for entry in entries if entry is not None]
+    batches = set(batch for batch, _ in entries) - {None}
+    with transaction.atomic():
+        flushed = _flushed(batches)
+        tries = [attempt for batch, attempt in entries
+                 if batch not in flushed]
+        # users and questions deleted in the meantime are not referenced
+        for field, model in (('user_id', User), ('question_id', Question),
+                             ('quiz_question_id', QuizQuestion)):
+            ids = set(getattr(attempt, field) for attempt in tries) - {None}
+            existing = set(model.objects.filter(id__in=ids).values_list(
+                'id', flat=True))
+            for attempt in tries:
+                if getattr(attempt, field) not in existing:
+                    setattr(attempt, field, None)
+        Try.objects.bulk_create(tries, batch_size=BATCH_SIZE)
+        FlushedTryBatch.objects.bulk_create(
+            [FlushedTryBatch(batch=batch) for batch in batches - flushed],
+            batch_size=BATCH_SIZE)
+        _update_rollups(tries)
+    return len(tries), list(batches)
+
+
+def flush(path=None):
+    """
+    Inserts the tries of the journal into the database and removes them from
+    the journal
+    :param path: the path of the journal, by default the TRY_JOURNAL setting
+    :return: the number of inserted tries
+    """
+    path = path or get_path()
+    if path is None:
+        return 0
+    pending = path + '.flushing'
+    # concurrent flushes would insert the same entries
+    with _locked(pending):
+        with _locked(path):
+            # the entries of an interrupted flush are inserted first, the new
+            # entries stay in the journal until the next flush
+            if not os.path.exists(pending):
+                if not os.path.exists(path):
+                    return 0
+                os.rename(path, pending)
+
+        count, batches = _insert(pending)
+        os.remove(pending)
+        # the removed batches can't be flushed again
+        for start in range(0, len(batches), BATCH_SIZE):
+            FlushedTryBatch.objects.filter(
+                batch__in=batches[start:start + BATCH_SIZE]).delete()
+    return count
@@ -3,21 +3,40 @@ This module contains all directly accessed API functions
 Views are not documented extensively in the code but at
 https://github.com/Iliricon/clonecademy
 """
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, \
+    StreamingHttpResponse
 from django.core.mail import send_mail
 from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 from rest_framework import status
-from rest_framework import authentication, permissions
+from rest_framework import permissions
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.views import APIView
 from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework.response import Response
 
+from . import access
+from . import content_cache
+from . import course_save
 from . import custom_permissions
+from . import ranking
+from . import roles
 from . import serializers
-from .models import Course, CourseCategory, Try, Profile, started_courses, QuizQuestion
+from . import statistics
+from . import submissions
+from . import tokens
+from . import try_journal
+from .models import Course, CourseCategory, Try, Profile, started_courses, \
+    QuizQuestion, CourseProgress, CourseScore, CategoryScore, DailyTryCount, \
+    Avatar, Asset, get_default_avatar, Module, Question
+from .multiple_choice.models import MultipleChoiceAnswer
+from .default_picture import default_picture
+from .ranking import calculate_quiz_points
 
 
 class CategoryView(APIView):
@@ -25,7 +44,7 @@ class CategoryView(APIView):
     Shows, creates, updates and deletes a category
     :author: Claas Voelcker, Tobias Huber
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (custom_permissions.IsAdminOrReadOnly,)
 
     def get(self, request, format=None):
@@ -92,6 +111,9 @@ class CategoryView(APIView):
             serializer = serializers.CourseCategorySerializer(data=data)
         if serializer.is_valid():
             serializer.save()
+            # the category name is part of the cached course content
+            Course.objects.filter(category=serializer.instance).update(
+                version=F('version') + 1)
             return Response(serializer.data,
                             status=status.HTTP_200_OK)
         return Response(serializer.errors,
@@ -104,7 +126,7 @@ class MultiCourseView(APIView):
     interface with three filter settings.
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, format=None):
@@ -141,8 +163,7 @@ class MultiCourseView(APIView):
             courses = courses.filter(language=r_lan)
 
             # filter invisible courses if neccessary
-            if not (request.user.profile.is_mod()
-                    or request.user.profile.is_admin()):
+            if not roles.is_mod_or_admin(request.user):
                 courses = courses.filter(is_visible=True)
 
             if r_category != '':
@@ -153,6 +174,7 @@ class MultiCourseView(APIView):
                 courses = courses.filter(responsible_mod=request.user)
             elif r_type == 'started':
                 courses = started_courses(request.user)
+            courses = courses.select_related('category')
             data = serializers.CourseSerializer(courses, many=True, context={
                 'request': request}).data
             return Response(data, status=status.HTTP_200_OK)
@@ -167,7 +189,7 @@ class CourseEditView(APIView):
     TODO: this is probably redundant code
     @author Leonhard Wiedmann
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (custom_permissions.IsModOrAdmin,)
 
     def get(self, request, course_id=None, format=None):
@@ -198,14 +220,14 @@ class CourseEditView(APIView):
         """
         data = request.data
         if data['delete']:
-            groups = request.user.groups.values_list('name', flat=True)
-
-            if 'admin' in groups:
+            if roles.is_admin(request.user):
                 course = Course.objects.filter(id=course_id)
                 if not course.exists():
                     return Response({'error': 'Course does not exist'},
                         status=status.HTTP_404_NOT_FOUND)
-                course.first().delete()
+                course = course.first()
+                course.delete()
+                content_cache.discard(course)
                 return Response({'deleted': course_id}, status=status.HTTP_200_OK)
         return Response({'error': 'Method not allowed'},
                         status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -216,7 +238,7 @@ class CourseView(APIView):
     Contains all code related to viewing and saving courses.
     :author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (
         custom_permissions.IsModOrAdminOrReadOnly,)
 
@@ -240,11 +262,11 @@ class CourseView(APIView):
             # fetch the course object, serialize it and return
             # the serialization
             course = Course.objects.filter(id=course_id).first()
-            data = serializers.CourseSerializer(course, context={
-                'request': request}).data
-            data['quiz'] = False
-            if len(course.quizquestion_set.all()) > 0:
-                data['quiz'] = True
+            content = content_cache.get_course_content(course)
+            solved = CourseProgress.get_for(
+                request.user, course).solved_questions()
+            data = content_cache.add_progress(content, solved)
+            data['quiz'] = content['quiz']
             return Response(data,
                             status=status.HTTP_200_OK)
         # in case of an exception, throw a "Course not found" error for the
@@ -289,7 +311,7 @@ class CourseView(APIView):
         else:
             responsible_mod = Course.objects.get(id=course_id).responsible_mod
             # decline access if user is neither admin nor the responsible mod
-            if (request.user.profile.is_admin()
+            if (roles.is_admin(request.user)
                     or request.user == responsible_mod):
                 data['responsible_mod'] = responsible_mod
             else:
@@ -312,11 +334,148 @@ class CourseView(APIView):
                 course_serializer.create(data)
                 return Response({'success': 'Course saved'},
                                 status=status.HTTP_201_CREATED)
-            except ParseError as error:
+            except (ParseError, ValueError) as error:
                 return Response({'error': str(error)},
                                 status=status.HTTP_400_BAD_REQUEST)
 
 
+class ContentEditView(APIView):
+    """
+    Base class of the views changing a single object of a course without
+    sending the whole course. Only admins and the responsible moderator of
+    the course may edit it.
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (custom_permissions.IsResponsibleModOrAdmin,)
+    # the name of the edited objects in the responses
+    name = None
+
+    def load(self, course, object_id):
+        """
+        :param course: the course
+        :param object_id: the id of the edited object
+        :return: the object or None if the course has no such object
+        """
+        raise NotImplementedError
+
+    def save(self, course, instance, data):
+        """
+        Writes the changes to the object
+        :raise: ParseError if the data is invalid, ValueError if an image
+                can not be read
+        """
+        raise NotImplementedError
+
+    def patch(self, request, course_id, object_id, format=None):
+        """
+        Changes the given fields of the object, the other fields are kept
+        """
+        course = Course.objects.filter(id=course_id).first()
+        if course is None:
+            return Response({'error': 'Course not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        self.check_object_permissions(request, course)
+        instance = self.load(course, object_id)
+        if instance is None:
+            return Response({'error': '{} not found'.format(self.name)},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            self.save(course, instance, request.data)
+        except (ParseError, ValueError) as error:
+            return Response({'error': str(error)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': '{} saved'.format(self.name)},
+                        status=status.HTTP_200_OK)
+
+
+class ModuleEditView(ContentEditView):
+    """
+    Changes a module of a course
+
+    {
+        "name": (optional) the name of the module,
+        "learning_text": (optional) the learning text,
+        "description": (optional) the description
+    }
+    """
+    name = 'Module'
+
+    def load(self, course, object_id):
+        return Module.objects.filter(course=course, id=object_id).first()
+
+    def save(self, course, instance, data):
+        course_save.update_module(course, instance, data)
+
+
+class QuestionEditView(ContentEditView):
+    """
+    Changes a question of a course, the fields depend on the type of the
+    question (see course_save.QUESTION_TYPES). The answers are changed by
+    the AnswerEditView.
+    """
+    name = 'Question'
+
+    def load(self, course, object_id):
+        return Question.objects.filter(module__course=course,
+                                       id=object_id).first()
+
+    def save(self, course, instance, data):
+        course_save.update_question(course, instance, data)
+
+
+class AnswerEditView(ContentEditView):
+    """
+    Changes an answer of a multiple choice question of a course
+
+    {
+        "text": (optional) the text of the answer,
+        "is_correct": (optional) whether the answer is correct,
+        "img": (optional) the image of the answer
+    }
+    """
+    name = 'Answer'
+
+    def load(self, course, object_id):
+        return MultipleChoiceAnswer.objects.filter(
+            question__module__course=course, id=object_id).first()
+
+    def save(self, course, instance, data):
+        course_save.update_answer(course, instance, data)
+
+
+class CourseOrderView(APIView):
+    """
+    Changes the order of the modules of a course and of the questions of
+    its modules
+
+    {
+        "modules": (optional) the ids of all modules in the new order,
+        "questions": (optional) {
+            module id: the ids of all questions of the module in the new order
+        }
+    }
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (custom_permissions.IsResponsibleModOrAdmin,)
+
+    def post(self, request, course_id, format=None):
+        """
+        Writes the orders of the moved modules and questions
+        """
+        course = Course.objects.filter(id=course_id).first()
+        if course is None:
+            return Response({'error': 'Course not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        self.check_object_permissions(request, course)
+        try:
+            course_save.reorder(course, request.data)
+        except ParseError as error:
+            return Response({'error': str(error)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': 'Order saved'},
+                        status=status.HTTP_200_OK)
+
+
 class ToggleCourseVisibilityView(APIView):
     """
     changes the visibility of a course
@@ -329,7 +488,7 @@ class ToggleCourseVisibilityView(APIView):
     @author Tobias Huber
     """
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (custom_permissions.IsAdmin,)
 
     def post(self, request, course_id):
@@ -364,7 +523,7 @@ class ModuleView(APIView):
     Shows a module
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id, module_id, format=None):
@@ -388,41 +547,9 @@ class QuestionView(APIView):
     answers, which are given by a separate class.
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
-    @staticmethod
-    def can_access_question(user, question, module_id, question_id):
-        """
-        Checks if the question is accessable by the user (all questions before
-        need to be answered correctly)
-        :param user: user wanting to access
-        :param question: question to be accessed
-        :param module_id: module id the question belongs to
-        :param question_id: the questions id
-        :return: True|False (see description)
-        @author Tobias Huber
-        """
-        module = question.module
-        first_question = int(module_id) <= 0 and int(question_id) <= 0
-        if first_question:
-            return True
-        elif (not first_question
-              and question.get_previous_in_order()
-              and Try.objects.filter(
-                  user=user,
-                  question=question.get_previous_in_order(),
-                  solved=True)):
-            return True
-        elif (not module.is_first_module()
-              and module.get_previous_in_order()
-              and Try.objects.filter(
-                  user=user,
-                  question=module.get_previous_in_order().question_set.all()[0],
-                  solved=True)):
-            return True
-        return False
-
     def get(self, request, course_id, module_id, question_id, format=None):
         """
         Get a question together with additional information about the module
@@ -430,20 +557,16 @@ class QuestionView(APIView):
         """
         try:
             course = Course.objects.get(id=course_id)
-            course_module = course.module_set.all()[int(module_id)]
-            question = course_module.question_set.all()[int(question_id)]
+            content = content_cache.get_course_content(course)
+            progress = access.get_progress(request.user, course)
+            data = content_cache.get_question(
+                content, int(module_id), int(question_id),
+                progress.solved_questions())
 
-            if question is None:
-                return Response({'error': 'Question not found'},
-                                status=status.HTTP_404_NOT_FOUND)
-            if not self.can_access_question(request.user, question, module_id,
-                                            question_id):
+            if not progress.can_access(module_id, question_id):
                 return Response({'error': "Previous question(s) haven't been "
                                         'answered correctly yet'},
                                 status=status.HTTP_403_FORBIDDEN)
-            data = serializers.QuestionSerializer(question,
-                                                  context={'request': request})
-            data = data.data
             return Response(data, status=status.HTTP_200_OK)
         except Exception as error:
             return Response({'error': str(error)},
@@ -456,15 +579,15 @@ class QuestionView(APIView):
         """
         try:
             course = Course.objects.get(id=course_id)
-            course_module = course.module_set.all()[int(module_id)]
-            question = course_module.question_set.all()[int(question_id)]
+            question = course.get_question(module_id, question_id)
+            course_module = question.module
         except Exception:
             return Response({'error': 'Question not found'},
                             status=status.HTTP_404_NOT_FOUND)
         # deny access if there is a/are previous question(s) and it/they
         # haven't been answered correctly
-        if not (self.can_access_question(request.user, question, module_id,
-                                         question_id)):
+        progress = access.get_progress(request.user, course)
+        if not progress.can_access(module_id, question_id):
             return Response(
                 {'error': "Previous question(s) haven't been answered"
                         + " correctly yet"},
@@ -473,13 +596,20 @@ class QuestionView(APIView):
 
         solved = question.evaluate(request.data["answers"])
 
-        # only saves the points if the question hasn't been answered yet
-        if solved and not question.try_set.filter(
-                user=request.user, solved=True).exists():
-            request.user.profile.ranking += question.get_points()
-            request.user.profile.save()
-        Try(user=request.user, question=question,
-            answer=str(request.data["answers"]), solved=solved).save()
+        with transaction.atomic():
+            # only saves the points if the question hasn't been answered yet,
+            # also by a concurrent request
+            if solved:
+                _, newly_solved = access.change_progress(
+                    request.user, course,
+                    lambda progress: access.add_solved_question(
+                        progress, course, question))
+                if newly_solved:
+                    ranking.award_points(request.user, question.get_points(),
+                                         course)
+            answer = Try.encode_answer(request.data["answers"])
+            try_journal.record([Try(user=request.user, question=question,
+                                    answer=answer, solved=solved)])
         response = {"evaluate": solved}
         if solved:
             next_type = ""
@@ -498,12 +628,38 @@ class QuestionView(APIView):
         return Response(response)
 
 
+class SubmissionView(APIView):
+    """
+    Evaluates the answers to several questions of a course at once, e.g. the
+    queued answers of an offline client
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, course_id, format=None):
+        """
+        Evaluates the submissions in order and returns the result of every
+        submission
+        """
+        course = Course.objects.filter(id=course_id).first()
+        if course is None:
+            return Response({'error': 'Course not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            results = submissions.submit(
+                request.user, course, request.data.get('submissions'))
+        except ValueError as error:
+            return Response({'error': str(error)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
 class AnswerView(APIView):
     """
     Shows all possible answers to a question.
     :author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id, module_id, question_id, format=None):
@@ -511,11 +667,15 @@ class AnswerView(APIView):
         Lists the answers for a question
         """
         course = Course.objects.get(id=course_id)
-        module = course.module_set.all()[int(module_id)]
-        question = module.question_set.all()[int(question_id)]
-        answers = question.answer_set()
-        data = [serializers.get_answer_serializer(answer) for answer in
-                answers]
+        content = content_cache.get_course_content(course)
+        try:
+            data = content_cache.get_answers(content, int(module_id),
+                                             int(question_id))
+        except IndexError:
+            data = None
+        if data is None:
+            return Response({'error': 'Question not found'},
+                            status=status.HTTP_404_NOT_FOUND)
         return Response(data, status=status.HTTP_200_OK)
 
     def post(self, request, format=None):
@@ -529,33 +689,13 @@ class AnswerView(APIView):
                         status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
-def calculate_quiz_points(old_percentage, new_percentage, difficulty):
-    """
-    calculates the quiz points from the old existing statistics and the new
-    quiz answers
-    :param old_percentage: percentage of questions already answered correctly
-    :param new_percentage: percentage of questions newly answered correctly
-    :param difficulty: the course difficulty
-    :return: the additional points
-    """
-    multiplier = 2 if difficulty == 2 else 1
-    ranking_threshold = [0.4, 0.7, 0.9]
-    old_extra_points = [x[0] for x in enumerate(ranking_threshold) if
-                        x[1] > old_percentage]
-    new_extra_points = [x[0] for x in enumerate(ranking_threshold) if
-                        x[1] > new_percentage]
-    old_extra_points = 3 if not old_extra_points else old_extra_points[0]
-    new_extra_points = 3 if not new_extra_points else new_extra_points[0]
-    return max(0, 5 * multiplier * (new_extra_points - old_extra_points))
-
-
 class QuizView(APIView):
     """
     Shows the quiz question of the current course in get
     evaluates this quiz question in post
     @author Leonhard Wiedmann
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id):
@@ -565,12 +705,9 @@ class QuizView(APIView):
         """
         course = Course.objects.filter(id=course_id).first()
 
-        # check if user did last question of the last module
-        # if valid the course is completed
-        module = course.module_set.all()[len(course.module_set.all()) - 1]
-        question = module.question_set.all(
-        )[len(module.question_set.all()) - 1]
-        if not Try.objects.filter(question=question, solved=True).exists():
+        # check if the user solved all questions of the course
+        progress = access.get_progress(request.user, course)
+        if not access.has_completed(progress, course):
             return Response({"error": "complete the course first"},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -590,7 +727,8 @@ class QuizView(APIView):
         # this switch/case differentiates between the two
         if request.data['type'] == "check_answers":
             course = Course.objects.get(id=course_id)
-            quiz = course.quizquestion_set.all()
+            # the answers of all questions are loaded with one query
+            quiz = course.quizquestion_set.prefetch_related('quizanswer_set')
             all_question_length = len(quiz)
             if all_question_length <= 0:
                 return Response({"error": "this quiz does not exist"},
@@ -602,38 +740,48 @@ class QuizView(APIView):
                     .format(len(quiz), len(request.data['answers']))
                 return Response({"error": resp, "test": request.data},
                                 status=status.HTTP_400_BAD_REQUEST)
-            response = []
-            newly_solved = 0
-            old_solved = 0
+            # the submissions are matched by id, otherwise by position
+            submitted = {answer['id']: answer
+                         for answer in request.data['answers']
+                         if 'id' in answer}
+            graded = []
+            tries = []
             for i, quiz_entry in enumerate(quiz):
-                answer_solved = request.data['answers'][i]
-                for answer in request.data['answers']:
-                    if 'id' in answer and quiz_entry.id is answer['id']:
-                        answer.pop('id')
-                        answer_solved = answer
-                        break
+                answer_solved = submitted.get(
+                    quiz_entry.id, request.data['answers'][i])
                 solved = quiz_entry.evaluate(answer_solved)
-                points = 0
-                if solved and not quiz_entry.try_set.filter(
-                        user=request.user, solved=True).exists():
-                    points = 1
-                    newly_solved += 1
-                    request.user.profile.ranking += quiz_entry.get_points()
-                elif quiz_entry.try_set.filter(user=request.user,
-                                               solved=True).exists():
-                    old_solved += 1
-                Try(user=request.user, quiz_question=quiz_entry,
-                    answer=str(request.data), solved=solved).save()
-
-                response.append({"name": quiz[i].question, "solved": solved, 'points': points})
-
-            old_extra = float(old_solved / all_question_length)
-            new_extra = float(
-                (newly_solved + old_solved) / all_question_length)
-            request.user.profile.ranking += calculate_quiz_points(
-                old_extra, new_extra, course.difficulty)
-            request.user.profile.save()
-
+                graded.append((quiz_entry, solved))
+                answer = Try.encode_answer(
+                    quiz_entry.chosen_answers(answer_solved))
+                tries.append(Try(user=request.user, quiz_question=quiz_entry,
+                                 answer=answer, solved=solved))
+
+            def solve(progress):
+                solved_before = progress.solved_quiz_questions()
+                solved_now = [quiz_entry for quiz_entry, solved in graded
+                              if solved and quiz_entry.id not in solved_before]
+                progress.add_quiz_questions(solved_now, save=False)
+                return solved_before, solved_now
+
+            with transaction.atomic():
+                _, (solved_before, solved_now) = access.change_progress(
+                    request.user, course, solve)
+                try_journal.record(tries)
+                newly_solved = len(solved_now)
+                old_solved = len([quiz_entry for quiz_entry, _ in graded
+                                  if quiz_entry.id in solved_before])
+                earned = sum(quiz_entry.get_points()
+                             for quiz_entry in solved_now)
+                old_extra = float(old_solved / all_question_length)
+                new_extra = float(
+                    (newly_solved + old_solved) / all_question_length)
+                earned += calculate_quiz_points(
+                    old_extra, new_extra, course.difficulty)
+                ranking.award_points(request.user, earned, course)
+
+            response = [{"name": quiz_entry.question, "solved": solved,
+                         'points': 1 if quiz_entry in solved_now else 0}
+                        for quiz_entry, solved in graded]
             return Response(response, status=status.HTTP_200_OK)
         if request.data['type'] == 'get_answers':
             course = Course.objects.get(id=course_id)
@@ -650,7 +798,7 @@ class UserView(APIView):
     Shows a user profile
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, user_id=False, format=None):
@@ -662,9 +810,9 @@ class UserView(APIView):
         about a specific user, will be used again,
         a custom_permission should be written.
         """
-        user = request.user
+        user = tokens.load_user(request.user)
         if user_id:
-            if user.profile.is_admin():
+            if roles.is_admin(user):
                 user = User.objects.filter(id=user_id).first()
                 if not user:
                     return Response({'error': 'User not found'},
@@ -680,11 +828,11 @@ class UserView(APIView):
         Post is used to update the profile of the requesting user
         @author Tobias Huber
         """
-        user = request.user
+        user = tokens.load_user(request.user)
         data = request.data
 
         if 'oldpassword' in data:
-            if not request.user.check_password(request.data['oldpassword']):
+            if not user.check_password(request.data['oldpassword']):
                 return Response({'error': 'given password is incorrect'},
                                 status=status.HTTP_400_BAD_REQUEST)
         else:
@@ -697,12 +845,70 @@ class UserView(APIView):
             user_serializer = user_serializer.update(
                 user,
                 validated_data=request.data)
+            if 'password' in request.data:
+                tokens.revoke(user)
             return Response({'ans': 'Updated user ' + user.username},
                             status=status.HTTP_200_OK)
         return Response(user_serializer.errors,
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+class AssetView(APIView):
+    """
+    Serves the images of questions, answers and quizzes. An image is
+    addressed by its hash and never changes, so it may be cached forever.
+    The images are loaded by image tags, which can't send the token, so no
+    authentication is needed.
+    """
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+    model = Asset
+    # whether the thumbnail of the image is returned
+    thumbnail = False
+
+    def load(self, digest):
+        """
+        :param digest: the hash of the image
+        :return: the stored image or None
+        """
+        return self.model.objects.filter(digest=digest).first()
+
+    def get(self, request, digest, format=None):
+        """
+        Returns an image
+        :param digest: the hash of the image
+        """
+        etag = '"{}{}"'.format(digest, '-thumbnail' if self.thumbnail else '')
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return HttpResponseNotModified()
+        image = self.load(digest)
+        if image is None:
+            return Response({'error': 'Image not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        if self.thumbnail:
+            content_type, data = image.get_thumbnail()
+        else:
+            content_type, data = image.content_type, bytes(image.data)
+        response = HttpResponse(data, content_type=content_type)
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response['ETag'] = etag
+        return response
+
+
+class AvatarView(AssetView):
+    """
+    Serves the avatar images in the same way as the other images
+    """
+    model = Avatar
+
+    def load(self, digest):
+        avatar = super(AvatarView, self).load(digest)
+        if avatar is None and digest == get_default_avatar():
+            # the default avatar is stored when it is requested first
+            avatar = Avatar.store(default_picture)
+        return avatar
+
+
 class UserRegisterView(APIView):
     """
     Saves a new user
@@ -732,15 +938,17 @@ class MultiUserView(APIView):
     Shows an overview over all users
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (custom_permissions.IsAdmin,)
 
     def get(self, request):
         """
         Returns all users
         """
-        users = User.objects.all()
-        data = serializers.UserSerializer(users, many=True).data
+        users = User.objects.select_related('profile').prefetch_related(
+            'groups')
+        data = serializers.UserSerializer(users, many=True, context={
+            'thumbnail': True}).data
         return Response(data)
 
     def post(self, request, format=None):
@@ -757,7 +965,7 @@ class StatisticsView(APIView):
     access the try object.
     @author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, user_id=None):
@@ -777,31 +985,33 @@ class StatisticsView(APIView):
         :return:
         """
         import time
-        import csv
         data = request.data
         user = request.user
 
         tries = Try.objects.all()
+        # the daily rollups matching the tries, they can only be used if the
+        # statistics don't depend on single users or times of the day
+        rollups = DailyTryCount.objects.all()
+        solved = None
 
-        groups = user.groups.values_list('name', flat=True)
-
-        is_mod = 'moderator' in groups or 'admin' in groups
+        is_admin = roles.is_admin(user)
+        is_mod = roles.is_mod_or_admin(user)
 
         # the simplest call is if the user just wants its statistic
-        print(data)
-        print(data['id'])
         if 'id' in data and data['id'] == user.id:
             tries = tries.filter(user=user)
+            rollups = None
 
         # A moderator can get all statistics of his created courses
         # with 'get_courses' as in put the it will return all courses created
         # by this user
-        elif is_mod and 'course' in data and 'admin' not in groups:
+        elif is_mod and 'course' in data and not is_admin:
             tries = tries.filter(
                 question__module__course__responsible_mod=user)
+            rollups = rollups.filter(course__responsible_mod=user)
 
         # admins can get all statistics of all users
-        elif 'admin' in groups:
+        elif is_admin:
             if 'id' in data:
                 tries.filter(user__id=data['id'])
         else:
@@ -812,23 +1022,12 @@ class StatisticsView(APIView):
         if 'course' in data:
 
             tries = tries.filter(question__module__course__id=data['course'])
+            if rollups is not None:
+                rollups = rollups.filter(course__id=data['course'])
 
             if 'list_questions' in data:
                 course = Course.objects.filter(id=data['course']).first()
-                value = []
-                index = 0
-                for module in course.module_set.all():
-                    value.append([])
-                    for question in module.question_set.all():
-                        value[index].append({'name': question.title,
-                                             'solved': len(
-                                                 question.try_set.filter(
-                                                     solved=True).all()),
-                                             'not solved': len(
-                                                 question.try_set.filter(
-                                                     solved=False).all())})
-                    index += 1
-                return Response(value)
+                return Response(statistics.count_per_question(course))
 
         # get the statistics for a specific time
         if ('date' in data
@@ -838,47 +1037,62 @@ class StatisticsView(APIView):
             end = data['date']['end']
             tries = tries.filter(
                 date__range=[start, end])
+            start_day = statistics.parse_day(start)
+            end_day = statistics.parse_day(end)
+            if rollups is not None and start_day and end_day:
+                rollups = rollups.filter(day__gte=start_day, day__lt=end_day)
+            else:
+                rollups = None
 
         # filter just for solved tries
         if 'solved' in data:
-            tries = tries.filter(solved=data['solved'])
+            solved = Try._meta.get_field('solved').to_python(data['solved'])
+            tries = tries.filter(solved=solved)
 
         # filter for a specific category
         if 'category' in data:
             tries = tries.filter(
                 question__module__course__category__name=data['category'])
+            if rollups is not None:
+                rollups = rollups.filter(category__name=data['category'])
 
         # if this variable is set the view will return a array of dicts which
         # are {name: string, color: string, counter: number}
         if 'categories__with__counter' in data:
-            categories = CourseCategory.objects.all()
-            value = []
-            for cat in categories:
-                value.append(
-                    {
-                        'name': cat.name,
-                        'color': cat.color,
-                        'counter': len(tries.filter(
-                            question__module__course__category=cat))
-                    })
-            return Response(value)
+            return Response(
+                statistics.count_per_category(tries, rollups, solved))
 
         serialize_data = None
 
         # filters the statistics and counts for the 'filter' variable
         if 'filter' in data:
-            value = {}
-            for trie in tries:
-                if not str(getattr(trie, data['filter'])) in value:
-                    value[str(getattr(trie, data['filter']))] = 1
-                else:
-                    value[str(getattr(trie, data['filter']))] += 1
+            try:
+                value = statistics.count_by(tries, data['filter'], rollups,
+                                            solved)
+            except ValueError:
+                return Response({'error': 'invalid filter'},
+                                status=status.HTTP_400_BAD_REQUEST)
             return Response(value)
 
         # this part orders the list for the 'order' value in the request
         if 'order' in data:
             tries = tries.order_by(data['order'])
 
+        if 'format' in data and data['format'] == 'csv':
+            filename = time.strftime('%d/%m/%Y') + '-' + user.username + '.csv'
+            rows = statistics.csv_rows(tries)
+            if data.get('gzip'):
+                response = StreamingHttpResponse(
+                    statistics.gzip_chunks(rows),
+                    content_type='application/gzip')
+                filename += '.gz'
+            else:
+                response = StreamingHttpResponse(rows,
+                                                 content_type='text/csv')
+            content = 'attachment; filename="' + filename
+            response['Content-Disposition'] = content
+            return response
+
         if 'serialize' in data:
             serialize_data = serializers.TrySerializer(tries, many=True,
                                                        context={
@@ -887,43 +1101,55 @@ class StatisticsView(APIView):
         else:
             serialize_data = serializers.TrySerializer(tries, many=True).data
 
-        if 'format' in data and data['format'] == 'csv':
-            response = HttpResponse(content_type='text/csv')
-            filename = time.strftime('%d/%m/%Y') + '-' + user.username + '.csv'
-            content = 'attachment; filename="' + filename
-            response['Content-Disposition'] = content
-            writer = csv.writer(response)
-            writer.writerow(['question', 'user', 'date', 'solved'])
-            for row in serialize_data:
-                profile = Profile.objects.get(user__username=row['user'])
-                profile_hash = profile.get_hash()
-                writer.writerow(
-                    [row['question'],
-                     profile_hash,
-                     row['date'],
-                     row['solved']])
-            return response
         return Response(serialize_data)
 
 
+def leaderboard_response(request, scores=None):
+    """
+    Returns a page of a leaderboard selected by the 'limit' and 'after'
+    parameters of the request
+    :param request: the request
+    :param scores: the course or category scores, by default the global
+                   ranking is used
+    :return: a response with the entries and the cursor of the next page
+    """
+    params = request.query_params
+    try:
+        limit = int(params.get('limit', ranking.PAGE_SIZE))
+        if limit <= 0:
+            raise ValueError
+        entries, cursor = ranking.get_leaderboard(
+            min(limit, ranking.MAX_PAGE_SIZE), params.get('after'), scores)
+    except ValueError:
+        return Response({'error': 'invalid limit or cursor'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': entries, 'next': cursor})
+
+
 class RankingView(APIView):
     """
     A view for the ranking. The get method returns an ordered list of all users
     according to their rank.
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, format=None):
         """
         API request for ranking information
+        Without parameters all users are returned as a list. With a 'limit'
+        and optionally an 'after' cursor a page of the leaderboard is
+        returned together with the cursor of the next page.
         :param request: can be empty
         :param format: request: can be empty
         :return: a json response with ranking information
         """
-        profiles = Profile.objects.all().reverse()
-        data = serializers.RankingSerializer(profiles).data
-        return Response(data)
+        params = request.query_params
+        if 'limit' not in params and 'after' not in params:
+            profiles = Profile.objects.select_related('user').reverse()
+            data = serializers.RankingSerializer(profiles).data
+            return Response(data)
+        return leaderboard_response(request)
 
     def post(self, request, format=None):
         """
@@ -933,6 +1159,87 @@ class RankingView(APIView):
                         status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+class OwnRankingView(APIView):
+    """
+    Shows the position of the current user in the ranking together with the
+    users directly before and after them
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, format=None):
+        """
+        API request for the rank of the current user
+        :param request: may contain the number of 'neighbours'
+        :param format: request: can be empty
+        :return: the rank, the points and the surrounding entries
+        """
+        try:
+            count = int(request.query_params.get('neighbours', 2))
+        except ValueError:
+            return Response({'error': 'invalid number of neighbours'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        count = max(0, min(count, ranking.MAX_NEIGHBOURS))
+        profile = request.user.profile
+        rank = ranking.get_rank(profile)
+        return Response({
+            'rank': rank,
+            'ranking': profile.ranking,
+            'results': ranking.get_neighbours(profile, count, rank)
+        })
+
+    def post(self, request, format=None):
+        """
+        Not implemented
+        """
+        return Response({'error': 'Method not allowed'},
+                        status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class CourseRankingView(APIView):
+    """
+    Shows the leaderboard of a course. The get method returns a page of the
+    users ordered by the points earned in the course.
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, course_id, format=None):
+        """
+        API request for the ranking of a course
+        :param request: may contain a 'limit' and an 'after' cursor
+        :param course_id: the id of the course
+        :return: the entries and the cursor of the next page
+        """
+        if not Course.objects.filter(id=course_id).exists():
+            return Response({'error': 'Course not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return leaderboard_response(
+            request, CourseScore.objects.filter(course_id=course_id))
+
+
+class CategoryRankingView(APIView):
+    """
+    Shows the leaderboard of a category. The get method returns a page of
+    the users ordered by the points earned in all courses of the category.
+    """
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, category_id, format=None):
+        """
+        API request for the ranking of a category
+        :param request: may contain a 'limit' and an 'after' cursor
+        :param category_id: the id of the category
+        :return: the entries and the cursor of the next page
+        """
+        if not CourseCategory.objects.filter(id=category_id).exists():
+            return Response({'error': 'Category not found'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return leaderboard_response(
+            request, CategoryScore.objects.filter(category_id=category_id))
+
+
 class RequestView(APIView):
     """
     The RequestView class is used to submit a request for moderator rights.
@@ -940,7 +1247,7 @@ class RequestView(APIView):
     The request can be accessed via "clonecademy/user/request/"
     @author Tobias Huber
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, format=None):
@@ -948,7 +1255,7 @@ class RequestView(APIView):
         Returns True if request is allowed and False if request isn't allowed
         or the user is already mod.
         """
-        allowed = (not request.user.profile.is_mod()
+        allowed = (not roles.is_mod(request.user)
                    and request.user.profile.modrequest_allowed())
         return Response({'allowed': allowed},
                         status=status.HTTP_200_OK)
@@ -1002,7 +1309,7 @@ class UserRightsView(APIView):
     I do not understand.
     """
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = tokens.AUTHENTICATION_CLASSES
     permission_classes = (custom_permissions.IsAdmin,)
 
     def post(self, request, user_id, format=None):
@@ -1036,6 +1343,8 @@ class UserRightsView(APIView):
             user.groups.add(group)
         elif action == 'demote':
             user.groups.remove(group)
+        # the tokens of the user carry the old roles
+        tokens.revoke(user)
         return Response(serializers.UserSerializer(user).data)
 
     def get(self, request, user_id, format=None):
@@ -1045,10 +1354,8 @@ class UserRightsView(APIView):
         """
         user = User.objects.get(id=user_id)
         return Response({'username': user.username,
-                         'is_mod?':
-                             user.groups.filter(name='moderator').exists(),
-                         'is_admin?':
-                             user.groups.filter(name='admin').exists()})
+                         'is_mod?': roles.is_mod(user),
+                         'is_admin?': roles.is_admin(user)})
 
 
 class PwResetView(APIView):
@@ -1098,4 +1405,28 @@ class PwResetView(APIView):
         )
         user.set_password(new_password)
         user.save()
+        tokens.revoke(user)
         return Response(status=status.HTTP_200_OK)
+
+
+class ObtainTokenView(ObtainAuthToken):
+    """
+    Authenticates a user by the username and password and returns the token
+    of the user and a new json web token
+
+    {
+        "username": the name of the user,
+        "password": the password of the user
+    }
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        :return: the token ('token') and the json web token ('jwt')
+        """
+        serializer = self.serializer_class(data=request.data,
+                                           context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, _ = Token.objects.get_or_create(user=user)
+        return Response({'token': token.key, 'jwt': tokens.issue(user)})
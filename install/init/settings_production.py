@@ -85,3 +85,14 @@ LOGGING = {
 }
 
 
+
+# The four uWSGI workers share the cached course content through the file
+# system instead of each building it from the database.
+CACHES['course_content'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': '/home/docker/volatile/course_content',
+    'TIMEOUT': 60 * 60,
+    'OPTIONS': {
+        'MAX_ENTRIES': 1000,
+    },
+}